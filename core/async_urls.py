@@ -0,0 +1,9 @@
+"""
+The URLconf of ``TODO_ASYNC_VIEWS``, for tests and benchmarks to switch to
+with ``override_settings(ROOT_URLCONF='core.async_urls')``: ``core.urls``
+reads the setting once, at import time.
+"""
+from core.urls import api_urlpatterns, build_urlpatterns
+from todos.async_views import use_async_views
+
+urlpatterns = build_urlpatterns(use_async_views(api_urlpatterns))
@@ -0,0 +1,443 @@
+"""
+Two-tier cache backends: a bounded in-process LRU in front of a shared
+cache, for small values read many times per request (user generations, tag
+versions, cached pages).
+
+``TieredRedisCache`` replaces django-redis' ``RedisCache`` in ``CACHES``
+with the same ``LOCATION`` and ``OPTIONS`` (``get_redis_connection`` keeps
+working). A value read from or written to Redis is kept in process memory
+for at most ``LOCAL_TIMEOUT`` seconds, within ``LOCAL_MAX_ENTRIES`` and
+``LOCAL_MAX_BYTES`` (least recently used first out); values larger than
+``LOCAL_MAX_ITEM_BYTES`` stay in Redis only.
+
+Every write that may change a value other processes hold, from any
+process, publishes the keys it changed on the ``INVALIDATION_CHANNEL``
+pub/sub channel, and every process drops its local copies of them when the
+message arrives; a value read from Redis while an invalidation arrives is
+not kept. ``add`` only writes a key no process holds, ``touch`` keeps the
+value, and deleting a missing key changes nothing, so none of them
+publish: keys written once per version, such as cached pages keyed by a
+user's generation, cost no message when written with ``add``. Local copies
+are only served while the process is subscribed: when the subscription
+breaks the local tier is emptied and bypassed until it is back. Between a write and the delivery of
+its message (normally well under a millisecond) other processes can still
+read the previous value, so keep ``LOCAL_TIMEOUT`` short.
+
+``TieredLocMemCache`` is the same in front of ``LocMemCache``, with
+invalidations delivered in-process; tests use it to stand for several
+processes.
+
+``tier_stats()`` returns hit and miss counters per tier, which
+``/metrics/`` exposes.
+"""
+import itertools
+import json
+import logging
+import os
+import pickle
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+import redis
+from django.conf import settings
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.core.cache.backends.locmem import LocMemCache
+from django_redis.cache import RedisCache
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LOCAL_TIMEOUT = 5
+DEFAULT_LOCAL_MAX_ENTRIES = 1000
+DEFAULT_LOCAL_MAX_BYTES = 8 * 1024 * 1024
+DEFAULT_LOCAL_MAX_ITEM_BYTES = 64 * 1024
+DEFAULT_INVALIDATION_CHANNEL = 'cache:invalidations'
+# Published instead of keys when the whole cache changed.
+ALL_KEYS = '*'
+_MISSING = object()
+
+
+class LocalTier:
+    """
+    Thread-safe LRU of pickled values with expiry times. ``set`` is ignored
+    unless ``generation`` is still current: every invalidation bumps it, so
+    a value read before an invalidation arrived is not stored after it.
+    """
+
+    def __init__(self, timeout, max_entries, max_bytes, max_item_bytes):
+        self.timeout = timeout
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_item_bytes = max_item_bytes
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.size = 0
+        self.generation = 0
+        self.hits = self.misses = self.evictions = 0
+
+    def get(self, key):
+        """Return the value stored for ``key``, or ``_MISSING``."""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] <= time.monotonic():
+                self._pop(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return _MISSING
+            self.entries.move_to_end(key)
+            self.hits += 1
+        return pickle.loads(entry[1])
+
+    def set(self, key, value, timeout, generation):
+        if timeout is not None and timeout <= 0:
+            self.delete([key])
+            return
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        timeout = self.timeout if timeout is None else min(
+            timeout, self.timeout)
+        with self.lock:
+            if generation != self.generation:
+                return
+            self._pop(key)
+            if len(data) > self.max_item_bytes:
+                return
+            self.entries[key] = (time.monotonic() + timeout, data)
+            self.size += len(data)
+            while (len(self.entries) > self.max_entries or
+                   self.size > self.max_bytes):
+                self._pop(next(iter(self.entries)))
+                self.evictions += 1
+
+    def delete(self, keys):
+        with self.lock:
+            self.generation += 1
+            for key in keys:
+                self._pop(key)
+
+    def clear(self):
+        with self.lock:
+            self.generation += 1
+            self.entries.clear()
+            self.size = 0
+
+    def _pop(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.size -= len(entry[1])
+
+    def stats(self):
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses,
+                    'evictions': self.evictions,
+                    'entries': len(self.entries), 'bytes': self.size}
+
+
+class Tier:
+    """
+    What the instances of a tiered cache share within a process (Django
+    creates one cache instance per thread): the local tier, whether
+    invalidations are being received, and the remote tier's counters.
+    """
+
+    def __init__(self, options):
+        self.local = LocalTier(
+            options.get('LOCAL_TIMEOUT', DEFAULT_LOCAL_TIMEOUT),
+            options.get('LOCAL_MAX_ENTRIES', DEFAULT_LOCAL_MAX_ENTRIES),
+            options.get('LOCAL_MAX_BYTES', DEFAULT_LOCAL_MAX_BYTES),
+            options.get('LOCAL_MAX_ITEM_BYTES', DEFAULT_LOCAL_MAX_ITEM_BYTES))
+        self.origin = uuid.uuid4().hex
+        self.subscribed = False
+        self.listener_pid = None
+        self.lock = threading.Lock()
+        self.remote_hits = self.remote_misses = 0
+
+    def invalidate(self, message):
+        if message['origin'] == self.origin:
+            return
+        if ALL_KEYS in message['keys']:
+            self.local.clear()
+        else:
+            self.local.delete(message['keys'])
+
+    def message(self, keys):
+        return json.dumps({'origin': self.origin, 'keys': keys})
+
+    def count_remote(self, hits, misses):
+        with self.lock:
+            self.remote_hits += hits
+            self.remote_misses += misses
+
+    def stats(self):
+        with self.lock:
+            remote = {'hits': self.remote_hits, 'misses': self.remote_misses}
+        return {'local': self.local.stats(), 'remote': remote}
+
+
+_tiers = {}
+_tiers_lock = threading.Lock()
+
+
+def tier_key(server, options):
+    return (str(server),
+            options.get('INVALIDATION_CHANNEL', DEFAULT_INVALIDATION_CHANNEL),
+            options.get('LOCAL_TIER', 'default'))
+
+
+def get_tier(server, options):
+    """
+    The process' ``Tier`` of a cache. Caches with the same ``LOCATION``,
+    ``INVALIDATION_CHANNEL`` and ``LOCAL_TIER`` share it; tests give two
+    aliases different ``LOCAL_TIER`` names to stand for two processes.
+    """
+    key = tier_key(server, options)
+    with _tiers_lock:
+        if key not in _tiers:
+            _tiers[key] = Tier(options)
+        return _tiers[key]
+
+
+class TieredCache(BaseCache):
+    """
+    The local tier in front of a cache of ``remote_class``, built from the
+    same settings; attributes it does not define are the remote cache's.
+    Subclasses deliver invalidations to the other processes' tiers with
+    ``publish()``, and keep ``tier.subscribed`` set while their own tier
+    receives them.
+    """
+    remote_class = None
+
+    def __init__(self, server, params):
+        super().__init__(params)
+        self.remote = self.remote_class(server, params)
+        options = params.get('OPTIONS', {})
+        self.channel = options.get(
+            'INVALIDATION_CHANNEL', DEFAULT_INVALIDATION_CHANNEL)
+        self.tier = get_tier(server, options)
+        self.local = self.tier.local
+
+    def __getattr__(self, name):
+        if name == 'remote':
+            raise AttributeError(name)
+        return getattr(self.remote, name)
+
+    def subscribe(self):
+        """Make sure invalidations are received; called before each read."""
+
+    def publish(self, keys):
+        raise NotImplementedError
+
+    def local_timeout(self, timeout):
+        timeout = self.get_backend_timeout(timeout)
+        return None if timeout is None else timeout - time.time()
+
+    def get(self, key, default=None, version=None, **kwargs):
+        self.subscribe()
+        full_key = self.make_key(key, version)
+        if self.tier.subscribed:
+            value = self.local.get(full_key)
+            if value is not _MISSING:
+                return value
+        generation = self.local.generation
+        value = self.remote.get(key, _MISSING, version, **kwargs)
+        if value is _MISSING:
+            self.tier.count_remote(0, 1)
+            return default
+        self.tier.count_remote(1, 0)
+        if self.tier.subscribed:
+            self.local.set(full_key, value, None, generation)
+        return value
+
+    def get_many(self, keys, version=None, **kwargs):
+        self.subscribe()
+        found = {}
+        missing = []
+        for key in keys:
+            value = (self.local.get(self.make_key(key, version))
+                     if self.tier.subscribed else _MISSING)
+            if value is _MISSING:
+                missing.append(key)
+            else:
+                found[key] = value
+        if missing:
+            generation = self.local.generation
+            values = self.remote.get_many(missing, version=version, **kwargs)
+            self.tier.count_remote(len(values), len(missing) - len(values))
+            if self.tier.subscribed:
+                for key, value in values.items():
+                    self.local.set(self.make_key(key, version), value, None,
+                                   generation)
+            found.update(values)
+        return found
+
+    def has_key(self, key, version=None, **kwargs):
+        self.subscribe()
+        if self.tier.subscribed and self.local.get(
+                self.make_key(key, version)) is not _MISSING:
+            return True
+        return self.remote.has_key(key, version=version, **kwargs)
+
+    def stored(self, keys, values=None, timeout=DEFAULT_TIMEOUT,
+               version=None, publish=True):
+        """
+        Keep the new ``values`` of ``keys`` and, with ``publish``, tell the
+        other processes to drop theirs.
+        """
+        full_keys = [self.make_key(key, version) for key in keys]
+        self.local.delete(full_keys)
+        if values is not None and self.tier.subscribed:
+            generation = self.local.generation
+            for full_key, value in zip(full_keys, values):
+                self.local.set(full_key, value, self.local_timeout(timeout),
+                               generation)
+        if publish:
+            self.publish(full_keys)
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None,
+            **kwargs):
+        result = self.remote.set(key, value, timeout, version=version,
+                                 **kwargs)
+        self.stored([key], [value], timeout, version)
+        return result
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None,
+            **kwargs):
+        added = self.remote.add(key, value, timeout, version=version,
+                                **kwargs)
+        if added:
+            # The key was missing, so no process holds it.
+            self.stored([key], [value], timeout, version, publish=False)
+        return added
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None,
+                 **kwargs):
+        result = self.remote.set_many(data, timeout, version=version,
+                                      **kwargs)
+        self.stored(list(data), list(data.values()), timeout, version)
+        return result
+
+    def incr(self, key, delta=1, version=None, **kwargs):
+        value = self.remote.incr(key, delta, version=version, **kwargs)
+        self.stored([key], version=version)
+        return value
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None, **kwargs):
+        result = self.remote.touch(key, timeout, version=version, **kwargs)
+        # Local copies expire within LOCAL_TIMEOUT whatever the new timeout.
+        self.stored([key], version=version, publish=False)
+        return result
+
+    def delete(self, key, version=None, **kwargs):
+        result = self.remote.delete(key, version=version, **kwargs)
+        self.stored([key], version=version, publish=bool(result))
+        return result
+
+    def delete_many(self, keys, version=None, **kwargs):
+        keys = list(keys)
+        result = self.remote.delete_many(keys, version=version, **kwargs)
+        # LocMemCache does not say how many keys it deleted.
+        self.stored(keys, version=version, publish=result is None or
+                    bool(result))
+        return result
+
+    def clear(self):
+        result = self.remote.clear()
+        self.local.clear()
+        self.publish([ALL_KEYS])
+        return result
+
+    def close(self, **kwargs):
+        self.remote.close(**kwargs)
+
+    def tier_stats(self):
+        return self.tier.stats()
+
+
+class TieredRedisCache(TieredCache):
+    """``RedisCache`` with a local tier, invalidated through pub/sub."""
+    remote_class = RedisCache
+    RESUBSCRIBE_SECONDS = 1
+
+    def subscribe(self):
+        tier = self.tier
+        if tier.listener_pid == os.getpid():
+            return
+        with tier.lock:
+            if tier.listener_pid == os.getpid():
+                return
+            # A forked worker has no listener thread and its parent's copies.
+            tier.subscribed = False
+            tier.local.clear()
+            tier.listener_pid = os.getpid()
+        threading.Thread(
+            target=self.listen,
+            args=(tier, self.client.get_client(write=False), self.channel),
+            name=f'cache-invalidations-{self.channel}', daemon=True).start()
+
+    @classmethod
+    def listen(cls, tier, client, channel):
+        for attempt in itertools.count():
+            pubsub = client.pubsub()
+            try:
+                pubsub.subscribe(channel)
+                for message in pubsub.listen():
+                    if message['type'] == 'subscribe':
+                        tier.subscribed = True
+                    elif message['type'] == 'message':
+                        tier.invalidate(json.loads(message['data']))
+            except (redis.RedisError, OSError) as exc:
+                if attempt == 0:
+                    logger.warning(
+                        'Local cache tier off, cannot receive '
+                        'invalidations: %s', exc)
+            finally:
+                tier.subscribed = False
+                tier.local.clear()
+                pubsub.close()
+            time.sleep(cls.RESUBSCRIBE_SECONDS)
+
+    def publish(self, keys):
+        self.client.get_client(write=True).publish(
+            self.channel, self.tier.message(keys))
+
+    def delete_pattern(self, *args, **kwargs):
+        result = self.remote.delete_pattern(*args, **kwargs)
+        self.local.clear()
+        self.publish([ALL_KEYS])
+        return result
+
+
+class TieredLocMemCache(TieredCache):
+    """
+    ``LocMemCache`` with a local tier. Tiers of the same ``LOCATION`` and
+    channel invalidate each other in-process, like processes would.
+    """
+    remote_class = LocMemCache
+    _buses = {}
+
+    def __init__(self, name, params):
+        super().__init__(name, params)
+        self.tier.subscribed = True
+        with _tiers_lock:
+            self.bus = self._buses.setdefault((name, self.channel), set())
+            self.bus.add(self.tier)
+
+    def publish(self, keys):
+        message = json.loads(self.tier.message(keys))
+        with _tiers_lock:
+            tiers = list(self.bus)
+        for tier in tiers:
+            tier.invalidate(message)
+
+
+def tier_stats():
+    """``{alias: {tier: counters}}`` of the tiered caches in use."""
+    stats = {}
+    for alias, params in settings.CACHES.items():
+        with _tiers_lock:
+            tier = _tiers.get(tier_key(
+                params.get('LOCATION', ''), params.get('OPTIONS', {})))
+        if tier is not None:
+            stats[alias] = tier.stats()
+    return stats
@@ -0,0 +1,65 @@
+"""
+Compact value encoding for django-redis caches, chosen per alias in
+``OPTIONS``::
+
+    'SERIALIZER': 'core.codecs.CompactSerializer',
+    'COMPRESSOR': 'core.codecs.ThresholdCompressor',
+    'COMPRESS_MIN_LENGTH': 1024,
+    'COMPRESS_LEVEL': 6,
+
+``CompactSerializer`` stores ``bytes`` (pre-rendered responses) as they
+are instead of pickling them, and pickles anything else with the highest
+protocol. ``ThresholdCompressor`` zlib-compresses encoded values longer
+than ``COMPRESS_MIN_LENGTH`` and marks them, so small values cost no CPU
+and nothing is guessed when reading. Values written by django-redis' own
+pickle serializer without compression still read back.
+"""
+import pickle
+import zlib
+
+from django_redis.compressors.base import BaseCompressor
+from django_redis.exceptions import CompressorError
+from django_redis.serializers.base import BaseSerializer
+
+DEFAULT_COMPRESS_MIN_LENGTH = 1024
+DEFAULT_COMPRESS_LEVEL = 6
+# Pickles start with b'\x80', so neither marker is ambiguous.
+RAW_BYTES = b'B'
+COMPRESSED = b'Z'
+
+
+class CompactSerializer(BaseSerializer):
+    def dumps(self, value):
+        if isinstance(value, bytes):
+            return RAW_BYTES + value
+        return pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+    def loads(self, value):
+        if value[:1] == RAW_BYTES:
+            return value[1:]
+        return pickle.loads(value)
+
+
+class ThresholdCompressor(BaseCompressor):
+    def __init__(self, options):
+        super().__init__(options)
+        self.min_length = options.get(
+            'COMPRESS_MIN_LENGTH', DEFAULT_COMPRESS_MIN_LENGTH)
+        self.level = options.get('COMPRESS_LEVEL', DEFAULT_COMPRESS_LEVEL)
+
+    def compress(self, value):
+        if len(value) < self.min_length:
+            return value
+        compressed = zlib.compress(value, self.level)
+        if len(compressed) + 1 >= len(value):
+            return value
+        return COMPRESSED + compressed
+
+    def decompress(self, value):
+        if value[:1] != COMPRESSED:
+            # Stored as is; django-redis passes it on to the serializer.
+            raise CompressorError('Not compressed.')
+        try:
+            return zlib.decompress(value[1:])
+        except zlib.error as exc:
+            raise CompressorError(exc)
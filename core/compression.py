@@ -0,0 +1,155 @@
+"""
+Content-coding of responses, negotiated from ``Accept-Encoding``.
+
+gzip is always offered; zstd and br are offered first when ``zstandard``
+or ``brotli`` is installed. Only API bodies (JSON, NDJSON and CSV) of
+``COMPRESSION_MIN_LENGTH`` bytes or more are compressed: small bodies gain
+less than the time spent, and HTML pages carry CSRF tokens that compressing
+next to reflected input would expose (BREACH). An encoded body is a
+different representation, so a strong ``ETag`` gets the coding appended
+(``"<etag>-gzip"``); ``strip_encoded_etags`` takes it off the client's
+``If-Match``/``If-None-Match`` before they are compared with the ETag of
+the data, so either copy still validates.
+"""
+import gzip
+import re
+
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None
+
+DEFAULT_MIN_LENGTH = 1024
+GZIP_MAGIC = b'\x1f\x8b'
+COMPRESSIBLE_TYPE = re.compile(
+    r'^(application/(json|[\w.-]+\+json|x-ndjson)|text/csv)\b')
+# Every coding an ETag may have been suffixed with, offered here or not.
+CODINGS = ('zstd', 'br', 'gzip')
+ENCODED_ETAG_SUFFIX = re.compile(r'-(?:%s)"' % '|'.join(CODINGS))
+
+
+def get_compression_min_length():
+    return getattr(settings, 'COMPRESSION_MIN_LENGTH', DEFAULT_MIN_LENGTH)
+
+
+def gzip_compress(content):
+    # Without a timestamp the same body always compresses the same.
+    return gzip.compress(content, compresslevel=6, mtime=0)
+
+
+# In order of preference when a client accepts several equally.
+ENCODERS = {}
+if zstandard is not None:
+    ENCODERS['zstd'] = lambda content: zstandard.ZstdCompressor(
+        level=3).compress(content)
+if brotli is not None:
+    ENCODERS['br'] = lambda content: brotli.compress(content, quality=4)
+ENCODERS['gzip'] = gzip_compress
+
+
+def accepted_encodings(request):
+    """Return the ``{coding: quality}`` of the request's Accept-Encoding."""
+    accepted = {}
+    for part in request.headers.get('Accept-Encoding', '').split(','):
+        coding, _, params = part.partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        quality = 1.0
+        for param in params.split(';'):
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        accepted[coding] = quality
+    return accepted
+
+
+def accepts_encoding(request, coding):
+    accepted = accepted_encodings(request)
+    return accepted.get(coding, accepted.get('*', 0)) > 0
+
+
+def negotiate_encoding(request, encodings=ENCODERS):
+    """Return the coding of ``encodings`` the client prefers, or ``None``."""
+    accepted = accepted_encodings(request)
+    best, best_quality = None, 0
+    for coding in encodings:
+        quality = accepted.get(coding, accepted.get('*', 0))
+        if quality > best_quality:
+            best, best_quality = coding, quality
+    return best
+
+
+def is_compressible(response):
+    if response.streaming or response.has_header('Content-Encoding'):
+        return False
+    return bool(COMPRESSIBLE_TYPE.match(response.get('Content-Type', '')))
+
+
+def is_strong_etag(etag):
+    return bool(etag) and not etag.startswith('W/')
+
+
+def encoded_etag(etag, coding):
+    """The strong ``etag`` of a body once it is encoded with ``coding``."""
+    return '%s-%s"' % (etag[:-1], coding)
+
+
+def strip_encoded_etags(header):
+    """``If-Match``/``If-None-Match`` with the ETags of the unencoded bodies."""
+    return ENCODED_ETAG_SUFFIX.sub('"', header)
+
+
+def set_encoding(response, coding, content):
+    """Make ``content``, encoded with ``coding``, the response's body."""
+    response.content = content
+    response['Content-Encoding'] = coding
+    if is_strong_etag(response.get('ETag')):
+        response['ETag'] = encoded_etag(response['ETag'], coding)
+    if response.has_header('Content-Length'):
+        response['Content-Length'] = str(len(content))
+    patch_vary_headers(response, ('Accept-Encoding',))
+    return response
+
+
+def compress_response(request, response):
+    """
+    Compress a response as negotiated with ``request``. The body is sent as
+    is when it is short, already encoded, or compresses no smaller.
+    """
+    if response.status_code == 304:
+        return match_encoded_etag(request, response)
+    if not is_compressible(response) or \
+            len(response.content) < get_compression_min_length():
+        return response
+    patch_vary_headers(response, ('Accept-Encoding',))
+    coding = negotiate_encoding(request)
+    if coding is None:
+        return response
+    content = ENCODERS[coding](response.content)
+    if len(content) >= len(response.content):
+        return response
+    return set_encoding(response, coding, content)
+
+
+def match_encoded_etag(request, response):
+    """Give a 304 the encoded ETag of the client's copy, if it is encoded."""
+    etag = response.get('ETag')
+    if is_strong_etag(etag):
+        if_none_match = request.headers.get('If-None-Match', '')
+        for coding in CODINGS:
+            if encoded_etag(etag, coding) in if_none_match:
+                response['ETag'] = encoded_etag(etag, coding)
+                break
+    return response
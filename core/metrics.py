@@ -0,0 +1,185 @@
+import threading
+import time
+from contextvars import ContextVar
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+_current = ContextVar('request_metrics', default=None)
+
+
+class RequestMetrics:
+    """
+    Per-request counters. Instances are installed as a
+    ``connection.execute_wrapper`` so every query is timed on its way to the
+    database cursor.
+    """
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.db_time += time.perf_counter() - start
+
+
+def activate(metrics):
+    return _current.set(metrics)
+
+
+def deactivate(token):
+    _current.reset(token)
+
+
+def record_cache_access(hit):
+    """Count a cache lookup against the current request, if it is measured."""
+    metrics = _current.get()
+    if metrics is None:
+        return
+    if hit:
+        metrics.cache_hits += 1
+    else:
+        metrics.cache_misses += 1
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace(
+        '\n', r'\n')
+
+
+def _labels(**labels):
+    return ','.join(f'{key}="{_escape(value)}"' for key, value in labels.items())
+
+
+class MetricsRegistry:
+    """
+    In-process aggregates keyed by resolved route, rendered in the Prometheus
+    text exposition format. Each worker process keeps its own registry, so
+    scrape every worker (or run a single one) to get complete numbers.
+    """
+    histograms = (
+        ('todo_http_request_duration_seconds',
+         'Total time spent handling the request.', DURATION_BUCKETS),
+        ('todo_http_request_db_queries',
+         'Number of database queries run by the request.', QUERY_BUCKETS),
+        ('todo_http_request_db_duration_seconds',
+         'Time spent in database queries by the request.', DURATION_BUCKETS),
+    )
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.requests = {}
+            self.cache_hits = {}
+            self.cache_misses = {}
+            self.values = {name: {} for name, _, _ in self.histograms}
+
+    def observe(self, route, method, status, metrics, duration):
+        observations = (duration, metrics.queries, metrics.db_time)
+        with self._lock:
+            key = (route, method, status)
+            self.requests[key] = self.requests.get(key, 0) + 1
+            self.cache_hits[route] = \
+                self.cache_hits.get(route, 0) + metrics.cache_hits
+            self.cache_misses[route] = \
+                self.cache_misses.get(route, 0) + metrics.cache_misses
+            for (name, _, buckets), value in zip(self.histograms,
+                                                 observations):
+                histogram = self.values[name].get(route)
+                if histogram is None:
+                    histogram = self.values[name][route] = Histogram(buckets)
+                histogram.observe(value)
+
+    def render(self):
+        lines = []
+        with self._lock:
+            lines += [
+                '# HELP todo_http_requests_total Requests handled.',
+                '# TYPE todo_http_requests_total counter',
+            ]
+            for (route, method, status), count in sorted(
+                    self.requests.items()):
+                labels = _labels(route=route, method=method, status=status)
+                lines.append(f'todo_http_requests_total{{{labels}}} {count}')
+
+            for name, counters, help_text in (
+                    ('todo_http_cache_hits_total', self.cache_hits,
+                     'Cache lookups that found an entry.'),
+                    ('todo_http_cache_misses_total', self.cache_misses,
+                     'Cache lookups that found nothing.')):
+                lines += [f'# HELP {name} {help_text}',
+                          f'# TYPE {name} counter']
+                for route, count in sorted(counters.items()):
+                    lines.append(f'{name}{{{_labels(route=route)}}} {count}')
+
+            for name, help_text, _ in self.histograms:
+                lines += [f'# HELP {name} {help_text}',
+                          f'# TYPE {name} histogram']
+                for route, histogram in sorted(self.values[name].items()):
+                    for bound, count in zip(histogram.buckets,
+                                            histogram.counts):
+                        labels = _labels(route=route, le=bound)
+                        lines.append(f'{name}_bucket{{{labels}}} {count}')
+                    labels = _labels(route=route, le='+Inf')
+                    lines.append(f'{name}_bucket{{{labels}}} {histogram.count}')
+                    labels = _labels(route=route)
+                    lines.append(f'{name}_sum{{{labels}}} {histogram.sum}')
+                    lines.append(f'{name}_count{{{labels}}} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+
+def render_cache_tiers(stats):
+    """Counters of ``core.cache.tier_stats()`` in the Prometheus format."""
+    lines = []
+    for counter, help_text in (
+            ('hits', 'Lookups answered by the cache tier.'),
+            ('misses', 'Lookups the cache tier could not answer.')):
+        name = f'todo_cache_tier_{counter}_total'
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} counter']
+        for alias, tiers in sorted(stats.items()):
+            for tier, counters in sorted(tiers.items()):
+                labels = _labels(cache=alias, tier=tier)
+                lines.append(f'{name}{{{labels}}} {counters[counter]}')
+    for gauge, help_text in (
+            ('entries', 'Values held by the local cache tier.'),
+            ('bytes', 'Pickled size of the values in the local cache tier.')):
+        name = f'todo_cache_local_{gauge}'
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} gauge']
+        for alias, tiers in sorted(stats.items()):
+            lines.append(
+                f'{name}{{{_labels(cache=alias)}}} {tiers["local"][gauge]}')
+    name = 'todo_cache_local_evictions_total'
+    lines += [f'# HELP {name} Values evicted from the local cache tier.',
+              f'# TYPE {name} counter']
+    for alias, tiers in sorted(stats.items()):
+        lines.append(f'{name}{{{_labels(cache=alias)}}} '
+                     f'{tiers["local"]["evictions"]}')
+    return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
@@ -54,8 +54,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',
+    'core.middleware.CompressionMiddleware',
+    'core.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -65,6 +67,13 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Per-route query/latency metrics served at /api/metrics/ (admin only).
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'False') == 'True'
+
+# Serve the hot read endpoints with async views (see todos.async_views);
+# only useful under ASGI.
+TODO_ASYNC_VIEWS = os.getenv('TODO_ASYNC_VIEWS', 'False') == 'True'
+
 ROOT_URLCONF = 'core.urls'
 
 TEMPLATES = [
@@ -145,6 +154,9 @@ LOCALE_PATHS = [
 STATIC_URL = '/static/'
 STATIC_ROOT = BASE_DIR / 'staticfiles'
 STORAGES = {
+    "default": {
+        "BACKEND": "django.core.files.storage.FileSystemStorage",
+    },
     "staticfiles": {
         "BACKEND": "whitenoise.storage.CompressedManifestStaticFilesStorage",
     },
@@ -169,10 +181,17 @@ REST_FRAMEWORK = {
         'rest_framework.filters.SearchFilter',
         'rest_framework.filters.OrderingFilter',
     ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'todos.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',  # noqa: E501
     'PAGE_SIZE': 10,
 }
 
+# Response bodies shorter than this are not compressed (core.compression).
+COMPRESSION_MIN_LENGTH = 1024
+
 
 SPECTACULAR_SETTINGS = {
     'TITLE': 'Todo API',
@@ -19,11 +19,15 @@ REST_FRAMEWORK = {
         'rest_framework.filters.SearchFilter',
         'rest_framework.filters.OrderingFilter',
     ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'todos.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',  # noqa: E501
     'PAGE_SIZE': 10,
     'DEFAULT_THROTTLE_CLASSES': [
-        'rest_framework.throttling.AnonRateThrottle',
-        'rest_framework.throttling.UserRateThrottle'
+        'todos.throttles.AnonRateThrottle',
+        'todos.throttles.UserRateThrottle'
     ],
     'DEFAULT_THROTTLE_RATES': {
         'anon': '100/day',
@@ -34,12 +38,22 @@ REST_FRAMEWORK = {
     'DEFAULT_CACHE_RESPONSE_TIMEOUT': 60 * 15  # 15 minutes
 }
 
+# Redis, with recently used values also kept in each process for up to
+# LOCAL_TIMEOUT seconds and invalidated across processes (core.cache).
+# Values are stored compactly and compressed past COMPRESS_MIN_LENGTH
+# bytes (core.codecs).
 CACHES = {
     "default": {
-        "BACKEND": "django_redis.cache.RedisCache",
+        "BACKEND": "core.cache.TieredRedisCache",
         "LOCATION": "redis://127.0.0.1:6379/1",
         "OPTIONS": {
             "CLIENT_CLASS": "django_redis.client.DefaultClient",
+            "SERIALIZER": "core.codecs.CompactSerializer",
+            "COMPRESSOR": "core.codecs.ThresholdCompressor",
+            "COMPRESS_MIN_LENGTH": 1024,
+            "LOCAL_TIMEOUT": 5,
+            "LOCAL_MAX_ENTRIES": 5000,
+            "LOCAL_MAX_BYTES": 16 * 1024 * 1024,
         }
     }
 }
@@ -47,6 +61,14 @@ CACHES = {
 # Cache time to live is 15 minutes
 CACHE_TTL = 60 * 15
 
+# Throttles share their limits across workers through the cache's Redis.
+TODO_THROTTLE_BACKEND = 'todos.throttles.RedisRateLimiter'
+
+# The todo change feed has to reach streams held by every worker process.
+TODO_EVENTS_BROKER = 'todos.events.RedisBroker'
+TODO_EVENTS_REDIS_URL = os.getenv(
+    'TODO_EVENTS_REDIS_URL', 'redis://127.0.0.1:6379/2')
+
 SPECTACULAR_SETTINGS = {
     'TITLE': 'Todo API',
     'DESCRIPTION': 'App to manage todos',
@@ -0,0 +1,43 @@
+from urllib.parse import urlsplit
+
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve
+
+
+class QueryBudgetMixin:
+    """
+    Test case mixin failing when a request runs more queries than the budget
+    declared for its route.
+
+    ``query_budgets`` maps URL names (``'todo-list'``) to the maximum number
+    of queries one request may run, authentication and session lookups
+    included::
+
+        class TodoQueryBudgetTest(QueryBudgetMixin, APITestCase):
+            query_budgets = {'todo-list': 4}
+
+            def test_list(self):
+                self.assertWithinQueryBudget(
+                    self.client.get, reverse('todo-list'))
+    """
+    query_budgets = {}
+
+    def assertWithinQueryBudget(self, method, path, *args,
+                                using=DEFAULT_DB_ALIAS, **kwargs):
+        route = resolve(urlsplit(path).path).view_name
+        if route not in self.query_budgets:
+            self.fail(f'No query budget declared for route {route!r}.')
+        budget = self.query_budgets[route]
+
+        with CaptureQueriesContext(connections[using]) as context:
+            response = method(path, *args, **kwargs)
+
+        if len(context) > budget:
+            queries = '\n'.join(
+                f'{index}. {query["sql"]}'
+                for index, query in enumerate(context.captured_queries, 1))
+            self.fail(
+                f'{route} ran {len(context)} queries, budget is {budget}:\n'
+                f'{queries}')
+        return response
@@ -0,0 +1,310 @@
+import gzip
+import os
+import pickle
+import time
+from unittest import mock
+
+import redis
+from django.contrib.auth import get_user_model
+from django.core.cache import cache, caches
+from django.http import HttpResponse
+from django.test import RequestFactory, override_settings
+from django.urls import reverse
+from django_redis import get_redis_connection
+from django_redis.exceptions import CompressorError
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from todos.models import Todo
+
+from .codecs import ThresholdCompressor
+from .compression import (accepted_encodings, is_compressible,
+                          negotiate_encoding)
+from .metrics import registry
+from .testing import QueryBudgetMixin
+
+User = get_user_model()
+
+
+@override_settings(METRICS_ENABLED=True)
+class RequestMetricsTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        registry.reset()
+        self.user = User.objects.create_user(username='metrics')
+        self.admin = User.objects.create_user(
+            username='metrics-admin', is_staff=True)
+        Todo.objects.create(title='Measured', user=self.user)
+
+    def test_requests_are_aggregated_per_route(self):
+        self.client.force_authenticate(user=self.user)
+        self.client.get(reverse('todo-list'))
+        self.client.get(reverse('todo-list'))
+        self.client.get('/api/does-not-exist/')
+
+        self.assertEqual(
+            registry.requests[('todo-list', 'GET', 200)], 2)
+        self.assertEqual(registry.cache_misses['todo-list'], 1)
+        self.assertEqual(registry.cache_hits['todo-list'], 1)
+        queries = registry.values['todo_http_request_db_queries']['todo-list']
+        self.assertEqual(queries.count, 2)
+        self.assertGreater(queries.sum, 0)
+        self.assertIn(('<unmatched>', 'GET', 404), registry.requests)
+
+    def test_metrics_endpoint_is_admin_only(self):
+        self.client.force_authenticate(user=self.user)
+        self.client.get(reverse('todo-list'))
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+        self.client.force_authenticate(user=self.admin)
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        body = response.content.decode()
+        self.assertIn('# TYPE todo_http_request_db_queries histogram', body)
+        self.assertIn(
+            'todo_http_requests_total{route="todo-list",method="GET",'
+            'status="200"} 1', body)
+        self.assertIn(
+            'todo_http_request_duration_seconds_bucket{route="todo-list",'
+            'le="+Inf"} 1', body)
+
+    @override_settings(METRICS_ENABLED=False)
+    def test_disabled_middleware_records_nothing(self):
+        self.client.force_authenticate(user=self.user)
+        self.client.get(reverse('todo-list'))
+        self.assertEqual(registry.requests, {})
+
+
+class QueryBudgetMixinTest(QueryBudgetMixin, APITestCase):
+    query_budgets = {'todo-list': 1}
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_authenticate(
+            user=User.objects.create_user(username='budget'))
+
+    def test_exceeding_budget_fails(self):
+        with self.assertRaisesMessage(AssertionError, 'budget is 1'):
+            self.assertWithinQueryBudget(
+                self.client.get, reverse('todo-list'))
+
+    def test_undeclared_route_fails(self):
+        with self.assertRaisesMessage(AssertionError, 'No query budget'):
+            self.assertWithinQueryBudget(self.client.get, reverse('tag-list'))
+
+
+def tiered_caches(name='tiered', **options):
+    # Two aliases standing for two processes sharing one remote cache. The
+    # tiers outlive the settings, so other options need another name.
+    return {
+        alias: {
+            'BACKEND': 'core.cache.TieredLocMemCache',
+            'LOCATION': 'tiered-test',
+            'OPTIONS': {'LOCAL_TIER': f'{name}-{alias}', **options},
+        } for alias in ('default', 'other')
+    }
+
+
+@override_settings(CACHES=tiered_caches())
+class TieredCacheTest(APITestCase):
+    def setUp(self):
+        self.first, self.second = caches['default'], caches['other']
+        self.first.clear()
+        for cache_ in (self.first, self.second):
+            cache_.tier.remote_hits = cache_.tier.remote_misses = 0
+            cache_.local.hits = cache_.local.misses = 0
+
+    def test_reads_go_through_both_tiers(self):
+        self.first.set('key', {'value': 1})
+        self.assertEqual(self.second.get('key'), {'value': 1})
+        self.assertEqual(self.second.get('key'), {'value': 1})
+        self.assertEqual(self.second.get_many(['key', 'absent']),
+                         {'key': {'value': 1}})
+        self.assertIsNone(self.second.get('absent'))
+
+        stats = self.second.tier_stats()
+        self.assertEqual(stats['local']['hits'], 2)
+        self.assertEqual(stats['remote'], {'hits': 1, 'misses': 2})
+        # Writers keep what they wrote.
+        self.assertEqual(self.first.get('key'), {'value': 1})
+        self.assertEqual(self.first.tier_stats()['remote']['hits'], 0)
+        # Copies are not shared with the caller.
+        self.second.get('key')['value'] = 2
+        self.assertEqual(self.second.get('key'), {'value': 1})
+
+    def test_writes_invalidate_other_processes(self):
+        self.first.set('version', 1)
+        for write, expected in [
+                (lambda: self.first.set('version', 2), 2),
+                (lambda: self.first.incr('version'), 3),
+                (lambda: self.first.set_many({'version': 4}), 4),
+                (lambda: self.first.delete('version'), None),
+                (lambda: self.first.add('version', 5), 5),
+                (lambda: self.first.clear(), None)]:
+            self.second.get('version')
+            write()
+            self.assertEqual(self.second.get('version'), expected)
+
+    def test_writes_nobody_holds_are_not_published(self):
+        with mock.patch.object(self.first, 'publish') as publish:
+            self.first.add('page', b'content')
+            self.first.touch('page', 60)
+            self.first.delete('absent')
+            publish.assert_not_called()
+            self.first.delete('page')
+            publish.assert_called_once_with([':1:page'])
+
+    def test_read_racing_an_invalidation_is_not_kept(self):
+        local = self.second.local
+        generation = local.generation
+        self.first.set('key', 'new')
+        local.set(':1:key', 'old', None, generation)
+        self.assertEqual(self.second.get('key'), 'new')
+
+    def test_unsubscribed_tier_is_bypassed(self):
+        self.first.set('key', 1)
+        self.second.get('key')
+        self.second.tier.subscribed = False
+        self.addCleanup(setattr, self.second.tier, 'subscribed', True)
+        self.second.remote.set('key', 2)
+        self.assertEqual(self.second.get('key'), 2)
+
+    @override_settings(CACHES=tiered_caches(
+        'bounded', LOCAL_MAX_ENTRIES=2, LOCAL_MAX_ITEM_BYTES=100, LOCAL_TIMEOUT=60))
+    def test_local_tier_is_bounded(self):
+        first, second = caches['default'], caches['other']
+        for key in ('a', 'b', 'c'):
+            first.set(key, key)
+            second.get(key)
+        first.set('large', 'x' * 200)
+        second.get('large')
+        stats = second.tier_stats()['local']
+        self.assertEqual(stats['entries'], 2)
+        self.assertGreaterEqual(stats['evictions'], 1)
+        self.assertEqual(list(second.local.entries), [':1:b', ':1:c'])
+        # Nothing outlives the entry's own timeout.
+        first.set('short', 1, timeout=0.05)
+        time.sleep(0.1)
+        self.assertIsNone(first.get('short'))
+
+    def test_api_and_metrics(self):
+        user = User.objects.create_user(username='tiered')
+        self.client.force_authenticate(user=user)
+        self.assertEqual(self.client.get(reverse('todo-list')).data['count'],
+                         0)
+        Todo.objects.create(title='Cached', user=user)
+        self.assertEqual(self.client.get(reverse('todo-list')).data['count'],
+                         1)
+
+        admin = User.objects.create_user(username='tiered-admin',
+                                         is_staff=True)
+        self.client.force_authenticate(user=admin)
+        body = self.client.get(reverse('metrics')).content.decode()
+        self.assertIn(
+            'todo_cache_tier_hits_total{cache="default",tier="local"}', body)
+        self.assertIn('todo_cache_local_entries{cache="default"}', body)
+
+    @override_settings(CACHES={'default': {
+        'BACKEND': 'core.cache.TieredRedisCache',
+        'LOCATION': 'redis://127.0.0.1:6379/1'}})
+    def test_redis_connection_is_reachable(self):
+        self.assertIsInstance(get_redis_connection('default'), redis.Redis)
+
+
+class CodecTest(APITestCase):
+    @override_settings(CACHES={'default': {
+        'BACKEND': 'django_redis.cache.RedisCache',
+        'LOCATION': 'redis://127.0.0.1:6379/1',
+        'OPTIONS': {
+            'SERIALIZER': 'core.codecs.CompactSerializer',
+            'COMPRESSOR': 'core.codecs.ThresholdCompressor',
+            'COMPRESS_MIN_LENGTH': 100,
+        }}})
+    def test_values_round_trip_through_the_client(self):
+        client = caches['default'].client
+        for value in (b'{"count":0}', b'[' + b'1,' * 200 + b'1]',
+                      {'count': 1, 'results': ('a',) * 100}, 'text', 42):
+            self.assertEqual(client.decode(client.encode(value)), value)
+        # Small values are not compressed, bytes are not pickled.
+        self.assertEqual(client.encode(b'{}'), b'B{}')
+        self.assertTrue(client.encode(b'x' * 200).startswith(b'Z'))
+        self.assertLess(len(client.encode(b'x' * 200)), 100)
+        # Entries written with the default codecs still read back.
+        self.assertEqual(client.decode(pickle.dumps({'a': 1})), {'a': 1})
+
+    def test_incompressible_values_are_stored_as_is(self):
+        compressor = ThresholdCompressor({'COMPRESS_MIN_LENGTH': 10})
+        value = os.urandom(64)
+        self.assertEqual(compressor.compress(value), value)
+        with self.assertRaises(CompressorError):
+            compressor.decompress(value)
+        value = b'abc' * 100
+        self.assertEqual(
+            compressor.decompress(compressor.compress(value)), value)
+
+
+@override_settings(COMPRESSION_MIN_LENGTH=200)
+class CompressionTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='compressed')
+        self.client.force_authenticate(user=self.user)
+        self.todos = [Todo.objects.create(
+            title=f'Compressed {i}', status='completed', user=self.user)
+            for i in range(5)]
+
+    def test_negotiation(self):
+        request = RequestFactory().get(
+            '/', HTTP_ACCEPT_ENCODING='deflate, GZIP;q=0.5, br;q=0')
+        self.assertEqual(accepted_encodings(request),
+                         {'deflate': 1.0, 'gzip': 0.5, 'br': 0.0})
+        encodings = {'br': None, 'gzip': None}
+        self.assertEqual(negotiate_encoding(request, encodings), 'gzip')
+        for header, expected in (('*', 'br'), ('gzip, br', 'br'),
+                                 ('gzip, *;q=0.1', 'gzip'), ('', None),
+                                 ('identity', None), ('br;q=x', None)):
+            request = RequestFactory().get('/', HTTP_ACCEPT_ENCODING=header)
+            self.assertEqual(negotiate_encoding(request, encodings), expected)
+
+    def test_responses_are_compressed(self):
+        url = reverse('todo-completed')
+        plain = self.client.get(url)
+        self.assertNotIn('Content-Encoding', plain)
+        self.assertIn('Accept-Encoding', plain['Vary'])
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(response.content), plain.content)
+
+        # Small bodies and HTML are left alone.
+        response = self.client.get(reverse('tag-list'),
+                                   HTTP_ACCEPT_ENCODING='gzip')
+        self.assertNotIn('Content-Encoding', response)
+        self.assertNotIn('Accept-Encoding', response['Vary'])
+        self.assertFalse(is_compressible(HttpResponse('x' * 2000)))
+
+    def test_strong_etags_name_the_coding(self):
+        todo = self.todos[0]
+        todo.description = 'x' * 2000
+        todo.save()
+        url = reverse('todo-detail', args=[todo.pk])
+        etag = self.client.get(url)['ETag']
+        self.assertFalse(etag.startswith('W/'))
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['ETag'], etag[:-1] + '-gzip"')
+
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip',
+                                   HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response['ETag'], etag[:-1] + '-gzip"')
+        response = self.client.patch(
+            url, {'title': 'Guarded'}, format='json',
+            HTTP_IF_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = self.client.patch(
+            url, {'title': 'Stale'}, format='json',
+            HTTP_IF_MATCH=etag[:-1] + '-gzip"')
+        self.assertEqual(response.status_code,
+                         status.HTTP_412_PRECONDITION_FAILED)
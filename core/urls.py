@@ -1,25 +1,47 @@
+from django.conf import settings
 from django.contrib import admin
 from django.urls import include, path
 from drf_spectacular.views import (SpectacularAPIView, SpectacularRedocView,
                                    SpectacularSwaggerView)
 from rest_framework.routers import DefaultRouter
 
-from todos.views import HealthCheckView, TagViewSet, TodoViewSet
+from core.views import MetricsView
+from todos.async_views import use_async_views
+from todos.views import (HealthCheckView, LivenessView, TagViewSet,
+                         TodoEventsView, TodoViewSet)
 
 router = DefaultRouter()
 router.register(r'todos', TodoViewSet, basename='todo')
 router.register(r'tags', TagViewSet, basename='tag')
 
-urlpatterns = [
-    path('admin/', admin.site.urls),
-    path('api/', include(router.urls)),
-    path('api/health/', HealthCheckView.as_view(), name='health-check'),
-    path('api/auth/', include('rest_framework.urls')),
-    path('api/auth/', include('djoser.urls.authtoken')),
-    path('api/schema/', SpectacularAPIView.as_view(), name='schema'),
-    # Optional UI:
-    path('api/schema/swagger-ui/',
-         SpectacularSwaggerView.as_view(url_name='schema'), name='swagger-ui'),
-    path('api/schema/redoc/',
-         SpectacularRedocView.as_view(url_name='schema'), name='redoc'),
+api_urlpatterns = [
+    # Ahead of the router, whose todo-detail route would match it.
+    path('todos/events/', TodoEventsView.as_view(), name='todo-events'),
+] + router.urls + [
+    path('health/', HealthCheckView.as_view(), name='health-check'),
+    path('health/live/', LivenessView.as_view(), name='health-live'),
+    path('health/ready/', HealthCheckView.as_view(), name='health-ready'),
+    path('metrics/', MetricsView.as_view(), name='metrics'),
 ]
+
+
+def build_urlpatterns(api_urlpatterns):
+    return [
+        path('admin/', admin.site.urls),
+        path('api/', include(api_urlpatterns)),
+        path('api/auth/', include('rest_framework.urls')),
+        path('api/auth/', include('djoser.urls.authtoken')),
+        path('api/schema/', SpectacularAPIView.as_view(), name='schema'),
+        # Optional UI:
+        path('api/schema/swagger-ui/',
+             SpectacularSwaggerView.as_view(url_name='schema'),
+             name='swagger-ui'),
+        path('api/schema/redoc/',
+             SpectacularRedocView.as_view(url_name='schema'), name='redoc'),
+    ]
+
+
+if getattr(settings, 'TODO_ASYNC_VIEWS', False):
+    urlpatterns = build_urlpatterns(use_async_views(api_urlpatterns))
+else:
+    urlpatterns = build_urlpatterns(api_urlpatterns)
@@ -0,0 +1,22 @@
+from django.http import HttpResponse
+from rest_framework.permissions import IsAdminUser
+from rest_framework.views import APIView
+
+from .cache import tier_stats
+from .metrics import registry, render_cache_tiers
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class MetricsView(APIView):
+    """
+    Per-route request metrics and cache tier counters in the Prometheus
+    text format.
+    """
+    permission_classes = [IsAdminUser]
+    schema = None
+
+    def get(self, request):
+        return HttpResponse(
+            registry.render() + render_cache_tiers(tier_stats()),
+            content_type=PROMETHEUS_CONTENT_TYPE)
@@ -1,7 +1,7 @@
 from django.contrib import admin
 from django.utils.html import format_html
 
-from .models import Tag, Todo
+from .models import Notification, Tag, Todo, TodoImport
 
 
 @admin.register(Tag)
@@ -54,3 +54,21 @@ class TodoAdmin(admin.ModelAdmin):
             obj.get_status_display()
         )
     status_display.short_description = 'Status'
+
+
+@admin.register(Notification)
+class NotificationAdmin(admin.ModelAdmin):
+    list_display = ('subject', 'recipient', 'status', 'attempts',
+                    'next_attempt_at', 'sent_at')
+    list_filter = ('status',)
+    search_fields = ('subject', 'recipient')
+    readonly_fields = ('created_at', 'sent_at', 'claim_token', 'claimed_at')
+
+
+@admin.register(TodoImport)
+class TodoImportAdmin(admin.ModelAdmin):
+    list_display = ('source', 'user', 'format', 'status', 'imported',
+                    'failed', 'created_at')
+    list_filter = ('status', 'format')
+    readonly_fields = ('position', 'imported', 'failed', 'errors',
+                       'duration', 'created_at', 'updated_at')
@@ -0,0 +1,318 @@
+"""
+Async variants of the hot read endpoints, routed in by ``TODO_ASYNC_VIEWS``.
+
+Django REST framework views are synchronous, so under ASGI every request to
+them runs on a worker thread. The views here handle ``GET``/``HEAD`` with
+JSON output (or the change feed's event stream) natively on the event loop:
+they reuse the DRF view of the same route for authentication classes,
+permissions, throttles, filtering, pagination and error responses, but read
+through the async ORM and cache. Anything else (writes, the browsable API,
+format suffixes) is passed to the original DRF view unchanged.
+"""
+from asgiref.sync import sync_to_async
+from django.core.exceptions import ImproperlyConfigured
+from django.http import Http404, HttpResponse
+from django.urls import URLPattern
+from django.utils.translation import gettext_lazy as _
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import exceptions, status
+from rest_framework.authentication import (SessionAuthentication,
+                                           TokenAuthentication)
+from rest_framework.negotiation import DefaultContentNegotiation
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.response import Response
+
+from .cache import PrerenderedResponse, aget_cached_list, aset_cached_list
+from .conditional import (acollection_response, check_preconditions,
+                          is_conditional, set_validators, todo_validators)
+from .events import event_stream_response, parse_last_event_id, stream_events
+from .health import readiness
+from .models import Todo
+from .renderers import EventStreamRenderer
+from .serializers import TodoReadSerializer
+from .stats import aget_todo_stats, anext_overdue_at
+
+
+class AsyncTokenAuthentication(TokenAuthentication):
+    def authenticate_credentials(self, key):
+        # ``authenticate`` parses the header and hands the key over here;
+        # the lookup is returned as a coroutine for ``aauthenticate``.
+        return self.aauthenticate_credentials(key)
+
+    async def aauthenticate(self, request):
+        lookup = self.authenticate(request)
+        return None if lookup is None else await lookup
+
+    async def aauthenticate_credentials(self, key):
+        try:
+            token = await self.get_model().objects.select_related(
+                'user').aget(key=key)
+        except self.get_model().DoesNotExist:
+            raise exceptions.AuthenticationFailed(_('Invalid token.'))
+        if not token.user.is_active:
+            raise exceptions.AuthenticationFailed(
+                _('User inactive or deleted.'))
+        return token.user, token
+
+
+class AsyncSessionAuthentication(SessionAuthentication):
+    async def aauthenticate(self, request):
+        # Only safe methods are handled asynchronously, which the CSRF check
+        # of ``SessionAuthentication`` always lets through.
+        user = await request._request.auser()
+        if not user or not user.is_active:
+            return None
+        return user, None
+
+
+ASYNC_AUTHENTICATION = {
+    TokenAuthentication: AsyncTokenAuthentication,
+    SessionAuthentication: AsyncSessionAuthentication,
+}
+
+
+class AsyncAPIView(View):
+    """
+    Serve ``GET``/``HEAD`` JSON requests of ``sync_view``'s route on the
+    event loop through ``get()``, which returns a DRF ``Response``.
+    """
+    sync_view = None
+    # Renderers handled here; other media types go to ``sync_view``.
+    async_renderers = (JSONRenderer,)
+    negotiator = DefaultContentNegotiation()
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        # Unsafe requests go to the DRF view, which enforces CSRF itself.
+        return csrf_exempt(super().as_view(**initkwargs))
+
+    async def dispatch(self, request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD') or 'format' in kwargs:
+            return await self.fallback(request, *args, **kwargs)
+
+        self.view = self.get_view(request, *args, **kwargs)
+        drf_request = Request(
+            request, authenticators=self.get_authenticators(),
+            negotiator=self.negotiator,
+            parser_context={'view': self.view, 'args': args,
+                            'kwargs': kwargs})
+        try:
+            renderer, media_type = self.negotiator.select_renderer(
+                drf_request, self.view.get_renderers())
+        except exceptions.NotAcceptable:
+            return await self.fallback(request, *args, **kwargs)
+        if not isinstance(renderer, self.async_renderers):
+            return await self.fallback(request, *args, **kwargs)
+        drf_request.accepted_renderer = renderer
+        drf_request.accepted_media_type = media_type
+        self.view.request = drf_request
+
+        try:
+            await self.authenticate(drf_request)
+            self.view.check_permissions(drf_request)
+            await self.check_throttles(drf_request)
+            response = await self.get(drf_request, *args, **kwargs)
+        except Exception as exc:
+            response = self.view.handle_exception(exc)
+        return self.render(drf_request, response)
+
+    async def fallback(self, request, *args, **kwargs):
+        return await sync_to_async(self.sync_view)(request, *args, **kwargs)
+
+    def get_view(self, request, *args, **kwargs):
+        """Set up the DRF view like its own ``as_view()`` function does."""
+        view = self.sync_view.cls(**self.sync_view.initkwargs)
+        actions = getattr(self.sync_view, 'actions', None)
+        if actions is not None:
+            view.action_map = actions
+            for method, action in actions.items():
+                setattr(view, method, getattr(view, action))
+            view.action = actions.get(request.method.lower())
+        view.args = args
+        view.kwargs = kwargs
+        view.format_kwarg = None
+        view.headers = view.default_response_headers
+        return view
+
+    def get_authenticators(self):
+        authenticators = []
+        for authentication_class in self.view.authentication_classes:
+            if authentication_class not in ASYNC_AUTHENTICATION:
+                raise ImproperlyConfigured(
+                    f'{authentication_class.__name__} has no async variant.')
+            authenticators.append(
+                ASYNC_AUTHENTICATION[authentication_class]())
+        return authenticators
+
+    async def authenticate(self, request):
+        # What ``Request._authenticate`` does, awaiting each authenticator.
+        for authenticator in request.authenticators:
+            try:
+                user_auth_tuple = await authenticator.aauthenticate(request)
+            except exceptions.APIException:
+                request._not_authenticated()
+                raise
+            if user_auth_tuple is not None:
+                request._authenticator = authenticator
+                request.user, request.auth = user_auth_tuple
+                return
+        request._not_authenticated()
+
+    async def check_throttles(self, request):
+        throttles = self.view.get_throttles()
+        if not throttles:
+            return
+        durations = []
+        for throttle in throttles:
+            allowed = await sync_to_async(throttle.allow_request)(
+                request, self.view)
+            if not allowed:
+                durations.append(throttle.wait())
+        if durations:
+            self.view.throttled(request, max(
+                (duration for duration in durations if duration is not None),
+                default=None))
+
+    def render(self, request, response):
+        """
+        Render like DRF, into a plain ``HttpResponse`` so the handler does
+        not hop to a thread to call ``render()``.
+        """
+        response = self.view.finalize_response(request, response)
+        if not isinstance(response, Response):
+            return response
+        response.render()
+        return HttpResponse(
+            response.content, status=response.status_code,
+            headers=dict(response.items()))
+
+
+class AsyncTodoReadView(AsyncAPIView):
+    async def read_response(self, queryset):
+        """``TodoViewSet.read_response`` with the async ORM."""
+        rows = self.view.read_rows(queryset)
+        paginator = self.view.paginator
+        page = None
+        if paginator is not None:
+            page = await paginator.apaginate_queryset(
+                rows, self.view.request, view=self.view)
+        data = await TodoReadSerializer(
+            user=self.view.request.user).ato_representation(
+            rows if page is None else page)
+        if page is not None:
+            return paginator.get_paginated_response(data)
+        return Response(data)
+
+
+class AsyncTodoListView(AsyncTodoReadView):
+    async def get(self, request):
+        return await acollection_response(request, self.list_response)
+
+    async def list_response(self, version):
+        cache_key, content = await aget_cached_list(
+            self.view.request, version)
+        if content is not None:
+            return PrerenderedResponse(content)
+        response = await self.read_response(
+            self.view.filter_queryset(self.view.get_queryset()))
+        return PrerenderedResponse(
+            await aset_cached_list(cache_key, response.data), response.data)
+
+
+class AsyncTodoCompletedView(AsyncTodoReadView):
+    async def get(self, request):
+        return await acollection_response(request, lambda version: (
+            self.read_response(self.view.completed_queryset())))
+
+
+class AsyncTodoOverdueView(AsyncTodoReadView):
+    async def get(self, request):
+        return await acollection_response(request, lambda version: (
+            self.read_response(self.view.overdue_queryset())),
+            lambda: anext_overdue_at(request.user.pk))
+
+
+class AsyncTodoDetailView(AsyncAPIView):
+    async def get(self, request, pk):
+        if is_conditional(request):
+            response = await self.not_modified(request, pk)
+            if response is not None:
+                return response
+        queryset = self.view.filter_queryset(self.view.get_queryset())
+        try:
+            todo = await queryset.aget(pk=pk)
+        except (Todo.DoesNotExist, TypeError, ValueError):
+            raise Http404(
+                f'No {Todo._meta.object_name} matches the given query.')
+        self.view.check_object_permissions(request, todo)
+        return set_validators(
+            Response(self.view.get_serializer(todo).data),
+            *todo_validators(request, todo.pk, todo.updated_at))
+
+    async def not_modified(self, request, pk):
+        """``TodoViewSet.not_modified`` with the async ORM."""
+        queryset = self.view.filter_queryset(
+            Todo.objects.filter(user=request.user))
+        try:
+            row = await queryset.filter(pk=pk).values_list(
+                'pk', 'updated_at').afirst()
+        except (TypeError, ValueError):
+            return None
+        if row is None:
+            return None
+        return check_preconditions(
+            request, *todo_validators(request, *row))
+
+
+class AsyncTodoStatsView(AsyncAPIView):
+    async def get(self, request):
+        return Response(await aget_todo_stats(request.user.pk))
+
+
+class AsyncHealthCheckView(AsyncAPIView):
+    async def get(self, request):
+        result = await readiness.aget()
+        return Response(
+            result,
+            status=status.HTTP_200_OK if result['status'] == 'up'
+            else status.HTTP_503_SERVICE_UNAVAILABLE)
+
+
+class AsyncTodoEventsView(AsyncAPIView):
+    """Keep the change feed open and push live events."""
+    async_renderers = (EventStreamRenderer,)
+
+    async def get(self, request):
+        return event_stream_response(stream_events(
+            request.user.pk, parse_last_event_id(request)))
+
+
+ASYNC_VIEWS = {
+    'todo-list': AsyncTodoListView,
+    'todo-detail': AsyncTodoDetailView,
+    'todo-completed': AsyncTodoCompletedView,
+    'todo-overdue': AsyncTodoOverdueView,
+    'todo-stats': AsyncTodoStatsView,
+    'todo-events': AsyncTodoEventsView,
+    'health-check': AsyncHealthCheckView,
+    'health-ready': AsyncHealthCheckView,
+}
+
+
+def use_async_views(urlpatterns):
+    """
+    Replace the views of the routes named in ``ASYNC_VIEWS`` with their
+    async variants, which fall back to the replaced view.
+    """
+    patterns = []
+    for pattern in urlpatterns:
+        view_class = ASYNC_VIEWS.get(getattr(pattern, 'name', None))
+        if view_class is not None:
+            pattern = URLPattern(
+                pattern.pattern,
+                view_class.as_view(sync_view=pattern.callback),
+                pattern.default_args, pattern.name)
+        patterns.append(pattern)
+    return patterns
@@ -0,0 +1,61 @@
+import math
+import time
+
+
+def percentile(samples, fraction):
+    """Nearest-rank percentile of an unsorted list of samples."""
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    rank = max(1, math.ceil(fraction * len(ordered)))
+    return ordered[rank - 1]
+
+
+def summarize(samples):
+    """Latency summary in milliseconds for a list of durations in seconds."""
+    total = sum(samples)
+    return {
+        'runs': len(samples),
+        'mean_ms': round(total / len(samples) * 1000, 3) if samples else None,
+        'p50_ms': round(percentile(samples, 0.50) * 1000, 3),
+        'p95_ms': round(percentile(samples, 0.95) * 1000, 3),
+        'p99_ms': round(percentile(samples, 0.99) * 1000, 3),
+        'throughput_per_s': round(len(samples) / total, 1) if total else None,
+    }
+
+
+def measure(func, runs, warmup=0):
+    """Call ``func`` ``runs`` times and return the individual durations."""
+    for _ in range(warmup):
+        func()
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def compare(results, baseline, metric='p95_ms', threshold=0.2):
+    """
+    Compare two ``{scenario: summary}`` mappings on ``metric``.
+
+    Returns one row per scenario present in both, flagged as a regression
+    when the current value exceeds the baseline by more than ``threshold``
+    (a fraction, 0.2 = 20% slower).
+    """
+    rows = []
+    for name, summary in results.items():
+        before = baseline.get(name, {}).get(metric)
+        after = summary.get(metric)
+        if not before or after is None:
+            continue
+        ratio = after / before
+        rows.append({
+            'scenario': name,
+            'baseline': before,
+            'current': after,
+            'ratio': round(ratio, 3),
+            'regression': ratio > 1 + threshold,
+        })
+    return rows
@@ -0,0 +1,250 @@
+import gzip
+import hashlib
+import json
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.cache import patch_vary_headers
+from django.utils.functional import cached_property
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+from core.compression import (GZIP_MAGIC, accepts_encoding,
+                              get_compression_min_length, gzip_compress)
+from core.metrics import record_cache_access
+
+from .renderers import FastJSONRenderer
+
+VERSION_KEY = 'todos:user:{user_id}:version'
+CHANGED_KEY = 'todos:user:{user_id}:changed'
+TAGS_VERSION_KEY = 'todos:tags:version'
+LIST_KEY = 'todos:user:{user_id}:v{version}:list:{digest}'
+
+
+def get_cache_ttl():
+    return getattr(settings, 'CACHE_TTL', 60 * 15)
+
+
+def initial_version():
+    """
+    First generation of a user's counter, taken from the clock in
+    microseconds: a counter recreated after an eviction starts above every
+    generation it could have reached before, so cached entries and ETags of
+    old generations are never matched again.
+    """
+    return time.time_ns() // 1000
+
+
+def get_user_version(user_id):
+    """Return the current cache generation for a user's todo data."""
+    version = cache.get(VERSION_KEY.format(user_id=user_id))
+    if version is None:
+        version = initial_version()
+        cache.add(VERSION_KEY.format(user_id=user_id), version, timeout=None)
+    return version
+
+
+async def aget_user_version(user_id):
+    version = await cache.aget(VERSION_KEY.format(user_id=user_id))
+    if version is None:
+        version = initial_version()
+        await cache.aadd(
+            VERSION_KEY.format(user_id=user_id), version, timeout=None)
+    return version
+
+
+def get_user_state(user_id):
+    """
+    Return the user's ``(generation, changed_at)`` in one cache round trip;
+    ``changed_at`` is the timestamp of the last bump, ``None`` if unknown.
+    """
+    version_key = VERSION_KEY.format(user_id=user_id)
+    changed_key = CHANGED_KEY.format(user_id=user_id)
+    values = cache.get_many([version_key, changed_key])
+    version = values.get(version_key)
+    if version is None:
+        version = initial_version()
+        cache.add(version_key, version, timeout=None)
+    return version, values.get(changed_key)
+
+
+async def aget_user_state(user_id):
+    version_key = VERSION_KEY.format(user_id=user_id)
+    changed_key = CHANGED_KEY.format(user_id=user_id)
+    values = await cache.aget_many([version_key, changed_key])
+    version = values.get(version_key)
+    if version is None:
+        version = initial_version()
+        await cache.aadd(version_key, version, timeout=None)
+    return version, values.get(changed_key)
+
+
+def bump_user_version(user_id):
+    """
+    Invalidate every cached response for a user by moving them to a new
+    generation. Entries from older generations are never read again and
+    expire on their own TTL.
+
+    Inside a transaction the generation moves again once it commits:
+    a request reading in between sees the old rows under the new generation
+    and may have cached them, or handed out their ETag.
+    """
+    version = _bump_user_version(user_id)
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(
+            lambda: _bump_user_version(user_id), robust=True)
+    return version
+
+
+def _bump_user_version(user_id):
+    version = _increment(VERSION_KEY.format(user_id=user_id))
+    cache.set(CHANGED_KEY.format(user_id=user_id), time.time(), timeout=None)
+    return version
+
+
+def _increment(key):
+    try:
+        return cache.incr(key)
+    except ValueError:
+        # The counter was evicted or never set.
+        version = initial_version()
+        cache.set(key, version, timeout=None)
+        return version
+
+
+def bump_user_versions(user_ids):
+    for user_id in set(user_ids):
+        bump_user_version(user_id)
+
+
+def get_tags_version():
+    """Generation of tag names and ids, ``None`` until a tag changes."""
+    return cache.get(TAGS_VERSION_KEY)
+
+
+def bump_tags_version():
+    """
+    Tell every process that a tag was renamed or deleted, so their tag
+    name -> id caches are dropped; again on commit, like user generations.
+    """
+    _increment(TAGS_VERSION_KEY)
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(
+            lambda: _increment(TAGS_VERSION_KEY), robust=True)
+
+
+def normalize_query_params(query_params):
+    return sorted(
+        (key, sorted(values)) for key, values in query_params.lists()
+    )
+
+
+def build_list_cache_key(request, user_id, version):
+    """
+    Build the cache key of a list response from the user's generation and the
+    normalized query string. The host is part of the key because paginated
+    responses embed absolute ``next``/``previous`` links.
+    """
+    raw = repr((
+        request.get_host(),
+        request.path,
+        normalize_query_params(request.query_params),
+    ))
+    digest = hashlib.md5(raw.encode('utf-8'), usedforsecurity=False).hexdigest()
+    return LIST_KEY.format(user_id=user_id, version=version, digest=digest)
+
+
+class PrerenderedResponse(Response):
+    """
+    JSON response whose body was rendered beforehand, such as a cached list.
+    JSON clients get ``content`` as is, compressed if it was cached so and
+    the client accepts gzip; ``data`` is decoded from it only when something
+    needs it, such as the browsable API or a test.
+    """
+
+    def __init__(self, content, data=None, **kwargs):
+        self.prerendered = content
+        super().__init__(data, **kwargs)
+
+    @cached_property
+    def json_content(self):
+        if self.prerendered[:2] == GZIP_MAGIC:
+            return gzip.decompress(self.prerendered)
+        return self.prerendered
+
+    @property
+    def data(self):
+        if self._data is None:
+            self._data = json.loads(self.json_content)
+        return self._data
+
+    @data.setter
+    def data(self, value):
+        self._data = value
+
+    @property
+    def rendered_content(self):
+        renderer = getattr(self, 'accepted_renderer', None)
+        if not isinstance(renderer, JSONRenderer) or renderer.get_indent(
+                self.accepted_media_type, self.renderer_context):
+            return super().rendered_content
+        self['Content-Type'] = self.content_type or renderer.media_type
+        if self.prerendered[:2] != GZIP_MAGIC:
+            return self.prerendered
+        patch_vary_headers(self, ('Accept-Encoding',))
+        if accepts_encoding(self.renderer_context['request'], 'gzip'):
+            self['Content-Encoding'] = 'gzip'
+            return self.prerendered
+        return self.json_content
+
+
+def render_list(data):
+    """
+    Render list data the way ``JSONRenderer`` does for a request, gzipped
+    from ``COMPRESSION_MIN_LENGTH`` bytes: cached, it is sent as it is to
+    clients accepting gzip and takes as little room as compressed by the
+    cache.
+    """
+    content = FastJSONRenderer().render(data)
+    if len(content) >= get_compression_min_length():
+        return gzip_compress(content)
+    return content
+
+
+def get_cached_list(request, version=None):
+    if version is None:
+        version = get_user_version(request.user.pk)
+    key = build_list_cache_key(request, request.user.pk, version)
+    content = cache.get(key)
+    record_cache_access(content is not None)
+    return key, content
+
+
+def set_cached_list(key, data):
+    """
+    Cache a list response as rendered by ``render_list()``, returning it:
+    hits are served without serializing again, and the cache's serializer
+    stores bytes as they are. The key holds one generation of the user's
+    data, so it is only ever added: a tiered cache has nothing to
+    invalidate.
+    """
+    content = render_list(data)
+    cache.add(key, content, timeout=get_cache_ttl())
+    return content
+
+
+async def aget_cached_list(request, version=None):
+    if version is None:
+        version = await aget_user_version(request.user.pk)
+    key = build_list_cache_key(request, request.user.pk, version)
+    content = await cache.aget(key)
+    record_cache_access(content is not None)
+    return key, content
+
+
+async def aset_cached_list(key, data):
+    content = render_list(data)
+    await cache.aadd(key, content, timeout=get_cache_ttl())
+    return content
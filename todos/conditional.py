@@ -0,0 +1,130 @@
+"""
+Conditional requests for the todo and tag endpoints.
+
+A single todo has a strong ETag and ``Last-Modified`` derived from its
+``updated_at``, which every change to the todo, its tags or its attachments
+stamps (see ``todos.signals``). Collections have a weak ETag derived from
+the user's cache generation (``todos.cache``), which the same changes bump,
+and the request's host, path and query string; their ``Last-Modified`` is
+the time of the last bump. A ``GET`` whose ``If-None-Match`` or
+``If-Modified-Since`` still matches is answered with 304 before the main
+query or any serialization, and writes carrying ``If-Match`` or
+``If-Unmodified-Since`` fail with 412 once the todo has changed.
+
+``days_remaining`` and ``is_overdue`` follow the clock rather than the
+data, so like cached lists they are not covered by the validators. Which
+todos are overdue follows it too: the overdue list's ETag also covers the
+next due date to pass, and it has no ``Last-Modified``.
+"""
+import hashlib
+
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions, status
+from rest_framework.fields import DateTimeField
+
+from core.compression import strip_encoded_etags
+
+from .cache import aget_user_state, get_user_state, normalize_query_params
+
+_datetime_field = DateTimeField()
+
+
+class PreconditionFailed(exceptions.APIException):
+    status_code = status.HTTP_412_PRECONDITION_FAILED
+    default_detail = _('The todo has changed since it was fetched.')
+    default_code = 'precondition_failed'
+
+
+def _digest(*parts):
+    return hashlib.md5(repr(parts).encode('utf-8'),
+                       usedforsecurity=False).hexdigest()
+
+
+def is_conditional(request):
+    return ('If-None-Match' in request.headers or
+            'If-Modified-Since' in request.headers)
+
+
+def todo_validators(request, pk, updated_at):
+    """
+    ``(etag, last_modified)`` of a todo in the negotiated media type; the
+    same for every view of the todo, so the ETag of a ``GET`` can guard a
+    later ``PATCH``.
+    """
+    etag = '"%s"' % _digest(
+        pk, _datetime_field.to_representation(updated_at),
+        request.accepted_media_type)
+    return etag, int(updated_at.timestamp())
+
+
+def collection_validators(request, version, changed_at, clock=None):
+    """
+    ``(etag, last_modified)`` of a collection. One that also changes as
+    time passes gives ``clock``, ``(next_change,)`` with the moment it
+    changes next or ``None``; it goes into the ETag, and there is no
+    ``last_modified`` since the collection may have changed without a write.
+    """
+    etag = 'W/"%s"' % _digest(
+        version, request.get_host(), request.path,
+        normalize_query_params(request.query_params),
+        request.accepted_media_type, *clock or ())
+    if clock or changed_at is None:
+        return etag, None
+    return etag, int(changed_at)
+
+
+def check_preconditions(request, etag, last_modified=None):
+    """
+    Return the 304 response ``request``'s conditions call for, raise
+    ``PreconditionFailed`` when they fail, or return ``None`` to proceed.
+    ETags the client got with a compressed body are compared as ``etag``.
+    """
+    meta = request._request.META
+    for header in ('HTTP_IF_MATCH', 'HTTP_IF_NONE_MATCH'):
+        if header in meta:
+            meta[header] = strip_encoded_etags(meta[header])
+    response = get_conditional_response(
+        request._request, etag=etag, last_modified=last_modified)
+    if response is None:
+        return None
+    if response.status_code == status.HTTP_412_PRECONDITION_FAILED:
+        raise PreconditionFailed()
+    return set_validators(response, etag, last_modified)
+
+
+def set_validators(response, etag, last_modified=None):
+    if 200 <= response.status_code < 300 or response.status_code == 304:
+        response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
+    return response
+
+
+def collection_response(request, get_response, get_clock=None):
+    """
+    Answer a collection ``GET`` for ``request.user``: 304 while the client's
+    copy is current, otherwise ``get_response(version)`` with validators;
+    ``version`` is the generation read for them, to key cached data.
+    ``get_clock()`` returns the ``next_change`` of ``collection_validators``.
+    """
+    version, changed_at = get_user_state(request.user.pk)
+    etag, last_modified = collection_validators(
+        request, version, changed_at,
+        None if get_clock is None else (get_clock(),))
+    response = check_preconditions(request, etag, last_modified)
+    if response is None:
+        response = get_response(version)
+    return set_validators(response, etag, last_modified)
+
+
+async def acollection_response(request, get_response, get_clock=None):
+    version, changed_at = await aget_user_state(request.user.pk)
+    etag, last_modified = collection_validators(
+        request, version, changed_at,
+        None if get_clock is None else (await get_clock(),))
+    response = check_preconditions(request, etag, last_modified)
+    if response is None:
+        response = await get_response(version)
+    return set_validators(response, etag, last_modified)
@@ -0,0 +1,361 @@
+"""
+Per-user change feed behind ``/api/todos/events/``.
+
+Writes publish small events (``created``, ``updated``, ``status``,
+``deleted``, ``attachment``, ``imported``) once their transaction commits.
+The broker (``TODO_EVENTS_BROKER``) fans them out to the user's open
+streams and keeps the last ``TODO_EVENTS_LOG_SIZE`` of them, so a client
+reconnecting with ``Last-Event-ID`` receives what it missed. Event ids
+increase by one per user; when the log no longer reaches back to a client's
+id it gets a ``reset`` event and has to reload its todos.
+"""
+import asyncio
+import json
+import threading
+from collections import defaultdict, deque
+from contextlib import asynccontextmanager
+
+import redis
+from django.conf import settings
+from django.db import transaction
+from django.http import StreamingHttpResponse
+from django.utils.module_loading import import_string
+from redis import asyncio as aioredis
+from rest_framework import serializers
+
+DEFAULT_BROKER = 'todos.events.InMemoryBroker'
+DEFAULT_LOG_SIZE = 1000
+DEFAULT_KEEPALIVE = 15
+DEFAULT_REDIS_URL = 'redis://127.0.0.1:6379/2'
+# Reconnection delay suggested to ``EventSource`` clients, in milliseconds.
+RETRY_MS = 3000
+
+
+def get_event_log_size():
+    return getattr(settings, 'TODO_EVENTS_LOG_SIZE', DEFAULT_LOG_SIZE)
+
+
+def get_event_keepalive():
+    return getattr(settings, 'TODO_EVENTS_KEEPALIVE', DEFAULT_KEEPALIVE)
+
+
+def can_resume(last_id, oldest_id, latest_id):
+    """Whether the log still holds every event after ``last_id``."""
+    if last_id == latest_id:
+        return True
+    return (last_id < latest_id and oldest_id is not None and
+            oldest_id <= last_id + 1)
+
+
+class InMemoryBroker:
+    """
+    Broker for a single process (development, tests). Subscribers are
+    asyncio queues, fed thread-safely from whichever thread commits.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.logs = defaultdict(deque)
+        self.latest = defaultdict(int)
+        self.subscribers = defaultdict(set)
+
+    def publish(self, user_id, type, data):
+        with self.lock:
+            self.latest[user_id] += 1
+            event = {'id': self.latest[user_id], 'type': type, 'data': data}
+            log = self.logs[user_id]
+            log.append(event)
+            while len(log) > get_event_log_size():
+                log.popleft()
+            # Queued under the lock so subscribers see events in id order.
+            for loop, queue in list(self.subscribers[user_id]):
+                try:
+                    loop.call_soon_threadsafe(queue.put_nowait, event)
+                except RuntimeError:
+                    # The subscriber's event loop is closed.
+                    self.subscribers[user_id].discard((loop, queue))
+        return event
+
+    def since(self, user_id, last_id=None):
+        """
+        Return ``(latest_id, events)``: the events after ``last_id``, or
+        ``None`` when some of them already left the log.
+        """
+        with self.lock:
+            latest = self.latest[user_id]
+            if last_id is None:
+                return latest, []
+            log = self.logs[user_id]
+            if not can_resume(last_id, log[0]['id'] if log else None, latest):
+                return latest, None
+            return latest, [event for event in log if event['id'] > last_id]
+
+    @asynccontextmanager
+    async def subscribe(self, user_id):
+        subscriber = (asyncio.get_running_loop(), asyncio.Queue())
+        with self.lock:
+            self.subscribers[user_id].add(subscriber)
+        try:
+            yield InMemorySubscription(self, user_id, subscriber[1])
+        finally:
+            with self.lock:
+                self.subscribers[user_id].discard(subscriber)
+
+
+class InMemorySubscription:
+    def __init__(self, broker, user_id, queue):
+        self.broker = broker
+        self.user_id = user_id
+        self.queue = queue
+
+    async def since(self, last_id=None):
+        return self.broker.since(self.user_id, last_id)
+
+    async def get(self):
+        return await self.queue.get()
+
+
+class RedisBroker:
+    """
+    Broker shared by every process through Redis
+    (``TODO_EVENTS_REDIS_URL``). A Lua script assigns the id, appends the
+    event to the user's log (a sorted set scored by id, trimmed to
+    ``TODO_EVENTS_LOG_SIZE``) and publishes it on the user's channel in one
+    round trip. Each open stream holds one pub/sub connection.
+    """
+    ID_KEY = 'todos:events:user:{user_id}:id'
+    LOG_KEY = 'todos:events:user:{user_id}:log'
+    CHANNEL = 'todos:events:user:{user_id}'
+    PUBLISH_SCRIPT = """
+        local id = redis.call('INCR', KEYS[1])
+        local event = cjson.decode(ARGV[1])
+        event['id'] = id
+        local message = cjson.encode(event)
+        redis.call('ZADD', KEYS[2], id, message)
+        redis.call('ZREMRANGEBYRANK', KEYS[2], 0, -tonumber(ARGV[2]) - 1)
+        redis.call('PUBLISH', KEYS[3], message)
+        return message
+    """
+
+    def __init__(self):
+        self.url = getattr(settings, 'TODO_EVENTS_REDIS_URL',
+                           DEFAULT_REDIS_URL)
+        self.client = redis.Redis.from_url(self.url)
+        self.publish_script = self.client.register_script(self.PUBLISH_SCRIPT)
+
+    def keys(self, user_id):
+        return (self.ID_KEY.format(user_id=user_id),
+                self.LOG_KEY.format(user_id=user_id),
+                self.CHANNEL.format(user_id=user_id))
+
+    def publish(self, user_id, type, data):
+        message = self.publish_script(
+            keys=self.keys(user_id),
+            args=[json.dumps({'type': type, 'data': data}),
+                  get_event_log_size()])
+        return json.loads(message)
+
+    def read_log(self, pipeline, user_id, last_id):
+        id_key, log_key, _ = self.keys(user_id)
+        pipeline.get(id_key)
+        pipeline.zrange(log_key, 0, 0, withscores=True)
+        pipeline.zrangebyscore(log_key, f'({last_id or 0}', '+inf')
+
+    def parse_log(self, results, last_id):
+        latest, oldest, messages = results
+        latest = int(latest or 0)
+        if last_id is None:
+            return latest, []
+        if not can_resume(last_id, int(oldest[0][1]) if oldest else None,
+                          latest):
+            return latest, None
+        return latest, [json.loads(message) for message in messages]
+
+    def since(self, user_id, last_id=None):
+        with self.client.pipeline() as pipeline:
+            self.read_log(pipeline, user_id, last_id)
+            return self.parse_log(pipeline.execute(), last_id)
+
+    @asynccontextmanager
+    async def subscribe(self, user_id):
+        client = aioredis.Redis.from_url(self.url)
+        pubsub = client.pubsub()
+        try:
+            await pubsub.subscribe(self.keys(user_id)[2])
+            yield RedisSubscription(self, client, pubsub, user_id)
+        finally:
+            await pubsub.aclose()
+            await client.aclose()
+
+
+class RedisSubscription:
+    def __init__(self, broker, client, pubsub, user_id):
+        self.broker = broker
+        self.client = client
+        self.pubsub = pubsub
+        self.user_id = user_id
+
+    async def since(self, last_id=None):
+        async with self.client.pipeline() as pipeline:
+            self.broker.read_log(pipeline, self.user_id, last_id)
+            return self.broker.parse_log(await pipeline.execute(), last_id)
+
+    async def get(self):
+        while True:
+            message = await self.pubsub.get_message(
+                ignore_subscribe_messages=True, timeout=None)
+            if message is not None:
+                return json.loads(message['data'])
+
+
+_brokers = {}
+_brokers_lock = threading.Lock()
+
+
+def get_broker():
+    path = getattr(settings, 'TODO_EVENTS_BROKER', DEFAULT_BROKER)
+    with _brokers_lock:
+        if path not in _brokers:
+            _brokers[path] = import_string(path)()
+        return _brokers[path]
+
+
+def reset_brokers():
+    """Forget the loaded brokers, and with them the in-memory logs."""
+    with _brokers_lock:
+        _brokers.clear()
+
+
+def publish(user_id, type, data):
+    """Publish once the current transaction commits, if it does."""
+    transaction.on_commit(
+        lambda: get_broker().publish(user_id, type, data), robust=True)
+
+
+_datetime_field = serializers.DateTimeField()
+
+
+def change_type(todo, created=False):
+    if created:
+        return 'created'
+    loaded = getattr(todo, '_loaded_values', None) or {}
+    if 'status' in loaded and loaded['status'] != todo.status:
+        return 'status'
+    return 'updated'
+
+
+def todo_data(todo, formatted=None):
+    """
+    The event payload of ``todo``. A batch shares its ``formatted``
+    ``{datetime: string}`` so each distinct ``updated_at`` is formatted once.
+    """
+    if formatted is None:
+        formatted = {}
+    updated_at = todo.updated_at
+    if updated_at not in formatted:
+        formatted[updated_at] = _datetime_field.to_representation(updated_at)
+    return {
+        'todo': todo.pk,
+        'status': todo.status,
+        'updated_at': formatted[updated_at],
+    }
+
+
+def publish_todo_change(todo, created=False):
+    publish(todo.user_id, change_type(todo, created), todo_data(todo))
+
+
+def publish_todo_changes(todos, created=False):
+    """
+    ``publish_todo_change`` for a batch of todos, with a single commit hook
+    publishing them in order.
+    """
+    formatted = {}
+    events = [
+        (todo.user_id, change_type(todo, created), todo_data(todo, formatted))
+        for todo in todos]
+    if events:
+        transaction.on_commit(lambda: publish_events(events), robust=True)
+
+
+def publish_events(events):
+    broker = get_broker()
+    for user_id, type, data in events:
+        broker.publish(user_id, type, data)
+
+
+def publish_todo_deleted(user_id, todo_id):
+    publish(user_id, 'deleted', {'todo': todo_id})
+
+
+def parse_last_event_id(request):
+    """
+    The id a client resumes after: the ``Last-Event-ID`` header that
+    ``EventSource`` sends on reconnect, or the ``last_event_id`` parameter
+    for the first connection.
+    """
+    value = (request.headers.get('Last-Event-ID') or
+             request.query_params.get('last_event_id'))
+    if not value:
+        return None
+    try:
+        value = int(value)
+    except ValueError:
+        value = -1
+    if value < 0:
+        raise serializers.ValidationError(
+            {'last_event_id': ['A non-negative integer is required.']})
+    return value
+
+
+def format_event(event):
+    data = json.dumps(event['data'], separators=(',', ':'))
+    return f'id: {event["id"]}\nevent: {event["type"]}\ndata: {data}\n\n'
+
+
+def backlog_messages(latest_id, events, last_id):
+    """SSE messages catching a client up from ``last_id``."""
+    messages = [f'retry: {RETRY_MS}\n\n']
+    if last_id is None:
+        # No event yet, but reconnects resume from here.
+        messages.append(f'id: {latest_id}\n\n')
+    elif events is None:
+        messages.append(
+            format_event({'id': latest_id, 'type': 'reset', 'data': {}}))
+    else:
+        messages.extend(format_event(event) for event in events)
+    return messages
+
+
+async def stream_events(user_id, last_id=None, keepalive=None):
+    """
+    Yield ``user_id``'s events as SSE messages, those after ``last_id``
+    first and then live ones, with a comment every ``keepalive`` seconds of
+    silence so proxies keep the connection open.
+    """
+    keepalive = keepalive or get_event_keepalive()
+    async with get_broker().subscribe(user_id) as subscription:
+        # Subscribed before reading the log, so nothing falls in between;
+        # live events the log already contained are skipped.
+        latest, events = await subscription.since(last_id)
+        for message in backlog_messages(latest, events, last_id):
+            yield message
+        last_sent = latest
+        while True:
+            try:
+                event = await asyncio.wait_for(subscription.get(), keepalive)
+            except TimeoutError:
+                yield ': keepalive\n\n'
+                continue
+            if event['id'] > last_sent:
+                last_sent = event['id']
+                yield format_event(event)
+
+
+def event_stream_response(messages):
+    response = StreamingHttpResponse(
+        messages, content_type='text/event-stream; charset=utf-8')
+    response['Cache-Control'] = 'no-cache'
+    # Keep nginx from buffering the stream.
+    response['X-Accel-Buffering'] = 'no'
+    return response
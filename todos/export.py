@@ -0,0 +1,95 @@
+import csv
+import json
+from itertools import islice
+
+from django.conf import settings
+
+from .models import Todo
+from .serializers import TodoReadSerializer, TodoSerializer
+
+EXPORT_FIELDS = TodoReadSerializer.VALUE_FIELDS
+# Tag names inside the single CSV ``tags`` column.
+CSV_TAG_SEPARATOR = '|'
+DEFAULT_CHUNK_SIZE = 2000
+
+
+def get_export_chunk_size():
+    return getattr(settings, 'TODO_EXPORT_CHUNK_SIZE', DEFAULT_CHUNK_SIZE)
+
+
+def iter_records(queryset, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Yield one flat dict per todo, ``EXPORT_FIELDS`` plus a list of tag
+    names, formatted like the API.
+
+    Rows are streamed from ``.iterator(chunk_size)`` (a server-side cursor
+    where the database supports it) and tags are fetched with one query per
+    chunk, so memory stays bounded by the chunk size.
+    """
+    converters = TodoReadSerializer.converters(TodoSerializer(), EXPORT_FIELDS)
+    rows = queryset.prefetch_related(None).values(*EXPORT_FIELDS).iterator(
+        chunk_size=chunk_size)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return
+        tags = {}
+        for todo_id, name in Todo.tags.through.objects.filter(
+                todo_id__in=[row['id'] for row in chunk],
+        ).order_by('todo_id', 'tag_id').values_list('todo_id', 'tag__name'):
+            tags.setdefault(todo_id, []).append(name)
+        for row in chunk:
+            record = {
+                name: None if row[name] is None else convert(row[name])
+                for name, convert in converters
+            }
+            record['tags'] = tags.get(row['id'], [])
+            yield record
+
+
+def ndjson_lines(records):
+    for record in records:
+        yield json.dumps(record, ensure_ascii=False) + '\n'
+
+
+class _Echo:
+    """File-like object handing each written CSV row back to the caller."""
+
+    def write(self, value):
+        return value
+
+
+def csv_lines(records):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(EXPORT_FIELDS + ['tags'])
+    for record in records:
+        yield writer.writerow(
+            [record[name] for name in EXPORT_FIELDS] +
+            [CSV_TAG_SEPARATOR.join(record['tags'])])
+
+
+FORMATS = {
+    'ndjson': ('application/x-ndjson', ndjson_lines),
+    'csv': ('text/csv', csv_lines),
+}
+
+
+def export_lines(queryset, format, chunk_size=DEFAULT_CHUNK_SIZE):
+    return FORMATS[format][1](iter_records(queryset, chunk_size))
+
+
+def export_user(user_id, path, format, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Write one user's todos to ``path``; returns the number of rows."""
+    queryset = Todo.objects.filter(user_id=user_id).order_by('id')
+    rows = 0
+
+    def counted(records):
+        nonlocal rows
+        for record in records:
+            rows += 1
+            yield record
+
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        f.writelines(FORMATS[format][1](
+            counted(iter_records(queryset, chunk_size))))
+    return rows
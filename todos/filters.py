@@ -1,17 +1,41 @@
 import django_filters
 from django.db import models
+from rest_framework.filters import SearchFilter
+from rest_framework.settings import api_settings
 
 from .models import Todo
+from .search import get_search_backend
+
+
+class TodoSearchFilter(SearchFilter):
+    """
+    ``?search=`` backed by the database full-text index instead of
+    ``icontains``. Every term is a prefix match; when the backend ranks
+    results and no explicit ``?ordering=`` is given, best matches come first.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        query = request.query_params.get(self.search_param, '')
+        if not query.strip():
+            return queryset
+        backend = get_search_backend(queryset.db)
+        queryset = backend.search(
+            queryset, query, fields=self.get_search_fields(view, request),
+            user_id=request.user.pk)
+        if backend.ranked and \
+                api_settings.ORDERING_PARAM not in request.query_params:
+            queryset = queryset.order_by('-search_rank')
+        return queryset
 
 
 class TodoFilter(django_filters.FilterSet):
-    title = django_filters.CharFilter(lookup_expr='icontains')
+    title = django_filters.CharFilter(method='filter_title')
     priority = django_filters.NumberFilter()
     priority__gt = django_filters.NumberFilter(
         field_name='priority', lookup_expr='gt')
     priority__lt = django_filters.NumberFilter(
         field_name='priority', lookup_expr='lt')
-    status = django_filters.CharFilter(lookup_expr='iexact')
+    status = django_filters.CharFilter(method='filter_status')
     due_date = django_filters.DateTimeFilter()
     due_date__gt = django_filters.DateTimeFilter(
         field_name='due_date', lookup_expr='gt')
@@ -29,6 +53,17 @@ class TodoFilter(django_filters.FilterSet):
             'due_date': ['exact', 'gt', 'lt'],
         }
 
+    def filter_title(self, queryset, name, value):
+        user = getattr(self.request, 'user', None)
+        return get_search_backend(queryset.db).search(
+            queryset, value, fields=('title',),
+            user_id=user.pk if user else None)
+
+    def filter_status(self, queryset, name, value):
+        # Statuses are stored lower-case, so an exact match on the folded
+        # value behaves like ``iexact`` while still using the status index.
+        return queryset.filter(status=value.lower())
+
     order_by = django_filters.OrderingFilter(
         fields=(
             ('priority', 'priority'),
@@ -0,0 +1,144 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+
+try:
+    from django_redis import get_redis_connection
+except ImportError:  # pragma: no cover
+    get_redis_connection = None
+
+
+def get_check_timeout():
+    return getattr(settings, 'HEALTH_CHECK_TIMEOUT', 1.0)
+
+
+def get_check_cache_seconds():
+    return getattr(settings, 'HEALTH_CHECK_CACHE_SECONDS', 2.0)
+
+
+def check_database():
+    # Runs on a long-lived worker thread, so the thread's connection is
+    # opened once and reused by every probe until it breaks.
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+    except Exception:
+        connection.close()
+        raise
+
+
+def check_cache():
+    """Ping through the cache's own connection pool."""
+    if get_redis_connection is not None:
+        try:
+            client = get_redis_connection('default')
+        except NotImplementedError:
+            pass
+        else:
+            client.ping()
+            return
+    cache.get('health:ping')
+
+
+CHECKS = {
+    'database': check_database,
+    'cache': check_cache,
+}
+
+
+def _timed(check):
+    start = time.perf_counter()
+    check()
+    return time.perf_counter() - start
+
+
+class ReadinessProbe:
+    """
+    Run every component check concurrently with a timeout and keep the
+    result for ``HEALTH_CHECK_CACHE_SECONDS``, so frequent load balancer
+    probes cost one round of checks per window.
+
+    A check that is still running from an earlier probe is reported as timed
+    out instead of being started again, so a hung dependency cannot exhaust
+    the worker threads.
+    """
+
+    def __init__(self, checks):
+        self.checks = checks
+        self.executor = ThreadPoolExecutor(
+            max_workers=len(checks), thread_name_prefix='readiness')
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.result = None
+        self.expires = 0
+
+    def get(self):
+        with self.lock:
+            if not self.fresh():
+                futures = self.start()
+                wait(futures.values(), timeout=get_check_timeout())
+                self.store(self.summarize(futures))
+            return self.result
+
+    async def aget(self):
+        """
+        ``get`` for async views: the checks still run on the probe's
+        threads, but the event loop is not blocked while they do.
+        """
+        with self.lock:
+            if self.fresh():
+                return self.result
+            futures = self.start()
+        await asyncio.wait(
+            [asyncio.wrap_future(future) for future in futures.values()],
+            timeout=get_check_timeout())
+        result = self.summarize(futures)
+        with self.lock:
+            self.store(result)
+        return result
+
+    def fresh(self):
+        return self.result is not None and time.monotonic() < self.expires
+
+    def store(self, result):
+        self.result = result
+        self.expires = time.monotonic() + get_check_cache_seconds()
+
+    def start(self):
+        for name, check in self.checks.items():
+            future = self.pending.get(name)
+            if future is None or future.done():
+                self.pending[name] = self.executor.submit(_timed, check)
+        return dict(self.pending)
+
+    def summarize(self, futures):
+        components = {}
+        for name, future in futures.items():
+            if not future.done():
+                components[name] = {'status': 'down', 'error': 'timeout'}
+            elif future.exception() is not None:
+                components[name] = {
+                    'status': 'down',
+                    'error': future.exception().__class__.__name__}
+            else:
+                components[name] = {
+                    'status': 'up',
+                    'latency_ms': round(future.result() * 1000, 3)}
+
+        healthy = all(component['status'] == 'up'
+                      for component in components.values())
+        return {'status': 'up' if healthy else 'down',
+                'components': components}
+
+    def reset(self):
+        with self.lock:
+            self.result = None
+            self.expires = 0
+
+
+readiness = ReadinessProbe(CHECKS)
@@ -0,0 +1,221 @@
+import csv
+import io
+import json
+import time
+from itertools import islice
+
+from django.conf import settings
+from django.db import transaction
+from django.dispatch import Signal
+from django.utils import timezone
+from rest_framework import serializers
+
+from . import stats
+from .cache import bump_user_version
+from .export import CSV_TAG_SEPARATOR
+from .models import Todo, TodoImport
+from .serializers import TodoImportRowSerializer
+from .tags import BULK_BATCH_SIZE, add_tag_usage, link_tags, resolve_tags
+
+DEFAULT_CHUNK_SIZE = 1000
+DEFAULT_MAX_ERRORS = 100
+
+# Sent once per import run instead of the per-row ``post_save`` and
+# ``m2m_changed`` signals, which ``bulk_create`` does not send.
+todos_imported = Signal()
+
+
+def get_import_chunk_size():
+    return getattr(settings, 'TODO_IMPORT_CHUNK_SIZE', DEFAULT_CHUNK_SIZE)
+
+
+def get_import_max_errors():
+    return getattr(settings, 'TODO_IMPORT_MAX_ERRORS', DEFAULT_MAX_ERRORS)
+
+
+class RowError(Exception):
+    pass
+
+
+def parse_ndjson(stream):
+    """Yield ``(line_number, row)``; unparsable rows are ``RowError``s."""
+    for line_number, line in enumerate(stream, 1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as exc:
+            yield line_number, RowError(f'Invalid JSON: {exc}')
+            continue
+        if not isinstance(row, dict):
+            yield line_number, RowError('Expected a JSON object.')
+            continue
+        yield line_number, row
+
+
+def parse_csv(stream):
+    """
+    Yield ``(line_number, row)`` for a CSV file with a header row. Empty
+    cells count as missing and ``tags`` holds names joined with ``|``.
+    """
+    reader = csv.DictReader(stream)
+    for row in reader:
+        if None in row:
+            yield reader.line_num, RowError(
+                'Row has more cells than the header.')
+            continue
+        row = {key: value for key, value in row.items() if value}
+        if 'tags' in row:
+            row['tags'] = row['tags'].split(CSV_TAG_SEPARATOR)
+        yield reader.line_num, row
+
+
+PARSERS = {
+    'ndjson': parse_ndjson,
+    'csv': parse_csv,
+}
+
+
+class ImportConflict(Exception):
+    """Another run advanced the same import concurrently."""
+
+
+class TodoImporter:
+    """
+    Load todos from an NDJSON or CSV text stream into ``job.user``'s list.
+
+    The stream is parsed lazily and written in chunks of ``chunk_size``
+    rows. Each chunk is validated, its new tag names are added to an
+    in-memory name -> id map (one lookup per chunk at most), the todos are
+    inserted with ``bulk_create`` and the tag links with one through-table
+    insert, and ``job.position`` is advanced, all in one transaction.
+    Re-running the importer on the same job and file skips the lines of the
+    committed chunks.
+
+    Invalid rows are skipped and reported in ``job.errors`` (the first
+    ``TODO_IMPORT_MAX_ERRORS``) and counted in ``job.failed``.
+    """
+
+    def __init__(self, job, chunk_size=None, progress=None):
+        self.job = job
+        self.chunk_size = chunk_size or get_import_chunk_size()
+        self.max_errors = get_import_max_errors()
+        self.progress = progress
+        self.tag_ids = {}
+        self.row_serializer = TodoImportRowSerializer()
+
+    def run(self, stream):
+        job = self.job
+        started = time.monotonic()
+        imported = 0
+        rows = ((line, row) for line, row in PARSERS[job.format](stream)
+                if line > job.position)
+        try:
+            while True:
+                chunk = list(islice(rows, self.chunk_size))
+                if not chunk:
+                    break
+                imported += self.write_chunk(chunk)
+                if self.progress:
+                    self.progress(job)
+        except ImportConflict:
+            # The job's state belongs to the other run.
+            raise
+        except (UnicodeDecodeError, csv.Error) as exc:
+            self.add_error(job.errors, job.position + 1, {
+                'non_field_errors': [f'Unreadable input: {exc}']})
+            job.status = 'failed'
+            self.finish(started, ['status', 'errors'])
+            return job
+        except BaseException:
+            job.status = 'failed'
+            self.finish(started, ['status'])
+            raise
+
+        job.status = 'completed'
+        self.finish(started, ['status'])
+        todos_imported.send(sender=TodoImport, job=job, imported=imported)
+        return job
+
+    def finish(self, started, fields):
+        job = self.job
+        job.duration += time.monotonic() - started
+        job.save(update_fields=fields + ['duration', 'updated_at'])
+
+    def add_error(self, errors, line, detail):
+        if len(errors) < self.max_errors:
+            errors.append({'line': line, 'errors': detail})
+
+    def validate(self, chunk):
+        valid, errors = [], []
+        for line, row in chunk:
+            if isinstance(row, RowError):
+                errors.append((line, {'non_field_errors': [str(row)]}))
+                continue
+            try:
+                valid.append(self.row_serializer.run_validation(row))
+            except serializers.ValidationError as exc:
+                errors.append((line, serializers.as_serializer_error(exc)))
+        return valid, errors
+
+    def resolve_tag_ids(self, names):
+        missing = [name for name in names if name not in self.tag_ids]
+        if missing:
+            self.tag_ids.update(
+                (name, tag.pk) for name, tag in
+                resolve_tags([{'name': name} for name in missing]).items())
+
+    def write_chunk(self, chunk):
+        job = self.job
+        valid, errors = self.validate(chunk)
+        todos, tag_names = [], []
+        for data in valid:
+            names = data.pop('tags', [])
+            todo = Todo(user_id=job.user_id, **data)
+            todo.sync_completed_at()
+            todos.append(todo)
+            tag_names.append(names)
+
+        with transaction.atomic():
+            self.resolve_tag_ids(
+                {name for names in tag_names for name in names})
+            Todo.objects.bulk_create(todos, batch_size=BULK_BATCH_SIZE)
+            links = {(todo.pk, self.tag_ids[name])
+                     for todo, names in zip(todos, tag_names)
+                     for name in names}
+            link_tags(links)
+            add_tag_usage((job.user_id, tag_id) for _, tag_id in links)
+            if stats.rollup_enabled():
+                stats.todos_created(todos)
+                stats.tag_links_changed(
+                    [(job.user_id, tag_id) for _, tag_id in links], 1)
+
+            position = chunk[-1][0]
+            job_errors = list(job.errors)
+            for line, detail in errors:
+                self.add_error(job_errors, line, detail)
+            advanced = TodoImport.objects.filter(
+                pk=job.pk, position=job.position).update(
+                position=position,
+                imported=job.imported + len(todos),
+                failed=job.failed + len(errors),
+                errors=job_errors,
+                updated_at=timezone.now())
+            if not advanced:
+                raise ImportConflict(
+                    f'Import {job.pk} was advanced by another run.')
+        job.position = position
+        job.imported += len(todos)
+        job.failed += len(errors)
+        job.errors = job_errors
+        bump_user_version(job.user_id)
+        return len(todos)
+
+
+def open_text(binary):
+    """Decode an uploaded or opened binary file lazily, BOM tolerated."""
+    return io.TextIOWrapper(binary, encoding='utf-8-sig', newline='')
+
+
+def import_todos(job, stream, chunk_size=None, progress=None):
+    return TodoImporter(job, chunk_size, progress).run(stream)
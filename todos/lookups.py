@@ -0,0 +1,36 @@
+from django.db.models import CharField, IntegerField, Lookup, TextField
+from django.db.models.lookups import In
+
+
+@IntegerField.register_lookup
+@CharField.register_lookup
+class InlineIn(In):
+    """
+    ``IN`` with the values rendered as SQL literals instead of parameters.
+
+    SQLite can only prove that a query matches a partial index when the
+    terms of the index condition appear as literals, and it only iterates an
+    ``IN`` list in index order when the values are known up front. Filters on
+    small fixed value sets (e.g. ``Todo.OPEN_STATUSES``) use ``__inline_in``.
+    Values are quoted the same way Django quotes them in index DDL.
+    """
+    lookup_name = 'inline_in'
+
+    def process_rhs(self, compiler, connection):
+        values = sorted(set(self.rhs))
+        if not values:
+            return super().process_rhs(compiler, connection)
+        editor = connection.SchemaEditorClass(connection, collect_sql=True)
+        literals = [editor.quote_value(value) for value in values]
+        return '(' + ', '.join(literals) + ')', []
+
+
+@TextField.register_lookup
+class Match(Lookup):
+    """SQLite FTS5 ``MATCH``; the left-hand side must be the FTS table column."""
+    lookup_name = 'match'
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f'{lhs} MATCH {rhs}', lhs_params + rhs_params
@@ -0,0 +1,158 @@
+import json
+import random
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from core.metrics import RequestMetrics
+from todos.benchmarking import compare, measure, summarize
+from todos.models import Todo
+from todos.seeding import WORDS, seed_todos
+
+SCENARIOS = ('list', 'filter', 'search', 'ordering', 'retrieve', 'create',
+             'update_status', 'completed', 'overdue')
+ORDERINGS = ('priority', '-priority', 'due_date', '-due_date', 'created_at',
+             '-updated_at')
+DUMMY_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'},
+}
+
+
+class Command(BaseCommand):
+    help = ('Benchmark the todo API in-process with the test client against '
+            'a seeded dataset that is rolled back afterwards')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--todos', type=int, default=5000,
+            help='Todos of the benchmarked user')
+        parser.add_argument(
+            '--users', type=int, default=5,
+            help='Seeded users; the others only add table volume')
+        parser.add_argument('--runs', type=int, default=200)
+        parser.add_argument('--warmup', type=int, default=10)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--scenario', action='append', dest='scenarios',
+            choices=SCENARIOS, help='Only run this scenario (repeatable)')
+        parser.add_argument(
+            '--with-cache', action='store_true',
+            help='Keep the configured cache instead of measuring uncached '
+                 'responses')
+        parser.add_argument('--output', help='Write the JSON results here')
+        parser.add_argument(
+            '--baseline', help='JSON results of an earlier run to compare')
+        parser.add_argument('--metric', default='p95_ms')
+        parser.add_argument(
+            '--threshold', type=float, default=0.2,
+            help='Allowed slowdown against the baseline (0.2 = 20%%)')
+
+    def handle(self, *args, **options):
+        overrides = {'ALLOWED_HOSTS': ['testserver']}
+        if not options['with_cache']:
+            overrides['CACHES'] = DUMMY_CACHES
+            overrides['TODO_THROTTLE_BACKEND'] = \
+                'todos.throttles.UnlimitedRateLimiter'
+
+        with override_settings(**overrides), transaction.atomic():
+            users = seed_todos(
+                users=options['users'], todos_per_user=options['todos'],
+                seed=options['seed'], prefix='benchmark',
+                progress=lambda done, total: self.stderr.write(
+                    f'Seeded {done}/{total} todos'))
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+            results = {
+                'config': {
+                    key: options[key] for key in
+                    ('todos', 'users', 'runs', 'warmup', 'seed', 'with_cache')
+                },
+                'results': self.run(users[0], options),
+            }
+            transaction.set_rollback(True)
+
+        output = json.dumps(results, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output + '\n')
+        else:
+            self.stdout.write(output)
+
+        if options['baseline']:
+            self.compare(results['results'], options)
+
+    def run(self, user, options):
+        rng = random.Random(options['seed'])
+        client = APIClient()
+        client.force_authenticate(user=user)
+        ids = list(Todo.objects.filter(user=user).values_list('pk', flat=True))
+        statuses = [value for value, _ in Todo.STATUS_CHOICES]
+        list_url = reverse('todo-list')
+
+        scenarios = {
+            'list': lambda: client.get(list_url),
+            'filter': lambda: client.get(list_url, {
+                'priority': rng.randint(1, 4),
+                'status': rng.choice(statuses)}),
+            'search': lambda: client.get(
+                list_url, {'search': rng.choice(WORDS)[:4]}),
+            'ordering': lambda: client.get(
+                list_url, {'ordering': rng.choice(ORDERINGS)}),
+            'retrieve': lambda: client.get(
+                reverse('todo-detail', args=[rng.choice(ids)])),
+            'create': lambda: client.post(list_url, {
+                'title': f'Benchmark {rng.random()}',
+                'priority': rng.randint(1, 4),
+                'tags': [{'name': f'benchmark-tag-{rng.randrange(50)}'}],
+            }, format='json'),
+            'update_status': lambda: client.patch(
+                reverse('todo-update-status', args=[rng.choice(ids)]),
+                {'status': rng.choice(statuses)}, format='json'),
+            'completed': lambda: client.get(reverse('todo-completed')),
+            'overdue': lambda: client.get(reverse('todo-overdue')),
+        }
+
+        results = {}
+        for name in options['scenarios'] or SCENARIOS:
+            request = scenarios[name]
+
+            def call():
+                response = request()
+                if response.status_code >= 400:
+                    raise CommandError(
+                        f'{name} returned {response.status_code}: '
+                        f'{response.content[:200]!r}')
+
+            metrics = RequestMetrics()
+            with connection.execute_wrapper(metrics):
+                samples = measure(call, options['runs'], options['warmup'])
+            runs = options['runs'] + options['warmup']
+            results[name] = {
+                **summarize(samples),
+                'queries_per_request': round(metrics.queries / runs, 2),
+            }
+            self.stderr.write(f'{name}: {results[name]}')
+        return results
+
+    def compare(self, results, options):
+        with open(options['baseline']) as f:
+            baseline = json.load(f)
+        rows = compare(results, baseline.get('results', baseline),
+                       metric=options['metric'],
+                       threshold=options['threshold'])
+        regressions = []
+        for row in rows:
+            flag = 'REGRESSION' if row['regression'] else 'ok'
+            self.stderr.write(
+                f'{row["scenario"]:<14} {row["baseline"]:>10} -> '
+                f'{row["current"]:>10} {options["metric"]} '
+                f'(x{row["ratio"]}) {flag}')
+            if row['regression']:
+                regressions.append(row['scenario'])
+        if regressions:
+            raise CommandError(
+                f'{options["metric"]} regressed by more than '
+                f'{options["threshold"]:.0%}: {", ".join(regressions)}')
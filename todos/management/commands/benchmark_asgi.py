@@ -0,0 +1,199 @@
+import asyncio
+import json
+import random
+import time
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.backends.signals import connection_created
+from django.test.utils import override_settings
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+
+from todos.benchmarking import summarize
+from todos.models import Tag, Todo
+from todos.seeding import seed_todos
+
+User = get_user_model()
+
+SCENARIOS = ('list', 'filter', 'retrieve', 'completed', 'overdue', 'stats')
+MODES = {'sync': 'core.urls', 'async': 'core.async_urls'}
+PREFIX = 'asgi-benchmark'
+DUMMY_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'},
+}
+
+
+class Command(BaseCommand):
+    help = ('Compare the throughput of the sync DRF views and the async read '
+            'views through the ASGI application at several concurrency '
+            'limits, against a seeded dataset that is deleted afterwards')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--todos', type=int, default=2000,
+            help='Todos of the benchmarked user')
+        parser.add_argument('--requests', type=int, default=200,
+                            help='Requests per scenario, mode and limit')
+        parser.add_argument(
+            '--concurrency', type=int, action='append',
+            help='Requests in flight at once (repeatable, default 1, 8, 32)')
+        parser.add_argument(
+            '--db-latency', type=float, default=0,
+            help='Milliseconds added to every query to simulate a database '
+                 'server over the network')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--scenario', action='append', dest='scenarios',
+            choices=SCENARIOS, help='Only run this scenario (repeatable)')
+        parser.add_argument(
+            '--with-cache', action='store_true',
+            help='Keep the configured cache instead of measuring uncached '
+                 'responses')
+        parser.add_argument('--output', help='Write the JSON results here')
+
+    def handle(self, *args, **options):
+        # ASGI requests run on their own threads and connections, so the
+        # dataset has to be committed; it is deleted again at the end.
+        if User.objects.filter(username__startswith=f'{PREFIX}-').exists():
+            raise CommandError(
+                f'Users named {PREFIX}-* exist; remove them first.')
+        if getattr(settings, 'TODO_ASYNC_VIEWS', False):
+            raise CommandError(
+                'TODO_ASYNC_VIEWS is set; unset it to benchmark the sync '
+                'views.')
+        overrides = {'ALLOWED_HOSTS': ['testserver']}
+        if not options['with_cache']:
+            overrides['CACHES'] = DUMMY_CACHES
+
+        latency = options['db_latency'] / 1000
+
+        def delay(execute, sql, params, many, context):
+            time.sleep(latency)
+            return execute(sql, params, many, context)
+
+        def add_latency(connection, **kwargs):
+            connection.execute_wrappers.append(delay)
+
+        try:
+            user = seed_todos(
+                users=1, todos_per_user=options['todos'],
+                seed=options['seed'], prefix=PREFIX,
+                progress=lambda done, total: self.stderr.write(
+                    f'Seeded {done}/{total} todos'))[0]
+            token = Token.objects.create(user=user)
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+            if latency:
+                connection_created.connect(add_latency)
+            with override_settings(**overrides):
+                results = {
+                    'config': {
+                        key: options[key] for key in
+                        ('todos', 'requests', 'db_latency', 'seed',
+                         'with_cache')
+                    },
+                    'results': asyncio.run(self.run(user, token, options)),
+                }
+        finally:
+            connection_created.disconnect(add_latency)
+            User.objects.filter(username__startswith=f'{PREFIX}-').delete()
+            Tag.objects.filter(name__startswith=f'{PREFIX}-').delete()
+
+        output = json.dumps(results, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output + '\n')
+        else:
+            self.stdout.write(output)
+
+    async def run(self, user, token, options):
+        rng = random.Random(options['seed'])
+        ids = [pk async for pk in Todo.objects.filter(
+            user=user).values_list('pk', flat=True)]
+        headers = [(b'host', b'testserver'),
+                   (b'authorization', f'Token {token.key}'.encode())]
+        scenarios = {
+            'list': lambda: (reverse('todo-list'), {}),
+            'filter': lambda: (reverse('todo-list'), {
+                'priority': rng.randint(1, 4), 'status': 'pending'}),
+            'retrieve': lambda: (
+                reverse('todo-detail', args=[rng.choice(ids)]), {}),
+            'completed': lambda: (reverse('todo-completed'), {}),
+            'overdue': lambda: (reverse('todo-overdue'), {}),
+            'stats': lambda: (reverse('todo-stats'), {}),
+        }
+
+        results = {}
+        for name in options['scenarios'] or SCENARIOS:
+            results[name] = {}
+            for mode, urlconf in MODES.items():
+                with override_settings(ROOT_URLCONF=urlconf):
+                    application = get_asgi_application()
+                    for limit in options['concurrency'] or [1, 8, 32]:
+                        requests = [scenarios[name]()
+                                    for _ in range(options['requests'])]
+                        # One request per path first, outside the timing.
+                        await self.get(application, headers, *requests[0])
+                        summary = await self.drive(
+                            application, headers, requests, limit)
+                        results[name].setdefault(mode, {})[limit] = summary
+                        self.stderr.write(
+                            f'{name} {mode} x{limit}: '
+                            f'{summary["throughput_per_s"]} req/s, '
+                            f'p95 {summary["p95_ms"]} ms')
+        return results
+
+    async def drive(self, application, headers, requests, limit):
+        """Send ``requests`` with at most ``limit`` of them in flight."""
+        semaphore = asyncio.Semaphore(limit)
+        samples = []
+
+        async def send(path, params):
+            async with semaphore:
+                start = time.perf_counter()
+                await self.get(application, headers, path, params)
+                samples.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(send(*request) for request in requests))
+        elapsed = time.perf_counter() - start
+        return {
+            **summarize(samples),
+            'throughput_per_s': round(len(samples) / elapsed, 1),
+        }
+
+    async def get(self, application, headers, path, params):
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'},
+            'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+            'path': path, 'raw_path': path.encode(), 'root_path': '',
+            'query_string': urlencode(params).encode(), 'headers': headers,
+            'client': ('127.0.0.1', 0), 'server': ('testserver', 80),
+        }
+        done = asyncio.Event()
+        request_sent = False
+        status = None
+
+        async def receive():
+            nonlocal request_sent
+            if not request_sent:
+                request_sent = True
+                return {'type': 'http.request', 'body': b''}
+            await done.wait()
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            elif not message.get('more_body'):
+                done.set()
+
+        await application(scope, receive, send)
+        if status >= 400:
+            raise CommandError(f'GET {path} returned {status}.')
@@ -0,0 +1,101 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+
+from core.compression import ENCODERS
+from todos.benchmarking import compare, measure, summarize
+from todos.models import Todo
+from todos.renderers import FastJSONRenderer
+from todos.seeding import seed_todos
+from todos.serializers import TodoReadSerializer, with_attachment_count
+
+RENDERERS = (JSONRenderer, FastJSONRenderer)
+
+
+class Command(BaseCommand):
+    help = ('Measure render time of the JSON renderers and bytes on the wire '
+            'of each content-coding for list pages of a seeded dataset that '
+            'is rolled back afterwards')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes', type=int, nargs='+', default=[10, 100, 1000],
+            help='Todos per list page')
+        parser.add_argument('--runs', type=int, default=50)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='Write the JSON results here')
+        parser.add_argument(
+            '--baseline', help='JSON results of an earlier run to compare')
+        parser.add_argument('--threshold', type=float, default=0.2,
+                            help='Allowed render slowdown against the '
+                                 'baseline (0.2 = 20%%)')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            user = seed_todos(
+                users=1, todos_per_user=max(options['sizes']),
+                seed=options['seed'], prefix='render-benchmark')[0]
+            rows = with_attachment_count(
+                Todo.objects.filter(user=user).order_by('-priority', 'id')
+            ).values(*TodoReadSerializer.VALUE_FIELDS, 'attachment_count')
+            results = {'render': {}, 'compress': {}, 'bytes': {}}
+            for size in options['sizes']:
+                self.run(results, size, {
+                    'count': max(options['sizes']),
+                    'next': 'http://testserver/api/todos/?page=2',
+                    'previous': None,
+                    'results': TodoReadSerializer(
+                        rows[:size], user=user).data,
+                }, options['runs'])
+            transaction.set_rollback(True)
+
+        output = json.dumps(results, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output + '\n')
+        else:
+            self.stdout.write(output)
+
+        if options['baseline']:
+            self.compare(results['render'], options)
+
+    def run(self, results, size, data, runs):
+        contents = set()
+        for renderer_class in RENDERERS:
+            renderer = renderer_class()
+            name = f'{renderer_class.__name__}-{size}'
+            results['render'][name] = summarize(
+                measure(lambda: renderer.render(data), runs, warmup=3))
+            contents.add(renderer.render(data))
+            self.stderr.write(f'{name}: {results["render"][name]}')
+        if len(contents) != 1:
+            raise CommandError(f'The renderers disagree on {size} todos.')
+
+        content = contents.pop()
+        sizes = results['bytes'][str(size)] = {'identity': len(content)}
+        for coding, encode in ENCODERS.items():
+            name = f'{coding}-{size}'
+            results['compress'][name] = summarize(
+                measure(lambda: encode(content), runs, warmup=3))
+            sizes[coding] = len(encode(content))
+        self.stderr.write(f'bytes-{size}: {sizes}')
+
+    def compare(self, results, options):
+        with open(options['baseline']) as f:
+            baseline = json.load(f)
+        rows = compare(results, baseline.get('render', baseline),
+                       threshold=options['threshold'])
+        regressions = []
+        for row in rows:
+            flag = 'REGRESSION' if row['regression'] else 'ok'
+            self.stderr.write(
+                f'{row["scenario"]:<24} {row["baseline"]:>10} -> '
+                f'{row["current"]:>10} p95_ms (x{row["ratio"]}) {flag}')
+            if row['regression']:
+                regressions.append(row['scenario'])
+        if regressions:
+            raise CommandError(
+                f'Rendering regressed by more than '
+                f'{options["threshold"]:.0%}: {", ".join(regressions)}')
@@ -0,0 +1,117 @@
+import itertools
+import json
+import random
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from todos.benchmarking import measure, summarize
+from todos.models import Todo
+from todos.search import LikeSearchBackend, get_search_backend
+
+User = get_user_model()
+
+SYLLABLES = ('ka', 'lo', 'mi', 'ra', 'tu', 'ne', 'so', 'vi', 'del', 'por',
+             'gan', 'tes', 'bri', 'cor', 'fen', 'mul')
+
+
+def build_vocabulary(rng, size):
+    words = set()
+    while len(words) < size:
+        words.add(''.join(rng.choices(SYLLABLES, k=rng.randint(2, 4))))
+    return sorted(words)
+
+
+class Command(BaseCommand):
+    help = ('Seed todos inside a rolled-back transaction and compare search '
+            'latency of the full-text backend against icontains')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1_000_000)
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--queries', type=int, default=200)
+        parser.add_argument('--batch-size', type=int, default=10_000)
+        parser.add_argument('--vocabulary', type=int, default=20_000)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        vocabulary = build_vocabulary(rng, options['vocabulary'])
+        # Zipf-like word frequencies, as in natural text.
+        weights = list(itertools.accumulate(
+            1 / rank for rank in range(1, len(vocabulary) + 1)))
+        with transaction.atomic():
+            users = self.seed(rng, options, vocabulary, weights)
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+            backends = {
+                'index': get_search_backend(),
+                'icontains': LikeSearchBackend(),
+            }
+            # Search terms drawn from the head of the distribution, typed
+            # partially as a user would in a search-as-you-type box.
+            head = vocabulary[:len(vocabulary) // 20]
+            queries = [
+                (rng.choice(users), ' '.join(
+                    word[:max(3, len(word) - rng.randint(0, 2))]
+                    for word in rng.sample(head, rng.randint(1, 2))))
+                for _ in range(options['queries'])
+            ]
+            results = {
+                'rows': options['rows'],
+                'users': options['users'],
+                'backends': {},
+            }
+            for name, backend in backends.items():
+                iterator = iter(queries)
+
+                def run():
+                    # Same work as the list endpoint: a count and one page.
+                    user, query = next(iterator)
+                    queryset = backend.search(
+                        Todo.objects.filter(user=user), query,
+                        user_id=user.pk)
+                    if backend.ranked:
+                        queryset = queryset.order_by('-search_rank', '-id')
+                    else:
+                        queryset = queryset.order_by(
+                            '-priority', 'due_date', 'id')
+                    queryset.count()
+                    list(queryset[:10])
+
+                results['backends'][name] = {
+                    'class': type(backend).__name__,
+                    **summarize(measure(run, len(queries))),
+                }
+            transaction.set_rollback(True)
+        self.stdout.write(json.dumps(results, indent=2))
+
+    def seed(self, rng, options, vocabulary, weights):
+        users = [
+            User(username=f'search-bench-{i}')
+            for i in range(options['users'])
+        ]
+        User.objects.bulk_create(users)
+        users = list(User.objects.filter(username__startswith='search-bench-'))
+
+        remaining = options['rows']
+        while remaining > 0:
+            size = min(options['batch_size'], remaining)
+            Todo.objects.bulk_create([
+                Todo(
+                    user=rng.choice(users),
+                    title=' '.join(rng.choices(
+                        vocabulary, cum_weights=weights,
+                        k=rng.randint(2, 6))),
+                    description=' '.join(rng.choices(
+                        vocabulary, cum_weights=weights,
+                        k=rng.randint(5, 40))),
+                    priority=rng.randint(1, 4),
+                )
+                for _ in range(size)
+            ])
+            remaining -= size
+            self.stderr.write(
+                f'Seeded {options["rows"] - remaining}/{options["rows"]}')
+        return users
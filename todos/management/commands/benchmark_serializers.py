@@ -0,0 +1,55 @@
+import json
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Prefetch
+
+from todos.benchmarking import measure, summarize
+from todos.models import Tag, Todo
+from todos.seeding import seed_todos
+from todos.serializers import (TodoListSerializer, TodoReadSerializer,
+                               with_attachment_count)
+
+
+class Command(BaseCommand):
+    help = ('Compare rows/sec of TodoListSerializer and TodoReadSerializer '
+            'on list pages of a seeded dataset that is rolled back afterwards')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--todos', type=int, default=5000)
+        parser.add_argument('--page-size', type=int, default=100)
+        parser.add_argument('--runs', type=int, default=50)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        page_size = options['page_size']
+        with transaction.atomic():
+            user = seed_todos(
+                users=1, todos_per_user=options['todos'], seed=options['seed'],
+                prefix='serializer-benchmark')[0]
+            todos = Todo.objects.filter(user=user).order_by('-priority', 'id')
+
+            def model_serializer():
+                page = todos.select_related('user').prefetch_related(
+                    Prefetch('tags', queryset=Tag.objects.order_by('pk')))
+                return TodoListSerializer(
+                    with_attachment_count(page)[:page_size], many=True).data
+
+            def read_serializer():
+                page = with_attachment_count(todos).values(
+                    *TodoReadSerializer.VALUE_FIELDS, 'attachment_count')
+                return TodoReadSerializer(page[:page_size], user=user).data
+
+            results = {}
+            for name, func in (('TodoListSerializer', model_serializer),
+                               ('TodoReadSerializer', read_serializer)):
+                summary = summarize(measure(func, options['runs'], warmup=3))
+                summary['rows_per_s'] = round(
+                    summary['throughput_per_s'] * page_size)
+                results[name] = summary
+            transaction.set_rollback(True)
+
+        results['speedup'] = round(
+            results['TodoReadSerializer']['rows_per_s'] /
+            results['TodoListSerializer']['rows_per_s'], 2)
+        self.stdout.write(json.dumps(results, indent=2))
@@ -0,0 +1,68 @@
+import itertools
+import json
+from types import SimpleNamespace
+
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+from rest_framework import throttling
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from todos.benchmarking import measure, summarize
+from todos.throttles import UserRateThrottle
+
+BACKENDS = {
+    'local': 'todos.throttles.LocalRateLimiter',
+    'redis': 'todos.throttles.RedisRateLimiter',
+}
+
+
+class Command(BaseCommand):
+    help = ('Measure throttle checks/sec of DRF\'s cache-backed '
+            'UserRateThrottle and of the GCRA rate limiters')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=10000)
+        parser.add_argument('--warmup', type=int, default=100)
+        parser.add_argument(
+            '--rate', default='1000/minute',
+            help='Throttle rate; checks past it are denied')
+        parser.add_argument(
+            '--clients', type=int, default=50,
+            help='Users the checks rotate through')
+        parser.add_argument(
+            '--backend', action='append', dest='backends',
+            choices=('cache', *BACKENDS),
+            help='Only measure this throttle (repeatable); redis needs the '
+                 'TODO_THROTTLE_CACHE cache to be a Redis one')
+
+    def handle(self, *args, **options):
+        factory = APIRequestFactory()
+        requests = []
+        for pk in range(options['clients']):
+            request = Request(factory.get('/api/todos/'))
+            request.user = SimpleNamespace(pk=pk, is_authenticated=True)
+            requests.append(request)
+
+        results = {}
+        for name in options['backends'] or ('cache', 'local'):
+            base = (throttling.UserRateThrottle if name == 'cache'
+                    else UserRateThrottle)
+            throttle_class = type('BenchmarkThrottle', (base,), {
+                'rate': options['rate'], 'scope': f'benchmark-{name}'})
+            cycle = itertools.cycle(requests)
+            allowed = 0
+
+            def check():
+                nonlocal allowed
+                allowed += throttle_class().allow_request(next(cycle), None)
+
+            backend = BACKENDS.get(name, BACKENDS['local'])
+            with override_settings(TODO_THROTTLE_BACKEND=backend):
+                summary = summarize(
+                    measure(check, options['runs'], options['warmup']))
+            summary['checks_per_s'] = summary.pop('throughput_per_s')
+            summary['allowed'] = allowed
+            results[name] = summary
+            self.stderr.write(f'{name}: {summary}')
+        self.stdout.write(json.dumps(results, indent=2))
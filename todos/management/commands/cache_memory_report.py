@@ -0,0 +1,118 @@
+import json
+import re
+
+from django.core.management.base import BaseCommand, CommandError
+
+try:
+    from django_redis import get_redis_connection
+except ImportError:  # pragma: no cover
+    get_redis_connection = None
+
+# Django's '<KEY_PREFIX>:<version>:' in front of cache keys.
+DJANGO_PREFIX = re.compile(r'^[^:]*:\d+:')
+DIGITS = re.compile(r'\d')
+
+
+def key_pattern(key):
+    """
+    Group a Redis key with keys of the same kind: Django's key prefix is
+    dropped and segments with digits (ids, generations, digests) become *.
+    """
+    if isinstance(key, bytes):
+        key = key.decode('utf-8', 'replace')
+    key = DJANGO_PREFIX.sub('', key)
+    return ':'.join(
+        '*' if DIGITS.search(segment) else segment
+        for segment in key.split(':'))
+
+
+def memory_by_prefix(client, match='*', count=1000):
+    """
+    Return ``{pattern: {'keys': n, 'bytes': total}}`` from ``MEMORY USAGE``
+    of every key matching ``match``, scanned ``count`` keys at a time.
+    """
+    report = {}
+    batch = []
+
+    def flush():
+        pipeline = client.pipeline(transaction=False)
+        for key in batch:
+            pipeline.memory_usage(key)
+        for key, size in zip(batch, pipeline.execute()):
+            entry = report.setdefault(
+                key_pattern(key), {'keys': 0, 'bytes': 0})
+            entry['keys'] += 1
+            # The key may have expired since it was scanned.
+            entry['bytes'] += size or 0
+        batch.clear()
+
+    for key in client.scan_iter(match=match, count=count):
+        batch.append(key)
+        if len(batch) >= count:
+            flush()
+    if batch:
+        flush()
+    return dict(sorted(
+        report.items(), key=lambda item: item[1]['bytes'], reverse=True))
+
+
+class Command(BaseCommand):
+    help = ('Report the Redis memory used by a cache\'s keys, grouped by '
+            'key prefix, and compare it with an earlier report')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--alias', default='default',
+            help='Cache alias; its backend must be a Redis one')
+        parser.add_argument('--match', default='*',
+                            help='Only report keys matching this pattern')
+        parser.add_argument('--count', type=int, default=1000,
+                            help='Keys per SCAN and MEMORY USAGE batch')
+        parser.add_argument('--output', help='Write the JSON report here')
+        parser.add_argument(
+            '--baseline', help='JSON report of an earlier run to compare')
+
+    def handle(self, *args, **options):
+        if get_redis_connection is None:
+            raise CommandError('django-redis is not installed.')
+        try:
+            client = get_redis_connection(options['alias'])
+        except NotImplementedError:
+            raise CommandError(
+                f'The {options["alias"]} cache does not use Redis.')
+        prefixes = memory_by_prefix(
+            client, options['match'], options['count'])
+        results = {
+            'alias': options['alias'],
+            'keys': sum(entry['keys'] for entry in prefixes.values()),
+            'bytes': sum(entry['bytes'] for entry in prefixes.values()),
+            'prefixes': prefixes,
+        }
+
+        output = json.dumps(results, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output + '\n')
+        else:
+            self.stdout.write(output)
+
+        if options['baseline']:
+            self.compare(results, options)
+
+    def compare(self, results, options):
+        with open(options['baseline']) as f:
+            baseline = json.load(f)
+        before = baseline['prefixes']
+        after = results['prefixes']
+        rows = [('total', baseline, results)] + [
+            (pattern, before.get(pattern, {}), after.get(pattern, {}))
+            for pattern in {**before, **after}]
+        for pattern, old, new in rows:
+            old_bytes = old.get('bytes', 0)
+            new_bytes = new.get('bytes', 0)
+            ratio = (f'x{new_bytes / old_bytes:.3f}' if old_bytes
+                     else 'new')
+            self.stderr.write(
+                f'{pattern:<40} {old_bytes:>12} -> {new_bytes:>12} bytes '
+                f'({old.get("keys", 0)} -> {new.get("keys", 0)} keys, '
+                f'{ratio})')
@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand
+
+from todos.models import TodoStat
+from todos.stats import compute_counters, read_rollup, rebuild_user_stats
+
+
+class Command(BaseCommand):
+    help = ('Compare the todo statistics rollup with the todos table, report '
+            'drift and rebuild the affected rollups')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user', type=int, action='append', dest='users',
+            help='Only check this user id (repeatable); builds the rollup '
+                 'if it does not exist yet')
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Report drift without rebuilding')
+
+    def handle(self, *args, **options):
+        user_ids = options['users'] or TodoStat.objects.filter(
+            dimension='total', key='').order_by('user_id').values_list(
+            'user_id', flat=True)
+
+        checked = drifted = 0
+        for user_id in user_ids:
+            checked += 1
+            stored = read_rollup(user_id)
+            actual = compute_counters(user_id)
+            drift = sorted(
+                (key, stored.get(key, 0), actual.get(key, 0))
+                for key in set(stored) | set(actual)
+                if stored.get(key, 0) != actual.get(key, 0)
+            )
+            if not drift:
+                continue
+            drifted += 1
+            for (dimension, key), expected, found in drift:
+                self.stdout.write(
+                    f'user {user_id} {dimension}:{key} rollup={expected} '
+                    f'actual={found}')
+            if not options['dry_run']:
+                rebuild_user_stats(user_id)
+
+        action = 'found' if options['dry_run'] else 'rebuilt'
+        self.stdout.write(
+            f'Checked {checked} user(s), {action} {drifted} with drift')
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from todos.sync import compact_tombstones, get_tombstone_days
+
+
+class Command(BaseCommand):
+    help = ('Delete sync tombstones older than TODO_SYNC_TOMBSTONE_DAYS and '
+            'those of deleted users')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Tombstones deleted per query')
+
+    def handle(self, *args, **options):
+        deleted = compact_tombstones(batch_size=options['batch_size'])
+        self.stdout.write(
+            f'Deleted {deleted} tombstone(s) older than '
+            f'{get_tombstone_days()} day(s)')
@@ -0,0 +1,82 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import django
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from todos.export import DEFAULT_CHUNK_SIZE, FORMATS, export_user
+
+User = get_user_model()
+
+
+def _init_worker():
+    # Spawned workers start without Django configured; forked ones must not
+    # reuse the parent's database sockets.
+    django.setup()
+    connections.close_all()
+
+
+def _export(user_id, path, format, chunk_size):
+    return user_id, export_user(user_id, path, format, chunk_size)
+
+
+def _export_in_worker(*job):
+    try:
+        return _export(*job)
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = "Export every user's todos to one file per user"
+
+    def add_arguments(self, parser):
+        parser.add_argument('output_dir')
+        parser.add_argument(
+            '--format', choices=sorted(FORMATS), default='ndjson')
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count() or 1,
+            help='Worker processes; 1 exports in this process')
+        parser.add_argument(
+            '--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+            help='Rows fetched per database round trip')
+        parser.add_argument(
+            '--user', type=int, action='append', dest='users',
+            help='Only export this user id (repeatable)')
+
+    def handle(self, *args, **options):
+        os.makedirs(options['output_dir'], exist_ok=True)
+        user_ids = options['users'] or list(
+            User.objects.filter(todos__isnull=False).distinct().order_by(
+                'pk').values_list('pk', flat=True))
+        jobs = [
+            (user_id,
+             os.path.join(options['output_dir'],
+                          f'{user_id}.{options["format"]}'),
+             options['format'], options['chunk_size'])
+            for user_id in user_ids
+        ]
+
+        total = 0
+        if options['workers'] <= 1:
+            results = (_export(*job) for job in jobs)
+        else:
+            # Children must open their own connections.
+            connections.close_all()
+            executor = ProcessPoolExecutor(
+                max_workers=options['workers'], initializer=_init_worker)
+            futures = [executor.submit(_export_in_worker, *job)
+                       for job in jobs]
+            results = (future.result() for future in as_completed(futures))
+        try:
+            for user_id, rows in results:
+                total += rows
+                self.stdout.write(f'user {user_id}: {rows} todo(s)')
+        finally:
+            if options['workers'] > 1:
+                executor.shutdown()
+        self.stdout.write(
+            f'Exported {total} todo(s) for {len(jobs)} user(s) to '
+            f'{options["output_dir"]}')
@@ -0,0 +1,89 @@
+import os
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from todos.imports import import_todos, open_text
+from todos.models import TodoImport
+from todos.serializers import TodoImportUploadSerializer
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = ("Import todos from an NDJSON or CSV file into a user's list in "
+            "chunked transactions")
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--user', help='Owner id or username')
+        parser.add_argument(
+            '--format', choices=[value for value, _ in
+                                 TodoImport.FORMAT_CHOICES],
+            help='Defaults to the file extension')
+        parser.add_argument(
+            '--chunk-size', type=int,
+            help='Rows per transaction (default TODO_IMPORT_CHUNK_SIZE)')
+        parser.add_argument(
+            '--resume', type=int, metavar='JOB',
+            help='Continue this interrupted import of the same file')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        size = os.path.getsize(path)
+        if options['resume']:
+            job = TodoImport.objects.filter(pk=options['resume']).first()
+            if job is None or job.status == 'completed':
+                raise CommandError(
+                    f'No unfinished import {options["resume"]}.')
+            if job.source_size is not None and size != job.source_size:
+                raise CommandError(
+                    f'{path} is not the file import {job.pk} started with.')
+            job.status = 'running'
+            job.save(update_fields=['status', 'updated_at'])
+            self.stderr.write(
+                f'Resuming import {job.pk} after line {job.position}')
+        else:
+            job = TodoImport.objects.create(
+                user=self.get_user(options['user']),
+                format=options['format'] or self.guess_format(path),
+                source=os.path.basename(path)[:255],
+                source_size=size,
+            )
+            self.stderr.write(f'Started import {job.pk}')
+
+        with open(path, 'rb') as f:
+            job = import_todos(
+                job, open_text(f), chunk_size=options['chunk_size'],
+                progress=lambda job: self.stderr.write(
+                    f'Imported {job.imported}, rejected {job.failed} '
+                    f'(line {job.position})'))
+
+        for error in job.errors:
+            self.stderr.write(f'line {error["line"]}: {error["errors"]}')
+        if job.failed > len(job.errors):
+            self.stderr.write(
+                f'... {job.failed - len(job.errors)} more rejected row(s)')
+        self.stdout.write(
+            f'Import {job.pk} {job.status}: {job.imported} imported, '
+            f'{job.failed} rejected, {job.rows_per_second} rows/s')
+        if job.status != 'completed':
+            raise CommandError(
+                f'Import {job.pk} stopped at line {job.position}; rerun with '
+                f'--resume {job.pk}.')
+
+    def get_user(self, value):
+        if not value:
+            raise CommandError('--user is required for a new import.')
+        lookup = {'pk': value} if value.isdigit() else {'username': value}
+        try:
+            return User.objects.get(**lookup)
+        except User.DoesNotExist:
+            raise CommandError(f'User {value!r} does not exist.')
+
+    def guess_format(self, path):
+        extension = os.path.splitext(path)[1].lower()
+        if extension not in TodoImportUploadSerializer.EXTENSIONS:
+            raise CommandError(
+                'Cannot tell the format from the file name; pass --format.')
+        return TodoImportUploadSerializer.EXTENSIONS[extension]
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from todos.uploads import get_upload_expiry_hours, purge_uploads
+
+
+class Command(BaseCommand):
+    help = ('Delete attachment uploads left unfinished for '
+            'TODO_UPLOAD_EXPIRY_HOURS, with their chunks')
+
+    def handle(self, *args, **options):
+        deleted = purge_uploads()
+        self.stdout.write(
+            f'Deleted {deleted} upload(s) idle for more than '
+            f'{get_upload_expiry_hours()} hour(s)')
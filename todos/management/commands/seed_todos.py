@@ -0,0 +1,69 @@
+from datetime import datetime
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from todos.models import Tag
+from todos.seeding import seed_todos
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = 'Generate a deterministic dataset of users, tags, todos and attachments'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10)
+        parser.add_argument(
+            '--todos', type=int, default=1000, help='Todos per user')
+        parser.add_argument('--tags', type=int, default=50)
+        parser.add_argument('--max-tags-per-todo', type=int, default=3)
+        parser.add_argument(
+            '--attachment-ratio', type=float, default=0.05,
+            help='Fraction of todos with an attachment row')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--prefix', default='seed',
+            help='Prefix of generated usernames and tag names')
+        parser.add_argument(
+            '--anchor', type=datetime.fromisoformat,
+            help='Date the generated dates are relative to (ISO format, '
+                 'defaults to midnight UTC today)')
+        parser.add_argument('--batch-size', type=int, default=2000)
+        parser.add_argument(
+            '--flush', action='store_true',
+            help='Delete data previously seeded with the same prefix first')
+
+    def handle(self, *args, **options):
+        prefix = options['prefix']
+        existing = User.objects.filter(username__startswith=f'{prefix}-user-')
+        anchor = options['anchor']
+        if anchor is not None and timezone.is_naive(anchor):
+            anchor = timezone.make_aware(anchor)
+
+        with transaction.atomic():
+            if options['flush']:
+                existing.delete()
+                Tag.objects.filter(name__startswith=f'{prefix}-tag-').delete()
+            elif existing.exists():
+                raise CommandError(
+                    f'Users prefixed {prefix!r} already exist; pass --flush '
+                    f'or a different --prefix.')
+
+            users = seed_todos(
+                users=options['users'],
+                todos_per_user=options['todos'],
+                tags=options['tags'],
+                max_tags_per_todo=options['max_tags_per_todo'],
+                attachment_ratio=options['attachment_ratio'],
+                seed=options['seed'],
+                prefix=prefix,
+                anchor=anchor,
+                batch_size=options['batch_size'],
+                progress=lambda done, total: self.stderr.write(
+                    f'Seeded {done}/{total} todos'),
+            )
+        self.stdout.write(
+            f'Seeded {len(users)} user(s) with {options["todos"]} todos each')
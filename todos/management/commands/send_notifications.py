@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from todos.notifications import deliver_pending
+
+
+class Command(BaseCommand):
+    help = 'Deliver queued todo notifications from the outbox'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=100,
+            help='Notifications claimed and sent per mail connection')
+        parser.add_argument(
+            '--workers', type=int, default=1,
+            help='Number of concurrent delivery threads')
+        parser.add_argument(
+            '--interval', type=float, default=5.0,
+            help='Seconds to sleep when the outbox is empty')
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Drain the outbox once and exit')
+
+    def handle(self, *args, **options):
+        while True:
+            sent = deliver_pending(
+                batch_size=options['batch_size'], workers=options['workers'])
+            if sent:
+                self.stdout.write(f'Sent {sent} notification(s)')
+            if options['once']:
+                return
+            if not sent:
+                time.sleep(options['interval'])
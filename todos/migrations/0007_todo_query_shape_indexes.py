@@ -0,0 +1,23 @@
+# Generated by Django 5.2 on 2026-10-17 21:45
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('todos', '0006_todo_keyset_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='todo',
+            index=models.Index(fields=['user', 'status', '-priority', 'due_date', 'id'], name='todo_user_status_order_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='todo',
+            index=models.Index(condition=models.Q(('due_date__isnull', False), ('status__in', ['pending', 'in_progress'])), fields=['user', '-priority', 'due_date', 'id'], name='todo_user_open_due_idx'),
+        ),
+    ]
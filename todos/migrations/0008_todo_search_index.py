@@ -0,0 +1,111 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+SQLITE_FORWARD = [
+    """
+    CREATE VIRTUAL TABLE todos_todo_fts USING fts5(
+        title, description, owner,
+        content='', prefix='2 3 4 5 6',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    # Rank title matches above description matches; the owner token only
+    # scopes results and must not contribute to the score.
+    """
+    INSERT INTO todos_todo_fts(todos_todo_fts, rank)
+    VALUES ('rank', 'bm25(2.0, 1.0, 0.0)')
+    """,
+    """
+    INSERT INTO todos_todo_fts(rowid, title, description, owner)
+    SELECT id, title, coalesce(description, ''), 'u' || user_id
+    FROM todos_todo
+    """,
+    """
+    CREATE TRIGGER todos_todo_fts_insert AFTER INSERT ON todos_todo BEGIN
+        INSERT INTO todos_todo_fts(rowid, title, description, owner)
+        VALUES (new.id, new.title, coalesce(new.description, ''),
+                'u' || new.user_id);
+    END
+    """,
+    """
+    CREATE TRIGGER todos_todo_fts_delete AFTER DELETE ON todos_todo BEGIN
+        INSERT INTO todos_todo_fts(todos_todo_fts, rowid, title, description,
+                                   owner)
+        VALUES ('delete', old.id, old.title, coalesce(old.description, ''),
+                'u' || old.user_id);
+    END
+    """,
+    """
+    CREATE TRIGGER todos_todo_fts_update
+    AFTER UPDATE OF title, description, user_id ON todos_todo BEGIN
+        INSERT INTO todos_todo_fts(todos_todo_fts, rowid, title, description,
+                                   owner)
+        VALUES ('delete', old.id, old.title, coalesce(old.description, ''),
+                'u' || old.user_id);
+        INSERT INTO todos_todo_fts(rowid, title, description, owner)
+        VALUES (new.id, new.title, coalesce(new.description, ''),
+                'u' || new.user_id);
+    END
+    """,
+]
+
+SQLITE_BACKWARD = [
+    'DROP TRIGGER IF EXISTS todos_todo_fts_update',
+    'DROP TRIGGER IF EXISTS todos_todo_fts_delete',
+    'DROP TRIGGER IF EXISTS todos_todo_fts_insert',
+    'DROP TABLE IF EXISTS todos_todo_fts',
+]
+
+POSTGRES_FORWARD = [
+    """
+    CREATE INDEX todo_search_document_idx ON todos_todo USING GIN (
+        to_tsvector('simple', coalesce("todos_todo"."title", '') || ' ' ||
+                              coalesce("todos_todo"."description", ''))
+    )
+    """,
+    """
+    CREATE INDEX todo_search_title_idx ON todos_todo USING GIN (
+        to_tsvector('simple', coalesce("todos_todo"."title", ''))
+    )
+    """,
+]
+
+POSTGRES_BACKWARD = [
+    'DROP INDEX IF EXISTS todo_search_title_idx',
+    'DROP INDEX IF EXISTS todo_search_document_idx',
+]
+
+
+def run(statements):
+    def operation(apps, schema_editor):
+        vendor = schema_editor.connection.vendor
+        for statement in statements.get(vendor, []):
+            schema_editor.execute(statement)
+    return operation
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('todos', '0007_todo_query_shape_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run({'sqlite': SQLITE_FORWARD, 'postgresql': POSTGRES_FORWARD}),
+            run({'sqlite': SQLITE_BACKWARD,
+                 'postgresql': POSTGRES_BACKWARD}),
+        ),
+        migrations.CreateModel(
+            name='TodoSearchIndex',
+            fields=[
+                ('todo', models.OneToOneField(db_column='rowid', on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='search_index', serialize=False, to='todos.todo')),
+                ('document', models.TextField(db_column='todos_todo_fts')),
+                ('rank', models.FloatField()),
+            ],
+            options={
+                'db_table': 'todos_todo_fts',
+                'managed': False,
+            },
+        ),
+    ]
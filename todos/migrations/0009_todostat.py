@@ -0,0 +1,29 @@
+# Generated by Django 5.2 on 2026-10-17 22:47
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('todos', '0008_todo_search_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TodoStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dimension', models.CharField(max_length=20, verbose_name='Dimension')),
+                ('key', models.CharField(blank=True, max_length=50, verbose_name='Key')),
+                ('count', models.IntegerField(default=0, verbose_name='Count')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='todo_stats', to=settings.AUTH_USER_MODEL, verbose_name='User')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('user', 'dimension', 'key'), name='todo_stat_unique')],
+            },
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.2 on 2026-10-17 23:05
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('todos', '0009_todostat'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        # ``default`` only exists in Python. A database operation would make
+        # SQLite rebuild todos_todo and drop the search triggers of 0008.
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AlterField(
+                    model_name='todo',
+                    name='created_at',
+                    field=models.DateTimeField(default=django.utils.timezone.now, editable=False, verbose_name='Created At'),
+                ),
+            ],
+        ),
+        migrations.CreateModel(
+            name='TodoImport',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('format', models.CharField(choices=[('ndjson', 'NDJSON'), ('csv', 'CSV')], max_length=10, verbose_name='Format')),
+                ('source', models.CharField(blank=True, max_length=255, verbose_name='Source')),
+                ('source_size', models.BigIntegerField(blank=True, null=True, verbose_name='Source Size')),
+                ('status', models.CharField(choices=[('running', 'Running'), ('completed', 'Completed'), ('failed', 'Failed')], default='running', max_length=20, verbose_name='Status')),
+                ('position', models.PositiveBigIntegerField(default=0, verbose_name='Position')),
+                ('imported', models.PositiveIntegerField(default=0, verbose_name='Imported')),
+                ('failed', models.PositiveIntegerField(default=0, verbose_name='Failed')),
+                ('errors', models.JSONField(blank=True, default=list, verbose_name='Errors')),
+                ('duration', models.FloatField(default=0, verbose_name='Duration')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Created At')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Updated At')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='todo_imports', to=settings.AUTH_USER_MODEL, verbose_name='User')),
+            ],
+        ),
+    ]
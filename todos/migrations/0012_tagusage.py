@@ -0,0 +1,47 @@
+# Generated by Django 5.2 on 2026-10-17 23:40
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Max
+
+
+def backfill(apps, schema_editor):
+    # Existing links have no date; the latest change to one of the todos
+    # stands in for when the tag was last used.
+    Todo = apps.get_model('todos', 'Todo')
+    TagUsage = apps.get_model('todos', 'TagUsage')
+    rows = Todo.tags.through.objects.order_by().values(
+        'todo__user_id', 'tag_id').annotate(
+        count=Count('id'), last_used_at=Max('todo__updated_at'))
+    TagUsage.objects.bulk_create(
+        (TagUsage(user_id=row['todo__user_id'], tag_id=row['tag_id'],
+                  count=row['count'], last_used_at=row['last_used_at'])
+         for row in rows.iterator()),
+        batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('todos', '0011_todotombstone'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TagUsage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('count', models.PositiveIntegerField(default=0, verbose_name='Count')),
+                ('last_used_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Last Used At')),
+                ('tag', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='usages', to='todos.tag', verbose_name='Tag')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tag_usages', to=settings.AUTH_USER_MODEL, verbose_name='User')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('user', 'tag'), name='tag_usage_unique')],
+            },
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.2 on 2026-10-17 23:47
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('todos', '0012_tagusage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='todoattachment',
+            name='name',
+            field=models.CharField(blank=True, max_length=255, verbose_name='Name'),
+        ),
+        migrations.AddField(
+            model_name='todoattachment',
+            name='sha256',
+            field=models.CharField(blank=True, db_index=True, max_length=64, verbose_name='SHA-256'),
+        ),
+        migrations.AddField(
+            model_name='todoattachment',
+            name='size',
+            field=models.PositiveBigIntegerField(blank=True, null=True, verbose_name='Size'),
+        ),
+        migrations.CreateModel(
+            name='AttachmentUpload',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('filename', models.CharField(max_length=255, verbose_name='Filename')),
+                ('size', models.PositiveBigIntegerField(verbose_name='Size')),
+                ('checksum', models.CharField(max_length=64, verbose_name='SHA-256')),
+                ('offset', models.PositiveBigIntegerField(default=0, verbose_name='Offset')),
+                ('chunks', models.JSONField(blank=True, default=list, verbose_name='Chunks')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Created At')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Updated At')),
+                ('todo', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='attachment_uploads', to='todos.todo', verbose_name='Todo')),
+            ],
+        ),
+    ]
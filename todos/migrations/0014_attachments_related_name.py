@@ -0,0 +1,19 @@
+# Generated by Django 5.2 on 2026-10-17 23:50
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('todos', '0013_attachment_uploads'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='todoattachment',
+            name='todo',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='attachments', to='todos.todo'),
+        ),
+    ]
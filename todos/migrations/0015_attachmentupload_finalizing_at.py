@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-18 00:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('todos', '0014_attachments_related_name'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='attachmentupload',
+            name='finalizing_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Finalizing At'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2 on 2026-10-18 00:55
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('todos', '0015_attachmentupload_finalizing_at'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='todo',
+            name='todos_todo_priorit_93f987_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='todo',
+            name='todos_todo_status_9f7c48_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='todo',
+            name='todos_todo_due_dat_f2739d_idx',
+        ),
+    ]
@@ -1,8 +1,12 @@
+import uuid
+
 from django.contrib.auth import get_user_model
 from django.db import models
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
+from . import lookups  # noqa: F401
+
 User = get_user_model()
 
 
@@ -31,6 +35,7 @@ class Todo(models.Model):
         ('completed', _('Completed')),
         ('archived', _('Archived')),
     ]
+    OPEN_STATUSES = ['pending', 'in_progress']
 
     title = models.CharField(max_length=200, verbose_name=_('Title'))
     description = models.TextField(
@@ -41,8 +46,10 @@ class Todo(models.Model):
         choices=PRIORITY_CHOICES, default=2, verbose_name=_('Priority'))
     status = models.CharField(
         max_length=20, choices=STATUS_CHOICES, default='pending', verbose_name=_('Status'))
+    # Not ``auto_now_add``, which would overwrite the dates of imported
+    # todos on insert.
     created_at = models.DateTimeField(
-        auto_now_add=True, verbose_name=_('Created At'))
+        default=timezone.now, editable=False, verbose_name=_('Created At'))
     updated_at = models.DateTimeField(
         auto_now=True, verbose_name=_('Updated At'))
     completed_at = models.DateTimeField(
@@ -55,29 +62,283 @@ class Todo(models.Model):
     class Meta:
         ordering = ['-priority', 'due_date']
         indexes = [
-            models.Index(fields=['priority']),
-            models.Index(fields=['status']),
-            models.Index(fields=['due_date']),
+            # Every query is scoped to a user, so the indexes lead with it.
+            # Keyset pagination: one index per supported ordering, each
+            # ending in the ``id`` tie-breaker.
+            models.Index(fields=['user', '-priority', 'due_date', 'id'],
+                         name='todo_user_default_order_idx'),
+            models.Index(fields=['user', 'priority', 'id'],
+                         name='todo_user_priority_idx'),
+            models.Index(fields=['user', 'due_date', 'id'],
+                         name='todo_user_due_date_idx'),
+            models.Index(fields=['user', 'created_at', 'id'],
+                         name='todo_user_created_at_idx'),
+            models.Index(fields=['user', 'updated_at', 'id'],
+                         name='todo_user_updated_at_idx'),
+            # ``completed`` and ``?status=`` filters seek straight to the
+            # user's rows with that status, already in default order.
+            models.Index(fields=['user', 'status', '-priority', 'due_date', 'id'],
+                         name='todo_user_status_order_idx'),
+            # ``overdue`` only ever looks at open todos with a due date.
+            models.Index(fields=['user', '-priority', 'due_date', 'id'],
+                         name='todo_user_open_due_idx',
+                         condition=models.Q(status__in=['pending', 'in_progress'],
+                                            due_date__isnull=False)),
         ]
 
     def __str__(self):
         return f"{self.title} ({self.get_status_display()})"
 
-    def save(self, *args, **kwargs):
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Values as loaded, so save handlers can tell what changed.
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    def sync_completed_at(self):
         if self.status == 'completed' and not self.completed_at:
             self.completed_at = timezone.now()
         elif self.status != 'completed' and self.completed_at:
             self.completed_at = None
+
+    def save(self, *args, **kwargs):
+        self.sync_completed_at()
         super().save(*args, **kwargs)
 
 
+class TodoSearchIndex(models.Model):
+    """
+    Read-only mapping of the SQLite FTS5 table created in migration 0008.
+
+    ``document`` is the table's hidden column of the same name, the left-hand
+    side of ``MATCH``; ``rank`` is the FTS5 bm25 score (lower is better).
+    """
+    todo = models.OneToOneField(
+        Todo, on_delete=models.DO_NOTHING, primary_key=True,
+        db_column='rowid', related_name='search_index')
+    document = models.TextField(db_column='todos_todo_fts')
+    rank = models.FloatField()
+
+    class Meta:
+        managed = False
+        db_table = 'todos_todo_fts'
+
+
+class TodoStat(models.Model):
+    """
+    One counter of the optional per-user statistics rollup, e.g.
+    ``('status', 'completed') -> 12``. Maintained by ``todos.stats`` when
+    ``TODO_STATS_ROLLUP`` is enabled; the ``('total', '')`` row marks a user
+    whose rollup has been built.
+    """
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name='todo_stats', verbose_name=_('User'))
+    dimension = models.CharField(max_length=20, verbose_name=_('Dimension'))
+    key = models.CharField(max_length=50, blank=True, verbose_name=_('Key'))
+    count = models.IntegerField(default=0, verbose_name=_('Count'))
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'dimension', 'key'],
+                                    name='todo_stat_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} {self.dimension}:{self.key} = {self.count}"
+
+
+class TagUsage(models.Model):
+    """
+    How many of a user's todos carry a tag and when it was last added to
+    one. Maintained by ``todos.tags`` as links are added and removed, so a
+    user's tags are listed from this index instead of a ``DISTINCT`` join
+    over their todos. A row exists only while its count is positive.
+    """
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name='tag_usages', verbose_name=_('User'))
+    tag = models.ForeignKey(
+        Tag, on_delete=models.CASCADE, related_name='usages', verbose_name=_('Tag'))
+    count = models.PositiveIntegerField(default=0, verbose_name=_('Count'))
+    last_used_at = models.DateTimeField(
+        default=timezone.now, verbose_name=_('Last Used At'))
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'tag'],
+                                    name='tag_usage_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} {self.tag_id} x{self.count}"
+
+
+class TodoImport(models.Model):
+    """
+    Progress of a bulk import (``todos.imports``). ``position`` is the last
+    input line included in a committed chunk; it is advanced in the same
+    transaction as the chunk's rows, so an interrupted import resumes from
+    there without duplicating or losing rows.
+    """
+    FORMAT_CHOICES = [
+        ('ndjson', 'NDJSON'),
+        ('csv', 'CSV'),
+    ]
+
+    STATUS_CHOICES = [
+        ('running', _('Running')),
+        ('completed', _('Completed')),
+        ('failed', _('Failed')),
+    ]
+
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name='todo_imports', verbose_name=_('User'))
+    format = models.CharField(
+        max_length=10, choices=FORMAT_CHOICES, verbose_name=_('Format'))
+    source = models.CharField(
+        max_length=255, blank=True, verbose_name=_('Source'))
+    source_size = models.BigIntegerField(
+        blank=True, null=True, verbose_name=_('Source Size'))
+    status = models.CharField(
+        max_length=20, choices=STATUS_CHOICES, default='running', verbose_name=_('Status'))
+    position = models.PositiveBigIntegerField(
+        default=0, verbose_name=_('Position'))
+    imported = models.PositiveIntegerField(
+        default=0, verbose_name=_('Imported'))
+    failed = models.PositiveIntegerField(default=0, verbose_name=_('Failed'))
+    errors = models.JSONField(default=list, blank=True, verbose_name=_('Errors'))
+    duration = models.FloatField(default=0, verbose_name=_('Duration'))
+    created_at = models.DateTimeField(
+        auto_now_add=True, verbose_name=_('Created At'))
+    updated_at = models.DateTimeField(
+        auto_now=True, verbose_name=_('Updated At'))
+
+    def __str__(self):
+        return f"Import {self.pk} of {self.source or self.format} ({self.get_status_display()})"
+
+    @property
+    def rows_per_second(self):
+        rows = self.imported + self.failed
+        return round(rows / self.duration) if self.duration else None
+
+
+class TodoTombstone(models.Model):
+    """
+    A deleted todo or a removed tag link, reported by the sync endpoint
+    (``todos.sync``) until ``manage.py compact_tombstones`` drops it after
+    ``TODO_SYNC_TOMBSTONE_DAYS``. The todo and tag are gone, so they are
+    plain ids. ``user`` has no database constraint: a user's todos leave
+    tombstones while the user is deleted, which compaction removes.
+    """
+    KIND_CHOICES = [
+        ('todo', _('Todo')),
+        ('tag', _('Tag link')),
+    ]
+
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, db_constraint=False,
+        related_name='todo_tombstones', verbose_name=_('User'))
+    kind = models.CharField(
+        max_length=10, choices=KIND_CHOICES, verbose_name=_('Kind'))
+    todo_id = models.BigIntegerField(verbose_name=_('Todo'))
+    tag_id = models.BigIntegerField(
+        blank=True, null=True, verbose_name=_('Tag'))
+    deleted_at = models.DateTimeField(
+        default=timezone.now, verbose_name=_('Deleted At'))
+
+    class Meta:
+        indexes = [
+            # Sync seeks by (deleted_at, id) like todos by (updated_at, id).
+            models.Index(fields=['user', 'deleted_at', 'id'],
+                         name='tombstone_user_deleted_idx'),
+            models.Index(fields=['deleted_at'],
+                         name='tombstone_deleted_at_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} {self.todo_id} deleted at {self.deleted_at}"
+
+
 class TodoAttachment(models.Model):
     todo = models.ForeignKey(
-        Todo, on_delete=models.CASCADE, related_name='Attachments')
+        Todo, on_delete=models.CASCADE, related_name='attachments')
     file = models.FileField(
         upload_to='todo_attachments/', verbose_name=_('File'))
+    # The name given by the uploader; files with identical content share
+    # one stored file (see ``todos.uploads``).
+    name = models.CharField(max_length=255, blank=True, verbose_name=_('Name'))
+    size = models.PositiveBigIntegerField(
+        blank=True, null=True, verbose_name=_('Size'))
+    sha256 = models.CharField(
+        max_length=64, blank=True, db_index=True, verbose_name=_('SHA-256'))
     uploaded_at = models.DateTimeField(
         auto_now_add=True, verbose_name=_('Updated At'))
 
     def __str__(self):
         return f"Attachment for {self.todo.title}"
+
+
+class AttachmentUpload(models.Model):
+    """
+    A resumable attachment upload in progress (``todos.uploads``). The client
+    declares the file's size and SHA-256 and sends it in consecutive chunks;
+    each chunk is stored as a file of its own and listed in ``chunks`` as
+    ``[name, length]`` until the upload is finalized into a
+    ``TodoAttachment``. ``offset`` is the number of bytes received;
+    ``finalizing_at`` is set while a request assembles the upload.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    todo = models.ForeignKey(
+        Todo, on_delete=models.CASCADE, related_name='attachment_uploads', verbose_name=_('Todo'))
+    filename = models.CharField(max_length=255, verbose_name=_('Filename'))
+    size = models.PositiveBigIntegerField(verbose_name=_('Size'))
+    checksum = models.CharField(max_length=64, verbose_name=_('SHA-256'))
+    offset = models.PositiveBigIntegerField(default=0, verbose_name=_('Offset'))
+    chunks = models.JSONField(default=list, blank=True, verbose_name=_('Chunks'))
+    finalizing_at = models.DateTimeField(
+        blank=True, null=True, verbose_name=_('Finalizing At'))
+    created_at = models.DateTimeField(
+        auto_now_add=True, verbose_name=_('Created At'))
+    updated_at = models.DateTimeField(
+        auto_now=True, verbose_name=_('Updated At'))
+
+    def __str__(self):
+        return f"Upload of {self.filename} ({self.offset}/{self.size})"
+
+
+class Notification(models.Model):
+    STATUS_CHOICES = [
+        ('pending', _('Pending')),
+        ('sending', _('Sending')),
+        ('sent', _('Sent')),
+        ('failed', _('Failed')),
+    ]
+
+    recipient = models.EmailField(verbose_name=_('Recipient'))
+    subject = models.CharField(max_length=255, verbose_name=_('Subject'))
+    message = models.TextField(verbose_name=_('Message'))
+    status = models.CharField(
+        max_length=20, choices=STATUS_CHOICES, default='pending', verbose_name=_('Status'))
+    attempts = models.PositiveIntegerField(
+        default=0, verbose_name=_('Attempts'))
+    next_attempt_at = models.DateTimeField(
+        default=timezone.now, verbose_name=_('Next Attempt At'))
+    claim_token = models.UUIDField(
+        blank=True, null=True, verbose_name=_('Claim Token'))
+    claimed_at = models.DateTimeField(
+        blank=True, null=True, verbose_name=_('Claimed At'))
+    last_error = models.TextField(
+        blank=True, null=True, verbose_name=_('Last Error'))
+    created_at = models.DateTimeField(
+        auto_now_add=True, verbose_name=_('Created At'))
+    sent_at = models.DateTimeField(
+        blank=True, null=True, verbose_name=_('Sent At'))
+
+    class Meta:
+        ordering = ['next_attempt_at', 'id']
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.subject} -> {self.recipient} ({self.get_status_display()})"
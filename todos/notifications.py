@@ -0,0 +1,187 @@
+import logging
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import connections
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Notification
+
+logger = logging.getLogger(__name__)
+
+FROM_EMAIL = 'todos@example.com'
+
+
+def get_max_attempts():
+    return getattr(settings, 'NOTIFICATION_MAX_ATTEMPTS', 5)
+
+
+def get_retry_backoff():
+    return getattr(settings, 'NOTIFICATION_RETRY_BACKOFF', 30)
+
+
+def get_claim_lease():
+    return getattr(settings, 'NOTIFICATION_CLAIM_LEASE', 300)
+
+
+def build_created_notification(todo):
+    return Notification(
+        recipient=todo.user.email,
+        subject=f'New Todo Created: {todo.title}',
+        message=f'''You have created a new todo:\n\nTitle:
+        {todo.title}\nPriority: {todo.get_priority_display()}\nDue
+        Date: {todo.due_date}''',
+    )
+
+
+def build_completed_notification(todo):
+    return Notification(
+        recipient=todo.user.email,
+        subject=f'Todo Completed: {todo.title}',
+        message=f'Congratulations! You have completed the todo:\n\nTitle: {todo.title}',
+    )
+
+
+def build_bulk_notification(user, created, completed):
+    """Single summary for a bulk write instead of one email per todo."""
+    lines = []
+    if created:
+        lines.append(f'Created: {len(created)}')
+    if completed:
+        lines.append(f'Completed: {len(completed)}')
+    titles = '\n'.join(f'- {todo.title}' for todo in (created + completed)[:20])
+    return Notification(
+        recipient=user.email,
+        subject=f'{len(created) + len(completed)} todos updated',
+        message='Your todos were updated in bulk:\n\n' +
+        '\n'.join(lines) + '\n\n' + titles,
+    )
+
+
+def build_import_notification(job, imported):
+    """Single summary for an import run instead of one email per todo."""
+    message = f'Imported: {imported}'
+    if job.failed:
+        message += f'\nRejected rows: {job.failed}'
+    return Notification(
+        recipient=job.user.email,
+        subject=f'{imported} todos imported',
+        message=f'Your import of {job.source or job.format} finished:\n\n' +
+        message,
+    )
+
+
+def claim_batch(batch_size):
+    """
+    Claim up to ``batch_size`` due notifications for this worker.
+
+    Rows are tagged with a fresh claim token through a conditional UPDATE, so
+    concurrent workers never deliver the same row twice even on databases
+    without ``SELECT ... FOR UPDATE SKIP LOCKED``. Claims older than the lease
+    are considered abandoned and can be picked up again.
+    """
+    now = timezone.now()
+    claimable = (
+        Q(status='pending', next_attempt_at__lte=now) |
+        Q(status='sending', claimed_at__lt=now -
+          timedelta(seconds=get_claim_lease()))
+    )
+    ids = list(Notification.objects.filter(claimable).values_list(
+        'pk', flat=True)[:batch_size])
+    if not ids:
+        return []
+    token = uuid.uuid4()
+    Notification.objects.filter(claimable, pk__in=ids).update(
+        status='sending', claim_token=token, claimed_at=now)
+    return list(Notification.objects.filter(claim_token=token))
+
+
+def _record_failure(notification, error):
+    notification.attempts += 1
+    notification.last_error = str(error)
+    notification.claim_token = None
+    if notification.attempts >= get_max_attempts():
+        notification.status = 'failed'
+    else:
+        notification.status = 'pending'
+        notification.next_attempt_at = timezone.now() + timedelta(
+            seconds=get_retry_backoff() * 2 ** (notification.attempts - 1))
+    notification.save(update_fields=[
+        'attempts', 'last_error', 'claim_token', 'status', 'next_attempt_at'])
+
+
+def deliver_batch(notifications):
+    """Send a claimed batch over a single mail connection."""
+    if not notifications:
+        return 0
+    sent = 0
+    connection = get_connection()
+    try:
+        connection.open()
+    except Exception as exc:
+        logger.warning('Could not open mail connection: %s', exc)
+        for notification in notifications:
+            _record_failure(notification, exc)
+        return 0
+
+    try:
+        for notification in notifications:
+            message = EmailMessage(
+                notification.subject,
+                notification.message,
+                FROM_EMAIL,
+                [notification.recipient],
+                connection=connection,
+            )
+            try:
+                message.send()
+            except Exception as exc:
+                logger.warning(
+                    'Failed to send notification %s: %s', notification.pk, exc)
+                _record_failure(notification, exc)
+                continue
+            notification.status = 'sent'
+            notification.sent_at = timezone.now()
+            notification.claim_token = None
+            notification.save(
+                update_fields=['status', 'sent_at', 'claim_token'])
+            sent += 1
+    finally:
+        connection.close()
+    return sent
+
+
+def drain(batch_size):
+    """Claim and deliver batches until nothing is due."""
+    sent = 0
+    while True:
+        batch = claim_batch(batch_size)
+        if not batch:
+            return sent
+        sent += deliver_batch(batch)
+
+
+def _drain_in_thread(batch_size):
+    try:
+        return drain(batch_size)
+    finally:
+        connections.close_all()
+
+
+def deliver_pending(batch_size=100, workers=1):
+    """
+    Deliver every due notification and return how many were sent.
+
+    With more than one worker, each thread claims and sends its own batches
+    with its own database and mail connections.
+    """
+    if workers <= 1:
+        return drain(batch_size)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(_drain_in_thread, batch_size)
+                   for _ in range(workers)]
+        return sum(future.result() for future in futures)
@@ -0,0 +1,296 @@
+import binascii
+import datetime
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class CursorEncoder(DjangoJSONEncoder):
+    """Keep full microsecond precision, the cursor must match rows exactly."""
+
+    def default(self, o):
+        if isinstance(o, (datetime.datetime, datetime.time)):
+            return o.isoformat()
+        return super().default(o)
+
+
+class TodoKeysetPagination(BasePagination):
+    """
+    Keyset (seek) pagination over an arbitrary multi-column ordering.
+
+    Unlike DRF's ``CursorPagination`` this handles every column of the
+    ordering, so ``Todo.Meta.ordering`` (``-priority, due_date``) and the
+    viewset's ``ordering_fields`` page consistently. The primary key is
+    appended as a tie-breaker in the direction of the last ordering column,
+    which lets a single composite index serve both the forward and the
+    backward scan. NULLs are placed where the database sorts them natively.
+
+    Cursors are opaque base64 tokens holding the boundary row's ordering
+    values. The total ``count`` is included unless ``?count=false`` is given,
+    in which case a page costs one indexed range scan regardless of depth.
+    """
+    page_size = api_settings.PAGE_SIZE or 10
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    count_query_param = 'count'
+    tie_breaker = 'id'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        page = self.seek(queryset, request)
+        if self.get_include_count(request):
+            self.count = queryset.order_by().count()
+        return self.set_page(list(page))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """``paginate_queryset`` for async views, with the async ORM."""
+        page = self.seek(queryset, request)
+        if self.get_include_count(request):
+            self.count = await queryset.order_by().acount()
+        return self.set_page([row async for row in page])
+
+    def seek(self, queryset, request):
+        """
+        Parse the request and return the unevaluated queryset of the
+        requested page plus one extra row telling whether there is more.
+        """
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.ordering = self.get_ordering(queryset)
+        self.nulls_largest = connections[queryset.db].features.nulls_order_largest
+        self.count = None
+
+        self.position, self.reverse = self.decode_cursor(request)
+        ordering = self.ordering
+        if self.reverse:
+            ordering = [(field, not descending)
+                        for field, descending in ordering]
+
+        queryset = queryset.order_by(*[
+            f'-{field}' if descending else field
+            for field, descending in ordering
+        ])
+        if self.position is not None:
+            queryset = queryset.filter(
+                self.build_after(ordering, self.position))
+        return queryset[:self.page_size + 1]
+
+    def set_page(self, results):
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+
+        if self.reverse:
+            results.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = \
+                has_more, self.position is not None
+
+        self.page = results
+        return results
+
+    def get_paginated_response(self, data):
+        response = {}
+        if self.count is not None:
+            response['count'] = self.count
+        response.update({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+        return Response(response)
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'count': {'type': 'integer', 'example': 123},
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                'name': self.cursor_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'The pagination cursor value.',
+                'schema': {'type': 'string'},
+            },
+            {
+                'name': self.page_size_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'Number of results to return per page.',
+                'schema': {'type': 'integer'},
+            },
+            {
+                'name': self.count_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'Set to false to skip the total count.',
+                'schema': {'type': 'boolean'},
+            },
+        ]
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def get_include_count(self, request):
+        value = request.query_params.get(self.count_query_param, 'true')
+        return value.lower() not in ('0', 'false', 'no', 'off')
+
+    def get_ordering(self, queryset):
+        ordering = list(queryset.query.order_by or
+                        queryset.model._meta.ordering)
+        parsed = []
+        for field in ordering:
+            if not isinstance(field, str):
+                raise TypeError(
+                    'Keyset pagination only supports ordering by field name.')
+            descending = field.startswith('-')
+            name = field.lstrip('-+')
+            if name == 'pk':
+                name = self.tie_breaker
+            parsed.append((name, descending))
+
+        if self.tie_breaker not in (name for name, _ in parsed):
+            descending = parsed[-1][1] if parsed else False
+            parsed.append((self.tie_breaker, descending))
+        self.model = queryset.model
+        return parsed
+
+    def build_after(self, ordering, position):
+        """
+        Build the seek predicate selecting rows strictly after ``position``:
+        ``(a > x) OR (a = x AND b > y) OR (a = x AND b = y AND id > z)``.
+        """
+        branches = []
+        equal = Q()
+        for (field, descending), value in zip(ordering, position):
+            step = self._less(field, value) if descending else \
+                self._greater(field, value)
+            if step is not None:
+                branches.append(equal & step)
+            equal &= Q(**{f'{field}__isnull': True}) if value is None \
+                else Q(**{field: value})
+        if not branches:
+            return Q(pk__in=[])
+        condition = branches[0]
+        for branch in branches[1:]:
+            condition |= branch
+        return condition
+
+    def _greater(self, field, value):
+        if value is None:
+            return None if self.nulls_largest else \
+                Q(**{f'{field}__isnull': False})
+        greater = Q(**{f'{field}__gt': value})
+        if self.nulls_largest:
+            greater |= Q(**{f'{field}__isnull': True})
+        return greater
+
+    def _less(self, field, value):
+        if value is None:
+            return Q(**{f'{field}__isnull': False}) if self.nulls_largest \
+                else None
+        less = Q(**{f'{field}__lt': value})
+        if not self.nulls_largest:
+            less |= Q(**{f'{field}__isnull': True})
+        return less
+
+    def get_position(self, row):
+        if isinstance(row, dict):
+            return [row[field] for field, _ in self.ordering]
+        return [getattr(row, field) for field, _ in self.ordering]
+
+    def encode_cursor(self, row, reverse):
+        payload = json.dumps(
+            {'p': self.get_position(row), 'r': int(reverse)},
+            cls=CursorEncoder, separators=(',', ':'))
+        token = urlsafe_b64encode(payload.encode('utf-8')).decode('ascii')
+        return replace_query_param(
+            self.base_url, self.cursor_query_param, token)
+
+    def decode_cursor(self, request):
+        token = request.query_params.get(self.cursor_query_param)
+        if not token:
+            return None, False
+        try:
+            payload = json.loads(urlsafe_b64decode(token.encode('ascii')))
+            values = payload['p']
+            reverse = bool(payload['r'])
+            if len(values) != len(self.ordering):
+                raise ValueError
+            position = [
+                self._to_python(field, value)
+                for (field, _), value in zip(self.ordering, values)
+            ]
+        except (TypeError, ValueError, KeyError, UnicodeError,
+                binascii.Error, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+        return position, reverse
+
+    def _to_python(self, field, value):
+        if value is None:
+            return None
+        try:
+            model_field = self.model._meta.get_field(field)
+        except FieldDoesNotExist:
+            return value
+        return model_field.to_python(value)
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self.page[0], reverse=True)
+
+
+class OptionalKeysetPagination(TodoKeysetPagination):
+    """
+    Keyset pagination a client opts into by passing ``page_size`` (or
+    following a ``cursor``); otherwise every row is returned in a plain
+    list.
+    """
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if not self.is_requested(request):
+            return None
+        return super().paginate_queryset(queryset, request, view)
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        if not self.is_requested(request):
+            return None
+        return await super().apaginate_queryset(queryset, request, view)
+
+    def is_requested(self, request):
+        return (self.page_size_query_param in request.query_params or
+                self.cursor_query_param in request.query_params)
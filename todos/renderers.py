@@ -0,0 +1,94 @@
+import json
+import re
+
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+# Floats Python writes with an exponent (< 1e-4 or >= 1e16), which orjson
+# writes differently, or a string looking like one after a ':', ',' or '['.
+# The first pattern is cheaper and finds a superset.
+EXPONENT = re.compile(rb'e(?<=[0-9]e)')
+EXPONENT_FLOAT = re.compile(rb'(?:^|[:,\[])-?(?:\d+(?:\.\d+)?e|0\.0000)')
+LINE_SEPARATOR = '\u2028'.encode()
+PARAGRAPH_SEPARATOR = '\u2029'.encode()
+
+
+def has_exponent_floats(content):
+    if EXPONENT.search(content) is None and b'0.0000' not in content:
+        return False
+    return EXPONENT_FLOAT.search(content) is not None
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    ``JSONRenderer`` encoding with orjson, byte for byte the same output.
+    Dates, times, Decimals, lazy translation strings and other types orjson
+    would write its own way go through DRF's encoder; output orjson cannot
+    match (indented or ASCII-only JSON, floats in exponent notation,
+    integers past 64 bits) is rendered by ``JSONRenderer``. NaN and
+    infinities, which ``STRICT_JSON`` refuses, are written as ``null``.
+    """
+    if orjson is not None:
+        options = (orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME |
+                   orjson.OPT_PASSTHROUGH_DATACLASS)
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if (orjson is None or self.ensure_ascii or not self.compact or
+                self.get_indent(accepted_media_type, renderer_context or {})):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(
+                data, default=self.encoder_class().default,
+                option=self.options)
+        except orjson.JSONEncodeError:
+            ret = None
+        if ret is None or has_exponent_floats(ret):
+            return super().render(data, accepted_media_type, renderer_context)
+        if ret.isascii():
+            return ret
+        # Like JSONRenderer, escape the separators JavaScript does not allow
+        # in strings.
+        return ret.replace(LINE_SEPARATOR, b'\\u2028').replace(
+            PARAGRAPH_SEPARATOR, b'\\u2029')
+
+
+class NDJSONRenderer(BaseRenderer):
+    """
+    Newline-delimited JSON. Streaming views write their own body; this
+    renderer serves content negotiation and renders error responses.
+    """
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return (json.dumps(data) + '\n').encode(self.charset)
+
+
+class CSVRenderer(NDJSONRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+
+class EventStreamRenderer(BaseRenderer):
+    """
+    Server-sent events. The event views write their own body; error
+    responses are sent as a single ``error`` event.
+    """
+    media_type = 'text/event-stream'
+    format = 'event-stream'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return f'event: error\ndata: {json.dumps(data)}\n\n'.encode(
+            self.charset)
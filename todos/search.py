@@ -0,0 +1,119 @@
+import re
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import BooleanField, F, FloatField, Q
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+
+SEARCH_FIELDS = ('title', 'description')
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def tokenize(query):
+    return TOKEN_RE.findall(query.lower())
+
+
+class LikeSearchBackend:
+    """Substring search with ``icontains``; used when no index is available."""
+    ranked = False
+
+    def search(self, queryset, query, fields=SEARCH_FIELDS, user_id=None):
+        condition = Q()
+        for token in tokenize(query):
+            token_condition = Q()
+            for field in fields:
+                token_condition |= Q(**{f'{field}__icontains': token})
+            condition &= token_condition
+        return queryset.filter(condition)
+
+
+class SqliteFTSBackend:
+    """
+    Search through the ``todos_todo_fts`` FTS5 table maintained by triggers
+    (see migration 0008), joined through ``TodoSearchIndex``.
+
+    The table is contentless and stores an ``owner`` token per row, so the
+    user restriction is resolved inside the full-text index together with the
+    search terms rather than after fetching every matching row. Every term is
+    a prefix match and results are ranked with bm25, weighting titles over
+    descriptions. Prefixes of up to six characters are indexed, so common
+    short prefixes read one doclist instead of merging every term that
+    starts with them.
+
+    The join is only driven from the FTS table when SQLite has statistics
+    for ``todos_todo`` (``ANALYZE`` / ``PRAGMA optimize``); without them the
+    planner assumes a handful of todos per user and probes the index per row.
+    """
+    ranked = True
+
+    def build_match(self, query, fields, user_id=None):
+        tokens = tokenize(query)
+        if not tokens:
+            return None
+        columns = ' '.join(fields)
+        terms = ' AND '.join(f'"{token}"*' for token in tokens)
+        match = f'{{{columns}}} : ({terms})'
+        if user_id is not None:
+            match += f' AND owner : u{int(user_id)}'
+        return match
+
+    def search(self, queryset, query, fields=SEARCH_FIELDS, user_id=None):
+        match = self.build_match(query, fields, user_id)
+        if match is None:
+            return queryset
+        return queryset.filter(search_index__document__match=match).annotate(
+            search_rank=-F('search_index__rank'))
+
+
+class PostgresSearchBackend:
+    """
+    Search with ``tsvector`` expressions matching the GIN indexes created in
+    migration 0008. Terms are prefix matches and results are ranked with
+    ``ts_rank``.
+    """
+    ranked = True
+    config = 'simple'
+
+    def document(self, table, fields):
+        parts = " || ' ' || ".join(
+            f'coalesce("{table}"."{field}", \'\')' for field in fields)
+        return f"to_tsvector('{self.config}', {parts})"
+
+    def build_query(self, query):
+        tokens = tokenize(query)
+        if not tokens:
+            return None
+        return ' & '.join(f'{token}:*' for token in tokens)
+
+    def search(self, queryset, query, fields=SEARCH_FIELDS, user_id=None):
+        tsquery = self.build_query(query)
+        if tsquery is None:
+            return queryset
+        document = self.document(queryset.model._meta.db_table, fields)
+        return queryset.annotate(search_rank=RawSQL(
+            f"ts_rank({document}, to_tsquery('{self.config}', %s))",
+            [tsquery], output_field=FloatField(),
+        )).filter(RawSQL(
+            f"{document} @@ to_tsquery('{self.config}', %s)",
+            [tsquery], output_field=BooleanField(),
+        ))
+
+
+BACKENDS = {
+    'sqlite': SqliteFTSBackend,
+    'postgresql': PostgresSearchBackend,
+}
+
+
+def get_search_backend(using='default'):
+    """
+    Return the search backend for a database alias. ``TODO_SEARCH_BACKEND``
+    may name a backend class to override the vendor default.
+    """
+    path = getattr(settings, 'TODO_SEARCH_BACKEND', None)
+    if path:
+        return import_string(path)()
+    vendor = connections[using].vendor
+    return BACKENDS.get(vendor, LikeSearchBackend)()
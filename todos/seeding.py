@@ -0,0 +1,121 @@
+import random
+from datetime import datetime, time, timedelta
+from datetime import timezone as dt_timezone
+
+from django.contrib.auth import get_user_model
+from django.utils import timezone
+
+from .models import Tag, Todo, TodoAttachment
+from .tags import add_tag_usage, link_tags
+
+User = get_user_model()
+
+WORDS = (
+    'review', 'write', 'call', 'plan', 'fix', 'update', 'prepare', 'send',
+    'book', 'clean', 'buy', 'pay', 'report', 'meeting', 'invoice', 'budget',
+    'release', 'design', 'deploy', 'backup', 'groceries', 'dentist', 'car',
+    'garden', 'taxes', 'slides', 'contract', 'roadmap', 'feedback', 'travel',
+    'insurance', 'birthday', 'workout', 'library', 'newsletter', 'migration',
+)
+STATUS_WEIGHTS = (('pending', 40), ('in_progress', 20), ('completed', 30),
+                  ('archived', 10))
+
+
+def default_anchor():
+    """Midnight UTC today; dates are generated relative to it."""
+    return timezone.make_aware(
+        datetime.combine(timezone.now().date(), time.min),
+        timezone=dt_timezone.utc)
+
+
+def _sentence(rng, low, high):
+    return ' '.join(rng.choices(WORDS, k=rng.randint(low, high)))
+
+
+def seed_todos(users=10, todos_per_user=1000, tags=50, max_tags_per_todo=3,
+               attachment_ratio=0.05, seed=0, prefix='seed', anchor=None,
+               batch_size=2000, progress=None):
+    """
+    Generate users, tags, todos, tag links and attachment rows.
+
+    Every value is drawn from ``random.Random(seed)``, so the same arguments
+    produce the same dataset; dates are offsets from ``anchor``. Rows are
+    written with ``bulk_create`` and therefore send no model signals.
+    Attachments only reference file names, no files are written.
+    """
+    rng = random.Random(seed)
+    anchor = anchor or default_anchor()
+    attachment_name = 'todo_attachments/' + prefix + '-{}-{}.txt'
+    statuses, status_weights = zip(*STATUS_WEIGHTS)
+
+    User.objects.bulk_create([
+        User(username=f'{prefix}-user-{index}',
+             email=f'{prefix}-user-{index}@example.com',
+             password='!')  # unusable, as set_unusable_password() would
+        for index in range(users)
+    ])
+    seeded_users = list(User.objects.filter(
+        username__startswith=f'{prefix}-user-').order_by('pk'))
+
+    Tag.objects.bulk_create([
+        Tag(name=f'{prefix}-tag-{index}',
+            color='#{:06X}'.format(rng.randrange(0x1000000)))
+        for index in range(tags)
+    ], ignore_conflicts=True)
+    tag_ids = list(Tag.objects.filter(
+        name__startswith=f'{prefix}-tag-').order_by('pk').values_list(
+        'pk', flat=True))
+
+    pending = [(user, index) for user in seeded_users
+               for index in range(todos_per_user)]
+    created = 0
+    for start in range(0, len(pending), batch_size):
+        todos = []
+        for user, index in pending[start:start + batch_size]:
+            status = rng.choices(statuses, weights=status_weights)[0]
+            created_at = anchor - timedelta(
+                minutes=rng.randrange(365 * 24 * 60))
+            due_date = None
+            if rng.random() < 0.7:
+                due_date = created_at + timedelta(
+                    hours=rng.randrange(1, 60 * 24))
+            completed_at = None
+            if status == 'completed':
+                completed_at = created_at + timedelta(
+                    minutes=rng.randrange(1, 30 * 24 * 60))
+            todo = Todo(
+                user=user,
+                title=_sentence(rng, 2, 6).capitalize(),
+                description=_sentence(rng, 0, 25) or None,
+                priority=rng.randint(1, 4),
+                status=status,
+                due_date=due_date,
+                completed_at=completed_at,
+            )
+            todos.append((todo, created_at))
+        Todo.objects.bulk_create([todo for todo, _ in todos])
+        # bulk_create applies auto_now/auto_now_add; bulk_update does not.
+        for todo, created_at in todos:
+            todo.created_at = todo.updated_at = created_at
+        todos = [todo for todo, _ in todos]
+        Todo.objects.bulk_update(todos, ['created_at', 'updated_at'])
+
+        if tag_ids:
+            links = [
+                (todo, tag_id)
+                for todo in todos
+                for tag_id in rng.sample(
+                    tag_ids,
+                    min(rng.randint(0, max_tags_per_todo), len(tag_ids)))
+            ]
+            link_tags((todo.pk, tag_id) for todo, tag_id in links)
+            add_tag_usage((todo.user_id, tag_id) for todo, tag_id in links)
+        TodoAttachment.objects.bulk_create([
+            TodoAttachment(todo=todo, file=attachment_name.format(
+                todo.pk, rng.randrange(10 ** 6)))
+            for todo in todos if rng.random() < attachment_ratio
+        ])
+        created += len(todos)
+        if progress:
+            progress(created, len(pending))
+    return seeded_users
@@ -1,8 +1,20 @@
+import os
+
 from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
 from django.utils import timezone
 from rest_framework import serializers
 
-from .models import Tag, Todo, TodoAttachment
+from .cache import bump_user_version
+from .events import publish_todo_changes
+from .models import (AttachmentUpload, Tag, Todo, TodoAttachment, TodoImport,
+                     TodoTombstone)
+from .notifications import build_bulk_notification
+from .stats import rebuild_user_stats, rollup_enabled
+from .tags import (BULK_BATCH_SIZE, add_tag_usage, link_tags,
+                   remove_tag_usage, resolve_tag_ids, resolve_tags)
 
 User = get_user_model()
 
@@ -14,6 +26,22 @@ class TagSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'created_at']
 
 
+class TagUsageSerializer(TagSerializer):
+    """A tag in the user's tag list, with how much they use it."""
+    usage_count = serializers.IntegerField(read_only=True)
+    last_used_at = serializers.DateTimeField(read_only=True)
+
+    class Meta(TagSerializer.Meta):
+        fields = TagSerializer.Meta.fields + ['usage_count', 'last_used_at']
+
+
+class TodoTagSerializer(TagSerializer):
+    """Tag reference inside a todo; existing names are reused, not rejected."""
+
+    class Meta(TagSerializer.Meta):
+        extra_kwargs = {'name': {'validators': []}}
+
+
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
@@ -23,7 +51,7 @@ class UserSerializer(serializers.ModelSerializer):
 
 class TodoSerializer(serializers.ModelSerializer):
     user = UserSerializer(read_only=True)
-    tags = TagSerializer(many=True, required=False)
+    tags = TodoTagSerializer(many=True, required=False)
     days_remaining = serializers.SerializerMethodField()
     is_overdue = serializers.SerializerMethodField()
 
@@ -54,10 +82,8 @@ class TodoSerializer(serializers.ModelSerializer):
         tags_data = validated_data.pop('tags', [])
         todo = Todo.objects.create(**validated_data)
 
-        for tag_data in tags_data:
-            tag, _ = Tag.objects.get_or_create(
-                name=tag_data['name'], defaults=tag_data)
-            todo.tags.add(tag)
+        if tags_data:
+            todo.tags.add(*resolve_tag_ids(tags_data).values())
 
         return todo
 
@@ -65,15 +91,145 @@ class TodoSerializer(serializers.ModelSerializer):
         tags_data = validated_data.pop('tags', None)
 
         if tags_data is not None:
-            instance.tags.clear()
-            for tag_data in tags_data:
-                tag, _ = Tag.objects.get_or_create(
-                    name=tag_data['name'], defaults=tag_data)
-                instance.tags.add(tag)
+            # Only the difference is written, so resending the current tags
+            # touches neither the through table nor the m2m signals. The
+            # current ids come from the viewset's prefetch when present.
+            current = {tag.pk for tag in instance.tags.all()}
+            wanted = set(resolve_tag_ids(tags_data).values())
+            if current - wanted:
+                instance.tags.remove(*current - wanted)
+            if wanted - current:
+                instance.tags.add(*wanted - current)
 
         return super().update(instance, validated_data)
 
 
+class TodoListSerializer(TodoSerializer):
+    """A todo in a list, with its number of attachments."""
+    attachment_count = serializers.IntegerField(read_only=True)
+
+    class Meta(TodoSerializer.Meta):
+        fields = TodoSerializer.Meta.fields + ['attachment_count']
+
+
+def with_attachment_count(queryset):
+    """
+    Annotate todos with ``attachment_count``. A correlated subquery rather
+    than ``Count('attachments')``: no ``GROUP BY`` over the todo columns,
+    and no overcounting when a tag filter joins the todos.
+    """
+    counts = TodoAttachment.objects.filter(todo=OuterRef('pk')).order_by(
+        ).values('todo').annotate(count=Count('pk')).values('count')
+    return queryset.annotate(attachment_count=Coalesce(Subquery(counts), 0))
+
+
+class TodoReadSerializer(serializers.BaseSerializer):
+    """
+    Read-only, batch version of ``TodoListSerializer(many=True)`` for list
+    endpoints, producing the same output.
+
+    Works on ``.values()`` rows (see ``VALUE_FIELDS``, plus
+    ``attachment_count`` from ``with_attachment_count``) instead of model
+    instances. Tags for the whole batch are fetched with one query, the
+    owner is serialized once (every row belongs to the requesting user) and
+    ``days_remaining``/``is_overdue`` share a single ``timezone.now()``.
+    Scalars are still formatted by ``TodoSerializer``'s own fields.
+    """
+    VALUE_FIELDS = [
+        'id', 'title', 'description', 'due_date', 'priority', 'status',
+        'created_at', 'updated_at', 'completed_at',
+    ]
+
+    def __init__(self, instance=None, user=None, **kwargs):
+        self.user = user
+        super().__init__(instance, **kwargs)
+
+    @staticmethod
+    def converters(serializer, names):
+        fields = serializer.fields
+        for field in fields.values():
+            # Resolve the active timezone once rather than once per value.
+            if isinstance(field, serializers.DateTimeField) and \
+                    not hasattr(field, 'timezone'):
+                field.timezone = field.default_timezone()
+        return [(name, fields[name].to_representation) for name in names]
+
+    def tag_links(self, rows):
+        return Todo.tags.through.objects.filter(
+            todo_id__in=[row['id'] for row in rows],
+        ).order_by('todo_id', 'tag_id').values_list(
+            'todo_id', 'tag__id', 'tag__name', 'tag__color', 'tag__created_at')
+
+    def to_representation(self, rows):
+        rows = list(rows)
+        return self.render(rows, self.tag_links(rows))
+
+    async def ato_representation(self, rows):
+        """``to_representation`` for async views, with the async ORM."""
+        if hasattr(rows, '__aiter__'):
+            rows = [row async for row in rows]
+        else:
+            rows = list(rows)
+        return self.render(
+            rows, [link async for link in self.tag_links(rows)])
+
+    def render(self, rows, links):
+        converters = self.converters(TodoSerializer(), self.VALUE_FIELDS)
+        tag_converters = self.converters(
+            TodoTagSerializer(), TagSerializer.Meta.fields)
+        user = UserSerializer(self.user).data
+
+        tags = {}
+        for todo_id, *values in links:
+            tags.setdefault(todo_id, []).append({
+                name: None if value is None else convert(value)
+                for (name, convert), value in zip(tag_converters, values)
+            })
+
+        now = timezone.now()
+        data = []
+        for row in rows:
+            item = {
+                name: None if row[name] is None else convert(row[name])
+                for name, convert in converters
+            }
+            item['user'] = user
+            item['tags'] = tags.get(row['id'], [])
+            due_date = row['due_date']
+            item['days_remaining'] = (due_date - now).days if due_date \
+                else None
+            item['is_overdue'] = now > due_date \
+                if due_date and row['status'] != 'completed' else False
+            item['attachment_count'] = row['attachment_count']
+            data.append(item)
+        return data
+
+
+class TagNamesField(serializers.ListField):
+    """Tag names, given as strings or as ``{"name": ...}`` like the API."""
+    child = serializers.CharField(max_length=50)
+
+    def to_internal_value(self, data):
+        if isinstance(data, list):
+            data = [item.get('name') if isinstance(item, dict) else item
+                    for item in data]
+        return list(dict.fromkeys(super().to_internal_value(data)))
+
+
+class TodoImportRowSerializer(serializers.ModelSerializer):
+    """
+    One imported todo. Accepts the rows written by ``todos.export``; other
+    columns such as ``id`` or ``updated_at`` are ignored.
+    """
+    created_at = serializers.DateTimeField(required=False)
+    tags = TagNamesField(required=False)
+
+    class Meta:
+        model = Todo
+        fields = ['title', 'description', 'due_date', 'priority', 'status',
+                  'created_at', 'completed_at', 'tags']
+
+
 class TodoStatusUpdateSerializer(serializers.ModelSerializer):
     class Meta:
         model = Todo
@@ -90,8 +246,22 @@ class TodoAttachmentSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = TodoAttachment
-        fields = ['id', 'file', 'uploaded_at']
-        read_only_fields = ['id', 'uploaded_at']
+        fields = ['id', 'file', 'name', 'size', 'sha256', 'uploaded_at']
+        read_only_fields = ['id', 'name', 'size', 'sha256', 'uploaded_at']
+
+
+class AttachmentUploadSerializer(serializers.ModelSerializer):
+    checksum = serializers.RegexField(
+        r'^[0-9a-fA-F]{64}$', help_text='SHA-256 of the file, in hex.')
+
+    class Meta:
+        model = AttachmentUpload
+        fields = ['id', 'filename', 'size', 'checksum', 'offset',
+                  'created_at', 'updated_at']
+        read_only_fields = ['id', 'offset', 'created_at', 'updated_at']
+
+    def validate_checksum(self, value):
+        return value.lower()
 
 
 class TodoDetailSerializer(TodoSerializer):
@@ -99,3 +269,245 @@ class TodoDetailSerializer(TodoSerializer):
 
     class Meta(TodoSerializer.Meta):
         fields = TodoSerializer.Meta.fields + ['attachments']
+
+
+class TodoBulkUpdateSerializer(TodoSerializer):
+    id = serializers.IntegerField()
+
+    class Meta(TodoSerializer.Meta):
+        read_only_fields = [
+            'created_at', 'updated_at', 'completed_at', 'user'
+        ]
+
+    def validate(self, attrs):
+        # Updates are partial, which makes every field optional.
+        if 'id' not in attrs:
+            raise serializers.ValidationError(
+                {'id': [self.fields['id'].error_messages['required']]},
+                code='required')
+        return super().validate(attrs)
+
+
+class TodoBulkSerializer(serializers.Serializer):
+    """
+    Apply many create/update/delete operations in one request.
+
+    Every item is validated before anything is written. Tags referenced by
+    any item are resolved in a single lookup, todos are written with
+    ``bulk_create``/``bulk_update`` and tag links with one through-table
+    insert, so the number of queries does not grow with the batch size.
+    The owner gets one summary notification per request.
+    """
+    # Items are validated by TodoSerializer and TodoBulkUpdateSerializer.
+    create = serializers.ListField(required=False, default=list)
+    update = serializers.ListField(required=False, default=list)
+    delete = serializers.ListField(
+        child=serializers.IntegerField(), required=False, default=list)
+
+    def validate(self, attrs):
+        user = self.context['request'].user
+        errors = {}
+
+        creates = TodoSerializer(data=attrs['create'], many=True)
+        if not creates.is_valid():
+            errors['create'] = creates.errors
+
+        updates = TodoBulkUpdateSerializer(
+            data=attrs['update'], many=True, partial=True)
+        if not updates.is_valid():
+            errors['update'] = updates.errors
+
+        if errors:
+            raise serializers.ValidationError(errors)
+
+        update_ids = [item['id'] for item in updates.validated_data]
+        owned = set(Todo.objects.filter(
+            user=user, pk__in=update_ids + attrs['delete']
+        ).values_list('pk', flat=True))
+        missing_updates = {
+            index: {'id': ['Todo not found.']}
+            for index, pk in enumerate(update_ids) if pk not in owned
+        }
+        missing_deletes = {
+            index: ['Todo not found.']
+            for index, pk in enumerate(attrs['delete']) if pk not in owned
+        }
+        if missing_updates:
+            errors['update'] = missing_updates
+        if missing_deletes:
+            errors['delete'] = missing_deletes
+        if errors:
+            raise serializers.ValidationError(errors)
+
+        return {
+            'create': creates.validated_data,
+            'update': updates.validated_data,
+            'delete': attrs['delete'],
+        }
+
+    @transaction.atomic
+    def save(self, **kwargs):
+        user = self.context['request'].user
+        data = self.validated_data
+        tags = resolve_tags([
+            tag_data
+            for item in data['create'] + data['update']
+            for tag_data in item.get('tags', [])
+        ])
+
+        created = self._create(user, data['create'], tags)
+        updated = self._update(user, data['update'], tags)
+        deleted = self._delete(user, data['delete'])
+
+        completed = [todo for todo in updated if todo.status == 'completed']
+        if user.email and (created or completed):
+            build_bulk_notification(user, created, completed).save()
+        bump_user_version(user.pk)
+        # Deletes send their events from the post_delete signal.
+        publish_todo_changes(created, created=True)
+        publish_todo_changes(updated)
+        if rollup_enabled():
+            # bulk_create/bulk_update send no signals to maintain it.
+            rebuild_user_stats(user.pk)
+
+        self.instance = {
+            'create': [{'index': index, 'id': todo.pk, 'status': 'created'}
+                       for index, todo in enumerate(created)],
+            'update': [{'index': index, 'id': todo.pk, 'status': 'updated'}
+                       for index, todo in enumerate(updated)],
+            'delete': [{'index': index, 'id': pk, 'status': 'deleted'}
+                       for index, pk in enumerate(deleted)],
+        }
+        return self.instance
+
+    def to_representation(self, instance):
+        return instance
+
+    def _create(self, user, items, tags):
+        todos = []
+        for item in items:
+            item = dict(item)
+            item.pop('tags', None)
+            todo = Todo(user=user, **item)
+            todo.sync_completed_at()
+            todos.append(todo)
+        Todo.objects.bulk_create(todos, batch_size=BULK_BATCH_SIZE)
+
+        links = {
+            (todo.pk, tags[tag_data['name']].pk)
+            for todo, item in zip(todos, items)
+            for tag_data in item.get('tags', [])
+        }
+        link_tags(links)
+        add_tag_usage((user.pk, tag_id) for _, tag_id in links)
+        return todos
+
+    def _update(self, user, items, tags):
+        if not items:
+            return []
+        todos = Todo.objects.in_bulk([item['id'] for item in items])
+        now = timezone.now()
+        fields = {'updated_at', 'completed_at'}
+        retagged = {}
+        updated = []
+        for item in items:
+            item = dict(item)
+            todo = todos[item.pop('id')]
+            if 'tags' in item:
+                retagged[todo.pk] = [
+                    tags[tag_data['name']].pk for tag_data in item.pop('tags')]
+            for field, value in item.items():
+                setattr(todo, field, value)
+                fields.add(field)
+            todo.updated_at = now
+            todo.sync_completed_at()
+            updated.append(todo)
+        Todo.objects.bulk_update(list(todos.values()), sorted(fields))
+
+        if retagged:
+            old_links = Todo.tags.through.objects.filter(todo_id__in=retagged)
+            links = {
+                (todo_id, tag_id)
+                for todo_id, tag_ids in retagged.items()
+                for tag_id in tag_ids
+            }
+            removed = set(old_links.values_list('todo_id', 'tag_id'))
+            remove_tag_usage((user.pk, tag_id) for _, tag_id in removed)
+            # The delete sends no m2m_changed for the sync tombstones.
+            TodoTombstone.objects.bulk_create([
+                TodoTombstone(user=user, kind='tag', todo_id=todo_id,
+                              tag_id=tag_id)
+                for todo_id, tag_id in removed - links
+            ])
+            old_links.delete()
+            link_tags(links)
+            add_tag_usage((user.pk, tag_id) for _, tag_id in links)
+        return updated
+
+    def _delete(self, user, ids):
+        if ids:
+            Todo.objects.filter(user=user, pk__in=ids).delete()
+        return ids
+
+
+class TodoImportSerializer(serializers.ModelSerializer):
+    rows_per_second = serializers.ReadOnlyField()
+
+    class Meta:
+        model = TodoImport
+        fields = ['id', 'format', 'source', 'status', 'position', 'imported',
+                  'failed', 'errors', 'rows_per_second', 'created_at',
+                  'updated_at']
+        read_only_fields = fields
+
+
+class TodoImportUploadSerializer(serializers.Serializer):
+    """
+    An NDJSON or CSV file to import. The format defaults to the file
+    extension; passing ``job`` resumes that unfinished import with the same
+    file, after its last committed chunk.
+    """
+    EXTENSIONS = {'.ndjson': 'ndjson', '.jsonl': 'ndjson', '.csv': 'csv'}
+
+    file = serializers.FileField()
+    format = serializers.ChoiceField(
+        choices=TodoImport.FORMAT_CHOICES, required=False)
+    job = serializers.IntegerField(required=False)
+
+    def validate(self, attrs):
+        user = self.context['request'].user
+        upload = attrs['file']
+        if 'job' in attrs:
+            job = TodoImport.objects.filter(
+                user=user, pk=attrs['job']).first()
+            if job is None:
+                raise serializers.ValidationError({'job': 'Import not found.'})
+            if job.status == 'completed':
+                raise serializers.ValidationError(
+                    {'job': 'Import already completed.'})
+            if job.source_size is not None and upload.size != job.source_size:
+                raise serializers.ValidationError(
+                    {'file': 'Not the file this import was started with.'})
+            attrs['job'] = job
+            attrs['format'] = job.format
+        elif 'format' not in attrs:
+            extension = os.path.splitext(upload.name or '')[1].lower()
+            if extension not in self.EXTENSIONS:
+                raise serializers.ValidationError(
+                    {'format': 'Cannot tell the format from the file name.'})
+            attrs['format'] = self.EXTENSIONS[extension]
+        return attrs
+
+    def create(self, validated_data):
+        job = validated_data.get('job')
+        if job is not None:
+            job.status = 'running'
+            job.save(update_fields=['status', 'updated_at'])
+            return job
+        upload = validated_data['file']
+        return TodoImport.objects.create(
+            user=self.context['request'].user,
+            format=validated_data['format'],
+            source=(upload.name or '')[:255],
+            source_size=upload.size,
+        )
@@ -1,31 +1,270 @@
-from django.core.mail import send_mail
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_delete)
 from django.dispatch import receiver
+from django.utils import timezone
 
-from .models import Todo
+from . import events, stats, uploads
+from .cache import bump_tags_version, bump_user_version, bump_user_versions
+from .imports import todos_imported
+from .models import (AttachmentUpload, Tag, Todo, TodoAttachment,
+                     TodoTombstone)
+from .notifications import (build_completed_notification,
+                            build_created_notification,
+                            build_import_notification)
+from .tags import add_tag_usage, remove_tag_usage, tag_id_cache
 
 
 @receiver(post_save, sender=Todo)
 def send_todo_notification(sender, instance, created, **kwargs):
+    """
+    Queue the notification in the outbox. The row is written in the same
+    transaction as the todo, so it is only visible to the delivery worker
+    (``manage.py send_notifications``) once the todo is committed.
+    """
+    if not instance.user.email:
+        return
     if created:
-        subject = f'New Todo Created: {instance.title}'
-        message = f'''You have created a new todo:\n\nTitle:
-        {instance.title}\nPriority: {instance.get_priority_display()}\nDue
-        Date: {instance.due_date}'''
-        send_mail(
-            subject,
-            message,
-            'todos@example.com',
-            [instance.user.email],
-            fail_silently=False,
-        )
+        build_created_notification(instance).save()
     elif instance.status == 'completed':
-        subject = f'Todo Completed: {instance.title}'
-        message = f'Congratulations! You have completed the todo:\n\nTitle: {instance.title}'
-        send_mail(
-            subject,
-            message,
-            'todos@example.com',
-            [instance.user.email],
-            fail_silently=False,
-        )
+        build_completed_notification(instance).save()
+
+
+@receiver(todos_imported)
+def send_import_notification(sender, job, imported, **kwargs):
+    if imported and job.user.email:
+        build_import_notification(job, imported).save()
+
+
+def _tag_user_ids(tag_ids):
+    return Todo.objects.filter(tags__in=tag_ids).values_list(
+        'user_id', flat=True).distinct()
+
+
+@receiver(post_save, sender=Todo)
+@receiver(post_delete, sender=Todo)
+def invalidate_todo_cache(sender, instance, **kwargs):
+    bump_user_version(instance.user_id)
+
+
+@receiver(post_save, sender=TodoAttachment)
+@receiver(post_delete, sender=TodoAttachment)
+def invalidate_attachment_cache(sender, instance, **kwargs):
+    user_id = Todo.objects.filter(
+        pk=instance.todo_id).values_list('user_id', flat=True).first()
+    if user_id is not None:
+        bump_user_version(user_id)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(pre_delete, sender=Tag)
+def invalidate_tag_cache(sender, instance, **kwargs):
+    # Tags are shared, so every user with a todo carrying the tag is stale.
+    # On delete the links are still present in pre_delete.
+    bump_user_versions(_tag_user_ids([instance.pk]))
+
+
+@receiver(m2m_changed, sender=Todo.tags.through)
+def invalidate_todo_tags_cache(sender, instance, action, reverse, pk_set,
+                               **kwargs):
+    if reverse and action == 'pre_clear':
+        bump_user_versions(_tag_user_ids([instance.pk]))
+    elif not action.startswith('post_'):
+        return
+    elif not reverse:
+        bump_user_version(instance.user_id)
+    elif pk_set:
+        bump_user_versions(Todo.objects.filter(pk__in=pk_set).values_list(
+            'user_id', flat=True))
+
+
+# ``updated_at`` validates a todo's representation (``todos.conditional``),
+# so changes to its tags and attachments stamp it as well.
+
+@receiver(post_save, sender=TodoAttachment)
+@receiver(post_delete, sender=TodoAttachment)
+def touch_attachment_todo(sender, instance, **kwargs):
+    Todo.objects.filter(pk=instance.todo_id).update(
+        updated_at=timezone.now())
+
+
+@receiver(post_save, sender=Tag)
+@receiver(pre_delete, sender=Tag)
+def touch_tag_todos(sender, instance, created=False, **kwargs):
+    if not created:
+        Todo.objects.filter(tags=instance).update(updated_at=timezone.now())
+
+
+@receiver(m2m_changed, sender=Todo.tags.through)
+def touch_retagged_todos(sender, instance, action, reverse, pk_set,
+                         **kwargs):
+    if reverse:
+        if action == 'pre_clear':
+            Todo.objects.filter(tags=instance).update(
+                updated_at=timezone.now())
+        elif action in ('post_add', 'post_remove') and pk_set:
+            Todo.objects.filter(pk__in=pk_set).update(
+                updated_at=timezone.now())
+    elif action == 'post_clear' or (
+            action in ('post_add', 'post_remove') and pk_set):
+        instance.updated_at = timezone.now()
+        Todo.objects.filter(pk=instance.pk).update(
+            updated_at=instance.updated_at)
+
+
+@receiver(post_delete, sender=AttachmentUpload)
+def delete_upload_chunks(sender, instance, **kwargs):
+    # After commit, so a rolled back finalize keeps its chunks.
+    transaction.on_commit(lambda: uploads.delete_chunks(instance),
+                          robust=True)
+
+
+# Change feed. These receivers run before the rollup ones below, which
+# overwrite ``_loaded_values``.
+
+@receiver(post_save, sender=Todo)
+def publish_todo_saved(sender, instance, created, **kwargs):
+    events.publish_todo_change(instance, created)
+
+
+@receiver(post_delete, sender=Todo)
+def publish_todo_deleted(sender, instance, **kwargs):
+    events.publish_todo_deleted(instance.user_id, instance.pk)
+
+
+@receiver(post_save, sender=TodoAttachment)
+def publish_attachment_added(sender, instance, created, **kwargs):
+    if created:
+        events.publish(instance.todo.user_id, 'attachment', {
+            'todo': instance.todo_id, 'attachment': instance.pk})
+
+
+@receiver(todos_imported)
+def publish_import(sender, job, imported, **kwargs):
+    events.publish(job.user_id, 'imported', {
+        'import': job.pk, 'imported': imported})
+
+
+# Optional statistics rollup (``TODO_STATS_ROLLUP``). Bulk operations that
+# bypass these signals rebuild the affected users' rollups instead.
+
+@receiver(post_save, sender=Todo)
+def update_stats_on_save(sender, instance, created, **kwargs):
+    if stats.rollup_enabled():
+        stats.todo_saved(instance, created)
+
+
+@receiver(pre_delete, sender=Todo)
+def update_tag_stats_on_todo_delete(sender, instance, **kwargs):
+    # The tag links are deleted without m2m_changed, so count them first.
+    if stats.rollup_enabled():
+        stats.tag_links_changed(
+            [(instance.user_id, tag_id) for tag_id in
+             instance.tags.through.objects.filter(
+                 todo_id=instance.pk).values_list('tag_id', flat=True)],
+            -1)
+
+
+@receiver(post_delete, sender=Todo)
+def update_stats_on_delete(sender, instance, **kwargs):
+    if stats.rollup_enabled():
+        stats.todo_deleted(instance)
+
+
+@receiver(post_delete, sender=Tag)
+def delete_tag_stats(sender, instance, **kwargs):
+    if stats.rollup_enabled():
+        stats.tag_deleted(instance.pk)
+
+
+def _tag_links(instance, reverse, pk_set,
+               fields=('todo__user_id', 'tag_id')):
+    links = Todo.tags.through.objects.filter(
+        **{'tag_id' if reverse else 'todo_id': instance.pk})
+    if pk_set is not None:
+        links = links.filter(
+            **{'todo_id__in' if reverse else 'tag_id__in': pk_set})
+    return links.values_list(*fields)
+
+
+@receiver(m2m_changed, sender=Todo.tags.through)
+def update_tag_stats(sender, instance, action, reverse, pk_set, **kwargs):
+    if not stats.rollup_enabled():
+        return
+    # Only links that really change: ``add`` reports the new ones, removals
+    # are read before they happen since ``remove`` ignores missing links.
+    if action == 'post_add' and pk_set:
+        stats.tag_links_changed(_tag_links(instance, reverse, pk_set), 1)
+    elif action == 'pre_remove' and pk_set:
+        stats.tag_links_changed(_tag_links(instance, reverse, pk_set), -1)
+    elif action == 'pre_clear':
+        stats.tag_links_changed(_tag_links(instance, reverse, None), -1)
+
+
+# Per-user tag usage index (``TagUsage``).
+
+@receiver(m2m_changed, sender=Todo.tags.through)
+def update_tag_usage(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'post_add' and pk_set:
+        # ``pk_set`` holds the links really added.
+        add_tag_usage(
+            _tag_links(instance, reverse, pk_set) if reverse
+            else [(instance.user_id, tag_id) for tag_id in pk_set])
+    elif action == 'pre_remove' and pk_set:
+        remove_tag_usage(_tag_links(instance, reverse, pk_set))
+    elif action == 'pre_clear':
+        remove_tag_usage(_tag_links(instance, reverse, None))
+
+
+@receiver(pre_delete, sender=Todo)
+def update_tag_usage_on_todo_delete(sender, instance, **kwargs):
+    remove_tag_usage(
+        (instance.user_id, tag_id) for tag_id in
+        Todo.tags.through.objects.filter(
+            todo_id=instance.pk).values_list('tag_id', flat=True))
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def invalidate_tag_ids(sender, instance, created=False, **kwargs):
+    # New names are simply missing from the caches.
+    if not created:
+        tag_id_cache.clear()
+        bump_tags_version()
+
+
+# Tombstones for the sync endpoint (``todos.sync``). Tag links removed
+# together with their todo are covered by the todo's tombstone.
+
+TOMBSTONE_LINK_FIELDS = ('todo_id', 'todo__user_id', 'tag_id')
+
+
+def _record_tag_tombstones(links):
+    TodoTombstone.objects.bulk_create([
+        TodoTombstone(user_id=user_id, kind='tag', todo_id=todo_id,
+                      tag_id=tag_id)
+        for todo_id, user_id, tag_id in links
+    ])
+
+
+@receiver(post_delete, sender=Todo)
+def record_todo_tombstone(sender, instance, **kwargs):
+    TodoTombstone.objects.create(
+        user_id=instance.user_id, kind='todo', todo_id=instance.pk)
+
+
+@receiver(pre_delete, sender=Tag)
+def record_deleted_tag_tombstones(sender, instance, **kwargs):
+    _record_tag_tombstones(_tag_links(
+        instance, True, None, fields=TOMBSTONE_LINK_FIELDS))
+
+
+@receiver(m2m_changed, sender=Todo.tags.through)
+def record_removed_tag_tombstones(sender, instance, action, reverse, pk_set,
+                                  **kwargs):
+    if action == 'pre_remove' and pk_set:
+        _record_tag_tombstones(_tag_links(
+            instance, reverse, pk_set, fields=TOMBSTONE_LINK_FIELDS))
+    elif action == 'pre_clear':
+        _record_tag_tombstones(_tag_links(
+            instance, reverse, None, fields=TOMBSTONE_LINK_FIELDS))
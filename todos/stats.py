@@ -0,0 +1,337 @@
+from bisect import bisect_left
+from collections import Counter
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.db.models import (Count, DurationField, ExpressionWrapper, F, Min,
+                              Q)
+from django.utils import timezone
+
+from .models import Tag, Todo, TodoStat
+
+# Upper bounds, in seconds, of the completion-time histogram buckets; the
+# last bucket is open-ended. Percentiles are interpolated inside a bucket.
+COMPLETION_BUCKETS = (
+    60, 5 * 60, 15 * 60, 60 * 60, 3 * 3600, 6 * 3600, 12 * 3600,
+    86400, 2 * 86400, 3 * 86400, 7 * 86400, 14 * 86400, 30 * 86400,
+    90 * 86400, 180 * 86400, 365 * 86400,
+)
+PERCENTILES = (50, 90, 95, 99)
+TOTAL = ('total', '')
+
+
+def rollup_enabled():
+    return getattr(settings, 'TODO_STATS_ROLLUP', False)
+
+
+def completion_bucket(created_at, completed_at):
+    seconds = (completed_at - created_at).total_seconds()
+    return bisect_left(COMPLETION_BUCKETS, seconds)
+
+
+def todo_counters(status, priority, created_at, completed_at):
+    """The rollup counters a single todo contributes to."""
+    counters = [TOTAL, ('status', status), ('priority', str(priority))]
+    if status == 'completed' and completed_at and created_at:
+        counters.append(
+            ('completion', str(completion_bucket(created_at, completed_at))))
+    return counters
+
+
+def _counter_queries(user_id):
+    """
+    The grouped counts ``compute_counters`` folds, as ``(dimension,
+    queryset)`` pairs, and the completion-time histogram aggregate.
+    """
+    todos = Todo.objects.filter(user_id=user_id).order_by()
+    groups = [
+        ('status', todos.values_list('status').annotate(Count('id'))),
+        ('priority', todos.values_list('priority').annotate(Count('id'))),
+        ('tag', Todo.tags.through.objects.filter(
+            todo__user_id=user_id).order_by().values_list('tag_id').annotate(
+            Count('id'))),
+    ]
+    duration = ExpressionWrapper(
+        F('completed_at') - F('created_at'), output_field=DurationField())
+    completed = todos.filter(
+        status='completed', completed_at__isnull=False,
+    ).annotate(duration=duration)
+    aggregates = {
+        'total': Count('id'),
+        **{f'le_{index}': Count('id', filter=Q(
+            duration__lte=timedelta(seconds=bound)))
+           for index, bound in enumerate(COMPLETION_BUCKETS)},
+    }
+    return groups, completed, aggregates
+
+
+def _fold_counters(groups, cumulative):
+    counters = Counter({TOTAL: 0})
+    for dimension, rows in groups:
+        for key, count in rows:
+            counters[(dimension, str(key))] = count
+            if dimension == 'status':
+                counters[TOTAL] += count
+
+    previous = 0
+    for index in range(len(COMPLETION_BUCKETS) + 1):
+        upto = cumulative.get(f'le_{index}', cumulative['total'])
+        if upto > previous:
+            counters[('completion', str(index))] = upto - previous
+        previous = upto
+    return counters
+
+
+def compute_counters(user_id):
+    """Count a user's todos from scratch, one aggregate query per dimension."""
+    groups, completed, aggregates = _counter_queries(user_id)
+    return _fold_counters(
+        [(dimension, list(rows)) for dimension, rows in groups],
+        completed.aggregate(**aggregates))
+
+
+async def acompute_counters(user_id):
+    groups, completed, aggregates = _counter_queries(user_id)
+    return _fold_counters(
+        [(dimension, [row async for row in rows])
+         for dimension, rows in groups],
+        await completed.aaggregate(**aggregates))
+
+
+def _rollup(user_id):
+    return TodoStat.objects.filter(user_id=user_id).values_list(
+        'dimension', 'key', 'count')
+
+
+def read_rollup(user_id):
+    return Counter({
+        (dimension, key): count for dimension, key, count in _rollup(user_id)
+    })
+
+
+async def aread_rollup(user_id):
+    return Counter({
+        (dimension, key): count
+        async for dimension, key, count in _rollup(user_id)
+    })
+
+
+@transaction.atomic
+def rebuild_user_stats(user_id):
+    counters = compute_counters(user_id)
+    TodoStat.objects.filter(user_id=user_id).delete()
+    TodoStat.objects.bulk_create([
+        TodoStat(user_id=user_id, dimension=dimension, key=key, count=count)
+        for (dimension, key), count in counters.items()
+        if count or (dimension, key) == TOTAL
+    ])
+    return counters
+
+
+def apply_deltas(deltas):
+    """
+    Add ``{(user_id, dimension, key): delta}`` to the rollup with atomic
+    ``UPDATE ... SET count = count + delta`` statements. Users whose rollup
+    has not been built are skipped, it is computed on first read instead.
+    """
+    by_user = {}
+    for (user_id, dimension, key), delta in deltas.items():
+        if delta:
+            by_user.setdefault(user_id, []).append((dimension, key, delta))
+    for user_id, changes in by_user.items():
+        built = TodoStat.objects.filter(
+            user_id=user_id, dimension='total', key='').update(
+            count=F('count') + sum(delta for dimension, key, delta in changes
+                                   if (dimension, key) == TOTAL))
+        if not built:
+            continue
+        for dimension, key, delta in changes:
+            if (dimension, key) == TOTAL:
+                continue
+            counter = TodoStat.objects.filter(
+                user_id=user_id, dimension=dimension, key=key)
+            if not counter.update(count=F('count') + delta):
+                TodoStat.objects.get_or_create(
+                    user_id=user_id, dimension=dimension, key=key)
+                counter.update(count=F('count') + delta)
+
+
+def _loaded_counters(todo):
+    loaded = getattr(todo, '_loaded_values', None)
+    fields = ('status', 'priority', 'created_at', 'completed_at')
+    if loaded is None or any(field not in loaded for field in fields):
+        return None
+    return todo_counters(*(loaded[field] for field in fields))
+
+
+def _remember(todo):
+    loaded = getattr(todo, '_loaded_values', None)
+    if loaded is None:
+        loaded = todo._loaded_values = {}
+    for field in ('status', 'priority', 'created_at', 'completed_at'):
+        loaded[field] = getattr(todo, field)
+
+
+def todo_saved(todo, created):
+    current = todo_counters(
+        todo.status, todo.priority, todo.created_at, todo.completed_at)
+    previous = [] if created else _loaded_counters(todo)
+    if previous is None:
+        # Not loaded from the database with every field we need (e.g.
+        # ``.only()``), so the old state is unknown.
+        rebuild_user_stats(todo.user_id)
+    else:
+        deltas = Counter()
+        for dimension, key in current:
+            deltas[(todo.user_id, dimension, key)] += 1
+        for dimension, key in previous:
+            deltas[(todo.user_id, dimension, key)] -= 1
+        apply_deltas(deltas)
+    _remember(todo)
+
+
+def todos_created(todos):
+    """Count todos inserted without ``post_save``, e.g. by ``bulk_create``."""
+    deltas = Counter()
+    for todo in todos:
+        for dimension, key in todo_counters(
+                todo.status, todo.priority, todo.created_at,
+                todo.completed_at):
+            deltas[(todo.user_id, dimension, key)] += 1
+    apply_deltas(deltas)
+
+
+def todo_deleted(todo):
+    previous = _loaded_counters(todo) or todo_counters(
+        todo.status, todo.priority, todo.created_at, todo.completed_at)
+    apply_deltas(Counter({
+        (todo.user_id, dimension, key): -1 for dimension, key in previous
+    }))
+
+
+def tag_links_changed(links, sign):
+    """Adjust tag counters for ``(user_id, tag_id)`` links added or removed."""
+    deltas = Counter()
+    for user_id, tag_id in links:
+        deltas[(user_id, 'tag', str(tag_id))] += sign
+    apply_deltas(deltas)
+
+
+def tag_deleted(tag_id):
+    TodoStat.objects.filter(dimension='tag', key=str(tag_id)).delete()
+
+
+def completion_percentiles(counters):
+    buckets = [counters.get(('completion', str(index)), 0)
+               for index in range(len(COMPLETION_BUCKETS) + 1)]
+    total = sum(buckets)
+    result = {'count': total}
+    for percentile in PERCENTILES:
+        result[f'p{percentile}'] = None
+        if not total:
+            continue
+        rank = total * percentile / 100
+        seen = 0
+        for index, count in enumerate(buckets):
+            if count and seen + count >= rank:
+                lower = COMPLETION_BUCKETS[index - 1] if index else 0
+                if index == len(COMPLETION_BUCKETS):
+                    value = lower
+                else:
+                    upper = COMPLETION_BUCKETS[index]
+                    value = lower + (upper - lower) * (rank - seen) / count
+                result[f'p{percentile}'] = round(value)
+                break
+            seen += count
+    return result
+
+
+def _overdue(user_id):
+    return Todo.objects.filter(
+        user_id=user_id,
+        due_date__lt=timezone.now(),
+        status__inline_in=Todo.OPEN_STATUSES,
+        priority__inline_in=[value for value, _ in Todo.PRIORITY_CHOICES],
+    )
+
+
+def overdue_count(user_id):
+    return _overdue(user_id).count()
+
+
+def _upcoming(user_id):
+    return Todo.objects.filter(
+        user_id=user_id,
+        due_date__gte=timezone.now(),
+        status__inline_in=Todo.OPEN_STATUSES,
+    )
+
+
+def next_overdue_at(user_id):
+    """When the next of the user's open todos becomes overdue, or ``None``."""
+    return _upcoming(user_id).aggregate(at=Min('due_date'))['at']
+
+
+async def anext_overdue_at(user_id):
+    return (await _upcoming(user_id).aaggregate(at=Min('due_date')))['at']
+
+
+def _tag_counts(counters):
+    return {int(key): count for (dimension, key), count
+            in counters.items() if dimension == 'tag' and count}
+
+
+def _build_stats(counters, tag_counts, tags, overdue):
+    by_tag = sorted(
+        ({'id': pk, 'name': name, 'count': tag_counts[pk]}
+         for pk, name in tags),
+        key=lambda tag: (-tag['count'], tag['name']))
+
+    return {
+        'total': counters[TOTAL],
+        'by_status': {value: counters.get(('status', value), 0)
+                      for value, _ in Todo.STATUS_CHOICES},
+        'by_priority': {str(value): counters.get(('priority', str(value)), 0)
+                        for value, _ in Todo.PRIORITY_CHOICES},
+        'by_tag': by_tag,
+        'overdue': overdue,
+        'completion_time': completion_percentiles(counters),
+    }
+
+
+def get_todo_stats(user_id):
+    """
+    Statistics for a user's todos. With ``TODO_STATS_ROLLUP`` the counters
+    are read from the rollup (built on first use), otherwise they are
+    aggregated from ``todos_todo``. The overdue count depends on the current
+    time and is always computed, from the partial open-todo index.
+    """
+    if rollup_enabled():
+        counters = read_rollup(user_id)
+        if TOTAL not in counters:
+            counters = rebuild_user_stats(user_id)
+    else:
+        counters = compute_counters(user_id)
+
+    tag_counts = _tag_counts(counters)
+    tags = Tag.objects.filter(pk__in=tag_counts).values_list('pk', 'name')
+    return _build_stats(counters, tag_counts, tags, overdue_count(user_id))
+
+
+async def aget_todo_stats(user_id):
+    """``get_todo_stats`` for async views, with the async ORM."""
+    if rollup_enabled():
+        counters = await aread_rollup(user_id)
+        if TOTAL not in counters:
+            # Rebuilding needs a transaction, which the async ORM lacks.
+            counters = await sync_to_async(rebuild_user_stats)(user_id)
+    else:
+        counters = await acompute_counters(user_id)
+
+    tag_counts = _tag_counts(counters)
+    tags = [tag async for tag in Tag.objects.filter(
+        pk__in=tag_counts).values_list('pk', 'name')]
+    return _build_stats(counters, tag_counts, tags,
+                        await _overdue(user_id).acount())
@@ -0,0 +1,175 @@
+"""
+Delta sync: a user's todo changes since an opaque token.
+
+Changed todos are read in ``(updated_at, id)`` order through the
+``todo_user_updated_at_idx`` index, deletions from ``TodoTombstone`` in
+``(deleted_at, id)`` order, so a sync costs a few range scans proportional
+to the number of changes. Both positions travel in the token.
+"""
+import binascii
+import datetime
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework import serializers
+
+from .models import Todo, TodoTombstone
+from .pagination import CursorEncoder
+from .serializers import TodoReadSerializer, with_attachment_count
+
+User = get_user_model()
+
+DEFAULT_PAGE_SIZE = 500
+DEFAULT_SETTLE_SECONDS = 5
+DEFAULT_TOMBSTONE_DAYS = 30
+
+
+def get_sync_page_size():
+    return getattr(settings, 'TODO_SYNC_PAGE_SIZE', DEFAULT_PAGE_SIZE)
+
+
+def get_sync_settle_seconds():
+    return getattr(settings, 'TODO_SYNC_SETTLE_SECONDS',
+                   DEFAULT_SETTLE_SECONDS)
+
+
+def get_tombstone_days():
+    return getattr(settings, 'TODO_SYNC_TOMBSTONE_DAYS',
+                   DEFAULT_TOMBSTONE_DAYS)
+
+
+def encode_token(changes, tombstones):
+    payload = json.dumps({'c': changes, 't': tombstones},
+                         cls=CursorEncoder, separators=(',', ':'))
+    return urlsafe_b64encode(payload.encode('utf-8')).decode('ascii')
+
+
+def decode_token(token):
+    """Return the ``(changes, tombstones)`` positions stored in ``token``."""
+    try:
+        payload = json.loads(urlsafe_b64decode(token.encode('ascii')))
+        positions = []
+        for key in ('c', 't'):
+            if payload[key] is None:
+                positions.append(None)
+                continue
+            moment, pk = payload[key]
+            moment = parse_datetime(moment)
+            if moment is None or not isinstance(pk, int):
+                raise ValueError
+            positions.append((moment, pk))
+    except (TypeError, ValueError, KeyError, AttributeError, UnicodeError,
+            binascii.Error):
+        raise serializers.ValidationError({'since': ['Invalid sync token.']})
+    if positions[1] is None:
+        raise serializers.ValidationError({'since': ['Invalid sync token.']})
+    return tuple(positions)
+
+
+def after(field, position):
+    moment, pk = position
+    return Q(**{f'{field}__gt': moment}) | Q(**{field: moment, 'pk__gt': pk})
+
+
+def advance(last, full, settled):
+    """
+    The position a token resumes from, and whether more rows follow it. A
+    full page continues after its last row. Otherwise, or when that row is
+    past the settle horizon, the client is caught up to the horizon: a
+    transaction still open may commit a row stamped earlier than rows
+    already read, so rows after the horizon are sent again next time
+    (harmlessly) instead of being skipped.
+    """
+    if full and last[0] <= settled:
+        return last, True
+    return (settled, 0), False
+
+
+def sync_changes(user, token=None, page_size=None):
+    """
+    Return the changes to apply after ``token`` (everything without one):
+
+    - ``changed``: created or modified todos, as the list endpoint renders
+      them, tags included;
+    - ``deleted``: ids of deleted todos;
+    - ``removed_tags``: ``{'todo', 'tag'}`` links removed from todos that
+      still exist;
+    - ``token``: where the next sync resumes, and ``has_more`` when it
+      should follow immediately because a page was full;
+    - ``reset``: the client has to replace its todos with ``changed``,
+      because there was no token or its tombstones were compacted.
+    """
+    page_size = page_size or get_sync_page_size()
+    now = timezone.now()
+    settled = now - datetime.timedelta(seconds=get_sync_settle_seconds())
+    changes, tombstones = decode_token(token) if token else (None, None)
+    reset = tombstones is None or tombstones[0] < now - datetime.timedelta(
+        days=get_tombstone_days())
+    if reset:
+        # A full listing; nothing deleted before it matters.
+        changes, tombstones = None, (settled, 0)
+
+    queryset = with_attachment_count(Todo.objects.filter(user=user))
+    if changes is not None:
+        queryset = queryset.filter(after('updated_at', changes))
+    rows = list(queryset.order_by('updated_at', 'id').values(
+        *TodoReadSerializer.VALUE_FIELDS,
+        'attachment_count')[:page_size + 1])
+    more_changes = len(rows) > page_size
+    rows = rows[:page_size]
+
+    removed = list(TodoTombstone.objects.filter(
+        after('deleted_at', tombstones), user=user,
+    ).order_by('deleted_at', 'id').values_list(
+        'id', 'kind', 'todo_id', 'tag_id', 'deleted_at')[:page_size + 1])
+    more_tombstones = len(removed) > page_size
+    removed = removed[:page_size]
+
+    deleted = [todo_id for _, kind, todo_id, _, _ in removed
+               if kind == 'todo']
+    links = {(todo_id, tag_id) for _, kind, todo_id, tag_id, _ in removed
+             if kind == 'tag'}
+    if links:
+        # Links added back since are in the todo's current tags.
+        links -= set(Todo.tags.through.objects.filter(
+            todo_id__in={todo_id for todo_id, _ in links},
+            tag_id__in={tag_id for _, tag_id in links},
+        ).values_list('todo_id', 'tag_id'))
+
+    last_row = (rows[-1]['updated_at'], rows[-1]['id']) if rows else None
+    last_tombstone = (removed[-1][4], removed[-1][0]) if removed else None
+    changes, more_changes = advance(last_row, more_changes, settled)
+    tombstones, more_tombstones = advance(
+        last_tombstone, more_tombstones, settled)
+    return {
+        'token': encode_token(changes, tombstones),
+        'has_more': more_changes or more_tombstones,
+        'reset': reset,
+        'changed': TodoReadSerializer(rows, user=user).data,
+        'deleted': deleted,
+        'removed_tags': [{'todo': todo_id, 'tag': tag_id}
+                         for todo_id, tag_id in sorted(links)],
+    }
+
+
+def compact_tombstones(batch_size=1000):
+    """
+    Delete tombstones older than ``TODO_SYNC_TOMBSTONE_DAYS``, and those of
+    deleted users, in batches; returns how many. Tokens older than that get
+    a ``reset`` sync instead.
+    """
+    before = timezone.now() - datetime.timedelta(days=get_tombstone_days())
+    expired = TodoTombstone.objects.filter(
+        Q(deleted_at__lt=before) |
+        ~Exists(User.objects.filter(pk=OuterRef('user_id'))))
+    total = 0
+    while True:
+        ids = list(expired.values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            return total
+        total += TodoTombstone.objects.filter(pk__in=ids).delete()[0]
@@ -0,0 +1,151 @@
+import threading
+from collections import Counter, OrderedDict, defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .cache import get_tags_version
+from .models import Tag, TagUsage, Todo
+
+DEFAULT_TAG_CACHE_SIZE = 1024
+# Rows per INSERT of the bulk endpoint and imports.
+BULK_BATCH_SIZE = 1000
+
+
+def get_tag_cache_size():
+    return getattr(settings, 'TODO_TAG_CACHE_SIZE', DEFAULT_TAG_CACHE_SIZE)
+
+
+def resolve_tags(tags_data):
+    """
+    Map tag names to ``Tag`` instances for a list of tag dicts.
+
+    Existing tags are fetched in one query and missing ones are inserted in a
+    single ``bulk_create``. ``ignore_conflicts`` lets concurrent requests
+    create the same name, so the missing names are re-read afterwards.
+    """
+    by_name = {}
+    for tag_data in tags_data:
+        by_name.setdefault(tag_data['name'], tag_data)
+    if not by_name:
+        return {}
+
+    tags = {tag.name: tag for tag in Tag.objects.filter(name__in=by_name)}
+    missing = [name for name in by_name if name not in tags]
+    if missing:
+        Tag.objects.bulk_create(
+            [Tag(**by_name[name]) for name in missing], ignore_conflicts=True)
+        tags.update(
+            (tag.name, tag) for tag in Tag.objects.filter(name__in=missing))
+    return tags
+
+
+def link_tags(links):
+    """Insert ``(todo_id, tag_id)`` pairs into the through table at once."""
+    through = Todo.tags.through
+    through.objects.bulk_create(
+        [through(todo_id=todo_id, tag_id=tag_id) for todo_id, tag_id in links],
+        batch_size=BULK_BATCH_SIZE, ignore_conflicts=True,
+    )
+
+
+class TagIdCache:
+    """
+    In-process LRU map of tag names to ids, holding the
+    ``TODO_TAG_CACHE_SIZE`` most recently used names. Names and ids only
+    change when a tag is renamed or deleted, which bumps the shared tags
+    generation (``todos.cache.bump_tags_version``); every process empties
+    its map when it sees a new generation.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.ids = OrderedDict()
+        self.version = None
+
+    def get_many(self, names):
+        version = get_tags_version()
+        with self.lock:
+            if version != self.version:
+                self.ids.clear()
+                self.version = version
+            found = {}
+            for name in names:
+                if name in self.ids:
+                    self.ids.move_to_end(name)
+                    found[name] = self.ids[name]
+            return found
+
+    def set_many(self, ids):
+        with self.lock:
+            self.ids.update(ids)
+            for name in ids:
+                self.ids.move_to_end(name)
+            while len(self.ids) > get_tag_cache_size():
+                self.ids.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.ids.clear()
+
+
+tag_id_cache = TagIdCache()
+
+
+def resolve_tag_ids(tags_data):
+    """
+    ``resolve_tags`` returning ``{name: id}``, through ``tag_id_cache``: only
+    names it does not hold cost a query. Resolved ids are cached once the
+    transaction commits, since tags it creates are gone if it rolls back.
+    """
+    names = {tag_data['name'] for tag_data in tags_data}
+    ids = tag_id_cache.get_many(names)
+    missing = [tag_data for tag_data in tags_data
+               if tag_data['name'] not in ids]
+    if missing:
+        resolved = {name: tag.pk
+                    for name, tag in resolve_tags(missing).items()}
+        transaction.on_commit(lambda: tag_id_cache.set_many(resolved))
+        ids.update(resolved)
+    return ids
+
+
+def _by_user_and_delta(links):
+    groups = defaultdict(list)
+    for (user_id, tag_id), delta in Counter(links).items():
+        groups[(user_id, delta)].append(tag_id)
+    return groups
+
+
+def add_tag_usage(links):
+    """
+    Count ``(user_id, tag_id)`` links just added in ``TagUsage``, one pair
+    per link: missing rows are inserted, then the counts of each user are
+    raised with an atomic ``UPDATE`` per distinct increment.
+    """
+    links = list(links)
+    if not links:
+        return
+    now = timezone.now()
+    TagUsage.objects.bulk_create(
+        [TagUsage(user_id=user_id, tag_id=tag_id, last_used_at=now)
+         for user_id, tag_id in set(links)],
+        ignore_conflicts=True)
+    for (user_id, delta), tag_ids in _by_user_and_delta(links).items():
+        TagUsage.objects.filter(user_id=user_id, tag_id__in=tag_ids).update(
+            count=F('count') + delta, last_used_at=now)
+
+
+def remove_tag_usage(links):
+    """Uncount links about to be removed; unused rows are deleted."""
+    users = defaultdict(set)
+    for (user_id, delta), tag_ids in _by_user_and_delta(links).items():
+        TagUsage.objects.filter(user_id=user_id, tag_id__in=tag_ids).update(
+            count=Greatest(F('count') - delta, 0))
+        users[user_id].update(tag_ids)
+    for user_id, tag_ids in users.items():
+        TagUsage.objects.filter(
+            user_id=user_id, tag_id__in=tag_ids, count=0).delete()
@@ -1,15 +1,65 @@
+import asyncio
+import gzip
+import hashlib
+import json
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
+
+import redis
+from asgiref.sync import async_to_sync, iscoroutinefunction
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.urls import reverse
+from django.core import mail
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.mail.backends.base import BaseEmailBackend
+from django.core.management import CommandError, call_command
+from django.db import connection, transaction
+from django.test import TestCase, override_settings, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
 from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.parsers import MultiPartParser
+from rest_framework.renderers import JSONRenderer
 from rest_framework.test import APIClient, APITestCase
 
-from .models import Tag, Todo
+from core.testing import QueryBudgetMixin
+
+from .cache import build_list_cache_key, get_user_version
+from .events import get_broker, reset_brokers
+from .health import readiness
+from .models import (AttachmentUpload, Notification, Tag, TagUsage, Todo,
+                     TodoAttachment, TodoImport, TodoStat, TodoTombstone)
+from .notifications import deliver_pending
+from .renderers import FastJSONRenderer
+from .seeding import seed_todos
+from .serializers import TodoSerializer
+from .stats import compute_counters, read_rollup
+from .tags import tag_id_cache
+from .throttles import (BurstRateThrottle, LocalRateLimiter, RedisRateLimiter,
+                        gcra, reset_rate_limiters)
+from .uploads import store_content
+from .views import TodoViewSet
 
 User = get_user_model()
 
 
 class TodoAPITestCase(APITestCase):
     def setUp(self):
+        cache.clear()
         self.user = User.objects.create_user(
             username='testuser',
             email='test@example.com',
@@ -99,6 +149,7 @@ class TodoAPITestCase(APITestCase):
 
 class PaginationTest(APITestCase):
     def setUp(self):
+        cache.clear()
         self.user = User.objects.create_user(
             username='paginationuser',
             email='pagination@example.com',
@@ -124,3 +175,2036 @@ class PaginationTest(APITestCase):
         self.assertIn('next', response.data)
         self.assertIn('previous', response.data)
         self.assertEqual(response.data['count'], 15)
+
+
+class ListCacheTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='cacheuser',
+            email='cache@example.com',
+            password='testpass123'
+        )
+        self.other = User.objects.create_user(
+            username='otheruser',
+            email='other@example.com',
+            password='testpass123'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.todo = Todo.objects.create(
+            title='Cached task', priority=2, user=self.user)
+
+    def test_list_is_cached_per_user(self):
+        url = reverse('todo-list')
+        self.client.get(url)
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertEqual(response.data['count'], 1)
+
+        self.client.force_authenticate(user=self.other)
+        response = self.client.get(url)
+        self.assertEqual(response.data['count'], 0)
+
+    def test_writes_invalidate_list(self):
+        url = reverse('todo-list')
+        self.client.get(url)
+
+        self.client.post(url, {'title': 'Fresh task'}, format='json')
+        response = self.client.get(url)
+        self.assertEqual(response.data['count'], 2)
+
+        self.client.patch(
+            reverse('todo-update-status', kwargs={'pk': self.todo.pk}),
+            {'status': 'completed'}, format='json')
+        response = self.client.get(url, {'status': 'completed'})
+        self.assertEqual(response.data['count'], 1)
+
+        tag = Tag.objects.create(name='Later')
+        self.todo.tags.add(tag)
+        response = self.client.get(url, {'status': 'completed'})
+        self.assertEqual(response.data['results'][0]['tags'][0]['name'],
+                         'Later')
+
+    def test_query_params_are_normalized(self):
+        url = reverse('todo-list')
+        self.client.get(url + '?priority=2&status=pending')
+        with self.assertNumQueries(0):
+            self.client.get(url + '?status=pending&priority=2')
+
+    def test_hits_serve_the_cached_json(self):
+        url = reverse('todo-list')
+        first = self.client.get(url)
+        key = build_list_cache_key(first.renderer_context['request'],
+                                   self.user.pk, get_user_version(self.user.pk))
+        self.assertEqual(cache.get(key), first.content)
+        with self.assertNumQueries(0):
+            second = self.client.get(url)
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(second['Content-Type'], 'application/json')
+        self.assertEqual(second.data, json.loads(first.content))
+        # Other renderings are made from the decoded data.
+        response = self.client.get(
+            url, HTTP_ACCEPT='application/json; indent=2')
+        self.assertEqual(response.content.decode(),
+                         json.dumps(second.data, indent=2))
+
+
+class FailingEmailBackend(BaseEmailBackend):
+    def send_messages(self, email_messages):
+        raise ConnectionRefusedError('SMTP unavailable')
+
+
+class NotificationOutboxTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='outboxuser',
+            email='outbox@example.com',
+            password='testpass123'
+        )
+
+    def test_writes_queue_without_sending(self):
+        todo = Todo.objects.create(title='Queued', user=self.user)
+        todo.status = 'completed'
+        todo.save()
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(
+            Notification.objects.filter(status='pending').count(), 2)
+
+    def test_deliver_pending_sends_batch(self):
+        for i in range(3):
+            Todo.objects.create(title=f'Task {i}', user=self.user)
+        self.assertEqual(deliver_pending(batch_size=2), 3)
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertEqual(mail.outbox[0].to, ['outbox@example.com'])
+        self.assertFalse(
+            Notification.objects.exclude(status='sent').exists())
+
+    @override_settings(
+        EMAIL_BACKEND='todos.tests.FailingEmailBackend',
+        NOTIFICATION_MAX_ATTEMPTS=2)
+    def test_failures_are_retried_with_backoff(self):
+        Todo.objects.create(title='Unlucky', user=self.user)
+        self.assertEqual(deliver_pending(), 0)
+        notification = Notification.objects.get()
+        self.assertEqual(notification.status, 'pending')
+        self.assertEqual(notification.attempts, 1)
+        self.assertGreater(notification.next_attempt_at, timezone.now())
+
+        Notification.objects.update(next_attempt_at=timezone.now())
+        deliver_pending()
+        notification.refresh_from_db()
+        self.assertEqual(notification.status, 'failed')
+        self.assertEqual(notification.attempts, 2)
+
+
+class BulkTodoTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='bulkuser',
+            email='bulk@example.com',
+            password='testpass123'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.tag = Tag.objects.create(name='Work', color='#FF0000')
+        self.todo = Todo.objects.create(
+            title='Existing', priority=1, user=self.user)
+        self.todo.tags.add(self.tag)
+        self.doomed = Todo.objects.create(title='Doomed', user=self.user)
+
+    def test_bulk_operations(self):
+        url = reverse('todo-bulk')
+        data = {
+            'create': [
+                {'title': f'Imported {i}',
+                 'tags': [{'name': 'Work'}, {'name': f'Tag {i % 3}'}]}
+                for i in range(30)
+            ],
+            'update': [
+                {'id': self.todo.pk, 'status': 'completed',
+                 'tags': [{'name': 'Tag 0'}]},
+            ],
+            'delete': [self.doomed.pk],
+        }
+        response = self.client.post(url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['create']), 30)
+        self.assertEqual(response.data['update'][0]['id'], self.todo.pk)
+
+        self.assertEqual(Tag.objects.count(), 4)
+        self.assertEqual(
+            Todo.objects.filter(tags__name='Work').count(), 30)
+        self.todo.refresh_from_db()
+        self.assertEqual(self.todo.status, 'completed')
+        self.assertIsNotNone(self.todo.completed_at)
+        self.assertEqual(
+            list(self.todo.tags.values_list('name', flat=True)), ['Tag 0'])
+        self.assertFalse(Todo.objects.filter(pk=self.doomed.pk).exists())
+
+    def test_query_count_does_not_grow_with_batch(self):
+        url = reverse('todo-bulk')
+        data = {'create': [
+            {'title': f'Imported {i}', 'tags': [{'name': f'Tag {i}'}]}
+            for i in range(50)
+        ]}
+        # Two of them count the tag links in the usage index.
+        with self.assertNumQueries(10):
+            response = self.client.post(url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_invalid_items_reject_whole_batch(self):
+        other = User.objects.create_user(username='stranger')
+        foreign = Todo.objects.create(title='Not mine', user=other)
+        url = reverse('todo-bulk')
+        data = {
+            'create': [{'title': 'Fine'}, {'priority': 2}],
+            'update': [{'id': foreign.pk, 'title': 'Hijacked'}],
+        }
+        response = self.client.post(url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('create', response.data)
+        self.assertEqual(Todo.objects.filter(user=self.user).count(), 2)
+
+    def test_errors_match_list_serializer(self):
+        create = [
+            {'title': 'Fine', 'tags': [{'name': 'ok'}]},
+            {'title': 'Fine', 'priority': 'high'},
+            {'title': 'x' * 201, 'tags': [{'name': 'ok'}, {}, 'bad']},
+            'not a dict',
+            {'title': 'Fine', 'tags': 'bad'},
+        ]
+        update = [{'title': 'No id'}]
+        response = self.client.post(
+            reverse('todo-bulk'), {'create': create, 'update': update},
+            format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        expected = TodoSerializer(data=create, many=True)
+        expected.is_valid()
+        self.assertEqual(response.data['create'], expected.errors)
+        self.assertEqual(response.data['update'],
+                         [{'id': ['This field is required.']}])
+
+
+class KeysetPaginationTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='keysetuser',
+            email='keyset@example.com',
+            password='testpass123'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        now = timezone.now()
+        for i in range(23):
+            Todo.objects.create(
+                title=f'Task {i}',
+                priority=i % 3 + 1,
+                due_date=None if i % 4 == 0 else now + timedelta(days=i % 5),
+                user=self.user
+            )
+
+    def walk(self, params):
+        url = reverse('todo-list')
+        response = self.client.get(url, params)
+        pages = [response.data]
+        while response.data['next']:
+            response = self.client.get(response.data['next'])
+            pages.append(response.data)
+        return pages
+
+    def expected_ids(self, *ordering):
+        return list(Todo.objects.filter(user=self.user).order_by(
+            *ordering).values_list('id', flat=True))
+
+    def test_default_ordering_walks_every_row_once(self):
+        pages = self.walk({'page_size': 5})
+        ids = [todo['id'] for page in pages for todo in page['results']]
+        self.assertEqual(len(pages), 5)
+        self.assertEqual(ids, self.expected_ids('-priority', 'due_date', 'id'))
+
+    def test_ordering_fields(self):
+        for ordering in ('due_date', '-due_date', 'priority', '-created_at'):
+            pages = self.walk({'page_size': 4, 'ordering': ordering})
+            ids = [todo['id'] for page in pages for todo in page['results']]
+            tie_breaker = '-id' if ordering.startswith('-') else 'id'
+            self.assertEqual(
+                ids, self.expected_ids(ordering, tie_breaker), ordering)
+
+    def test_previous_link_returns_prior_page(self):
+        pages = self.walk({'page_size': 5})
+        response = self.client.get(pages[2]['previous'])
+        self.assertEqual(response.data['results'], pages[1]['results'])
+        self.assertIsNone(pages[0]['previous'])
+
+    def test_count_can_be_skipped(self):
+        url = reverse('todo-list')
+        response = self.client.get(url, {'count': 'false'})
+        self.assertNotIn('count', response.data)
+        response = self.client.get(url, {'cursor': 'garbage'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+@skipUnlessDBFeature('supports_partial_indexes')
+class QueryPlanTest(APITestCase):
+    """
+    Run every list-shaped endpoint and check the SQLite plan of each query on
+    the todo table: it must use an index and must not sort in a temp B-tree.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        rng = random.Random(5)
+        now = timezone.now()
+        cls.user = User.objects.create_user(username='planuser')
+        users = [cls.user] + [
+            User.objects.create_user(username=f'planother{i}')
+            for i in range(20)
+        ]
+        Todo.objects.bulk_create([
+            Todo(
+                title=f'Task {i}',
+                user=rng.choice(users),
+                priority=rng.randint(1, 4),
+                status=rng.choice(['pending', 'in_progress', 'completed',
+                                   'archived']),
+                due_date=None if rng.random() < 0.3
+                else now + timedelta(days=rng.randint(-30, 60)),
+            )
+            for i in range(5000)
+        ])
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def capture_todo_queries(self, url, params=None):
+        statements = []
+
+        def capture(execute, sql, params, many, context):
+            if sql.startswith('SELECT') and 'FROM "todos_todo"' in sql:
+                statements.append((sql, params))
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(capture):
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return statements
+
+    def assertIndexedWithoutSort(self, url, params=None):
+        statements = self.capture_todo_queries(url, params)
+        self.assertTrue(statements)
+        for sql, sql_params in statements:
+            with connection.cursor() as cursor:
+                cursor.execute('EXPLAIN QUERY PLAN ' + sql, sql_params)
+                plan = ' | '.join(row[-1] for row in cursor.fetchall())
+            self.assertIn('INDEX', plan, sql)
+            self.assertNotIn('TEMP B-TREE', plan, sql)
+
+    def test_list(self):
+        self.assertIndexedWithoutSort(reverse('todo-list'))
+        self.assertIndexedWithoutSort(reverse('todo-list'),
+                                      {'status': 'Pending'})
+
+    def test_completed(self):
+        self.assertIndexedWithoutSort(reverse('todo-completed'))
+
+    def test_overdue(self):
+        self.assertIndexedWithoutSort(reverse('todo-overdue'))
+
+    def test_sync(self):
+        self.assertIndexedWithoutSort(reverse('todo-sync'))
+        token = self.client.get(reverse('todo-sync')).data['token']
+        self.assertIndexedWithoutSort(reverse('todo-sync'), {'since': token})
+
+    def test_orderings(self):
+        for field in TodoViewSet.ordering_fields:
+            for ordering in (field, f'-{field}'):
+                self.assertIndexedWithoutSort(
+                    reverse('todo-list'), {'ordering': ordering})
+
+
+class FullTextSearchTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='searchuser',
+            email='search@example.com',
+            password='testpass123'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.report = Todo.objects.create(
+            title='Quarterly report',
+            description='Write the quarterly report for finance',
+            user=self.user
+        )
+        self.groceries = Todo.objects.create(
+            title='Groceries', description='Report back on prices',
+            user=self.user
+        )
+        other = User.objects.create_user(username='searchother')
+        Todo.objects.create(title='Quarterly report', user=other)
+        # bm25 needs documents without the term for a meaningful weight.
+        for title in ('Dentist', 'Car service', 'Pay rent', 'Call mom'):
+            Todo.objects.create(title=title, user=other)
+
+    def search(self, **params):
+        response = self.client.get(reverse('todo-list'), params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [todo['id'] for todo in response.data['results']]
+
+    def test_prefix_search_is_ranked_and_scoped_to_user(self):
+        self.assertEqual(self.search(search='repor'),
+                         [self.report.pk, self.groceries.pk])
+        self.assertEqual(self.search(search='quart fin'), [self.report.pk])
+        self.assertEqual(self.search(search='nothing'), [])
+
+        response = self.client.get(
+            reverse('todo-list'), {'search': 'repor', 'page_size': 1})
+        response = self.client.get(response.data['next'])
+        self.assertEqual([todo['id'] for todo in response.data['results']],
+                         [self.groceries.pk])
+
+    def test_index_follows_updates_and_deletes(self):
+        self.report.title = 'Annual summary'
+        self.report.description = ''
+        self.report.save()
+        self.assertEqual(self.search(search='quarterly'), [])
+        self.assertEqual(self.search(search='annual'), [self.report.pk])
+        self.report.delete()
+        self.assertEqual(self.search(search='annual'), [])
+
+    def test_title_filter(self):
+        self.assertEqual(self.search(title='report'), [self.report.pk])
+        self.assertEqual(
+            self.search(search='report', ordering='created_at'),
+            [self.report.pk, self.groceries.pk])
+
+
+class QueryBudgetTest(QueryBudgetMixin, APITestCase):
+    query_budgets = {
+        # count, page with attachment counts, tags prefetch
+        'todo-list': 3,
+        'todo-completed': 3,
+        # the same, and the next due date to pass for the ETag
+        'todo-overdue': 4,
+        # todo, tags prefetch, attachments prefetch
+        'todo-detail': 3,
+        'tag-list': 1,
+    }
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='budgetuser')
+        self.client.force_authenticate(user=self.user)
+        tags = [Tag.objects.create(name=f'budget-{index}')
+                for index in range(3)]
+        for index in range(10):
+            todo = Todo.objects.create(
+                title=f'Budget {index}', user=self.user,
+                status='completed' if index % 2 else 'pending',
+                due_date=timezone.now() - timedelta(days=1))
+            todo.tags.set(tags)
+            for number in range((index + 1) % 3):
+                TodoAttachment.objects.create(
+                    todo=todo, file=f'todo_attachments/{index}-{number}.txt')
+        self.todo = todo
+
+    def test_list_routes(self):
+        for name in ('todo-list', 'todo-completed', 'todo-overdue',
+                     'tag-list'):
+            with self.subTest(name):
+                self.assertWithinQueryBudget(self.client.get, reverse(name))
+
+    def test_list_attachment_counts(self):
+        expected = {todo.pk: todo.attachments.count()
+                    for todo in Todo.objects.filter(user=self.user)}
+        for name in ('todo-list', 'todo-completed', 'todo-overdue'):
+            with self.subTest(name), \
+                    CaptureQueriesContext(connection) as queries:
+                response = self.client.get(reverse(name), {'tags': 'budget-0'})
+                self.assertTrue(response.data['results'])
+                for todo in response.data['results']:
+                    self.assertEqual(todo['attachment_count'],
+                                     expected[todo['id']])
+                # The page query reads the serialized columns only.
+                page_query = next(query['sql'] for query in queries
+                                  if 'attachment_count' in query['sql'])
+                self.assertNotIn('"user_id", ', page_query)
+                self.assertNotIn('auth_user', page_query)
+
+    def test_detail(self):
+        response = self.assertWithinQueryBudget(
+            self.client.get, reverse('todo-detail', args=[self.todo.pk]))
+        self.assertEqual(
+            [attachment['id'] for attachment in response.data['attachments']],
+            list(self.todo.attachments.order_by('pk').values_list(
+                'pk', flat=True)))
+        self.assertEqual(len(response.data['attachments']), 1)
+
+
+@override_settings(HEALTH_CHECK_CACHE_SECONDS=60, HEALTH_CHECK_TIMEOUT=0.2)
+class HealthCheckTest(APITestCase):
+    def setUp(self):
+        readiness.reset()
+        self.addCleanup(readiness.reset)
+
+    def test_liveness_does_no_io(self):
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('health-live'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_readiness_reports_latency_and_is_cached(self):
+        calls = []
+        checks = {name: lambda name=name: calls.append(name)
+                  for name in readiness.checks}
+        with mock.patch.dict(readiness.checks, checks):
+            response = self.client.get(reverse('health-ready'))
+            self.client.get(reverse('health-check'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['status'], 'up')
+        self.assertEqual(set(response.data['components']),
+                         {'database', 'cache'})
+        for component in response.data['components'].values():
+            self.assertIn('latency_ms', component)
+        self.assertEqual(sorted(calls), ['cache', 'database'])
+
+    def test_real_checks(self):
+        response = self.client.get(reverse('health-ready'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_failing_and_slow_components(self):
+        def broken():
+            raise ConnectionError
+
+        with mock.patch.dict(readiness.checks, {
+                'database': lambda: time.sleep(0.5), 'cache': broken}):
+            response = self.client.get(reverse('health-ready'))
+        self.assertEqual(response.status_code,
+                         status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(response.data['components'], {
+            'database': {'status': 'down', 'error': 'timeout'},
+            'cache': {'status': 'down', 'error': 'ConnectionError'},
+        })
+
+        # The hung check is not started again while it is still running.
+        readiness.reset()
+        pending = readiness.pending['database']
+        response = self.client.get(reverse('health-ready'))
+        self.assertIs(readiness.pending['database'], pending)
+        pending.result()
+
+
+class TodoStatsTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='statsuser')
+        self.client.force_authenticate(user=self.user)
+        self.work = Tag.objects.create(name='stats-work')
+        self.home = Tag.objects.create(name='stats-home')
+        now = timezone.now()
+        self.todos = []
+        for index, (status_, priority, hours) in enumerate([
+                ('completed', 1, 0.5), ('completed', 2, 2), ('completed', 3, 30),
+                ('pending', 4, None), ('in_progress', 3, None),
+                ('archived', 2, None)]):
+            todo = Todo.objects.create(
+                title=f'Stats {index}', user=self.user, status=status_,
+                priority=priority, due_date=now - timedelta(days=1))
+            if hours is not None:
+                Todo.objects.filter(pk=todo.pk).update(
+                    created_at=now - timedelta(hours=hours), completed_at=now)
+            todo.tags.add(self.work)
+            self.todos.append(todo)
+        self.todos[0].tags.add(self.home)
+        Todo.objects.create(title='Someone else',
+                            user=User.objects.create_user(username='other'))
+
+    def get_stats(self):
+        response = self.client.get(reverse('todo-stats'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data
+
+    def test_stats(self):
+        with self.assertNumQueries(6):
+            stats = self.get_stats()
+        self.assertEqual(stats['total'], 6)
+        self.assertEqual(stats['by_status'], {
+            'pending': 1, 'in_progress': 1, 'completed': 3, 'archived': 1})
+        self.assertEqual(stats['by_priority'],
+                         {'1': 1, '2': 2, '3': 2, '4': 1})
+        self.assertEqual(stats['by_tag'], [
+            {'id': self.work.pk, 'name': 'stats-work', 'count': 6},
+            {'id': self.home.pk, 'name': 'stats-home', 'count': 1},
+        ])
+        self.assertEqual(stats['overdue'], 2)
+        completion = stats['completion_time']
+        self.assertEqual(completion['count'], 3)
+        # Median lies in the 1-3 hour bucket, p99 in the 1-2 day bucket.
+        self.assertTrue(3600 <= completion['p50'] <= 3 * 3600)
+        self.assertTrue(86400 <= completion['p99'] <= 2 * 86400)
+
+    @override_settings(TODO_STATS_ROLLUP=True)
+    def test_rollup_matches_live_counts(self):
+        with self.settings(TODO_STATS_ROLLUP=False):
+            live = self.get_stats()
+        self.assertFalse(TodoStat.objects.filter(user=self.user).exists())
+        self.assertEqual(self.get_stats(), live)
+        self.assertTrue(TodoStat.objects.filter(user=self.user).exists())
+        with self.assertNumQueries(3):
+            self.assertEqual(self.get_stats(), live)
+
+        todo = self.todos[3]
+        self.client.patch(
+            reverse('todo-update-status', args=[todo.pk]),
+            {'status': 'completed'}, format='json')
+        self.client.post(reverse('todo-list'), {
+            'title': 'New', 'priority': 4,
+            'tags': [{'name': 'stats-home'}]}, format='json')
+        self.todos[1].tags.remove(self.work, self.home)
+        self.work.todos.remove(self.todos[2])
+        self.home.todos.add(self.todos[4])
+        self.todos[0].delete()
+        self.client.post(reverse('todo-bulk'), {
+            'create': [{'title': 'Bulk', 'tags': [{'name': 'stats-work'}]}],
+        }, format='json')
+
+        self.assertEqual(read_rollup(self.user.pk) - Counter(),
+                         compute_counters(self.user.pk) - Counter())
+        self.home.delete()
+        self.assertEqual(read_rollup(self.user.pk) - Counter(),
+                         compute_counters(self.user.pk) - Counter())
+
+    @override_settings(TODO_STATS_ROLLUP=True)
+    def test_check_command_reports_and_repairs_drift(self):
+        self.get_stats()
+        TodoStat.objects.filter(
+            user=self.user, dimension='status', key='completed').update(
+            count=10)
+
+        out = StringIO()
+        call_command('check_todo_stats', '--dry-run', stdout=out)
+        self.assertIn('status:completed rollup=10 actual=3', out.getvalue())
+        self.assertEqual(read_rollup(self.user.pk)[('status', 'completed')],
+                         10)
+
+        out = StringIO()
+        call_command('check_todo_stats', stdout=out)
+        self.assertIn('rebuilt 1 with drift', out.getvalue())
+        self.assertEqual(read_rollup(self.user.pk)[('status', 'completed')],
+                         3)
+
+
+class SeedAndBenchmarkTest(TestCase):
+    def snapshot(self, prefix):
+        return list(Todo.objects.filter(
+            user__username__startswith=prefix).order_by('pk').values_list(
+            'title', 'status', 'priority', 'due_date', 'created_at',
+            'completed_at', 'tags__name'))
+
+    def test_seeding_is_deterministic(self):
+        anchor = timezone.now()
+        seed_todos(users=2, todos_per_user=30, tags=5, seed=7, prefix='a',
+                   anchor=anchor)
+        seed_todos(users=2, todos_per_user=30, tags=5, seed=7, prefix='b',
+                   anchor=anchor)
+        first = self.snapshot('a-')
+        second = [
+            row[:-1] + (row[-1].replace('b-', 'a-', 1) if row[-1] else None,)
+            for row in self.snapshot('b-')
+        ]
+        self.assertEqual(first, second)
+        self.assertEqual(Todo.objects.filter(user__username='a-user-0').count(),
+                         30)
+        self.assertTrue(Todo.objects.filter(
+            created_at__lt=anchor - timedelta(days=1)).exists())
+
+    def test_benchmark_flags_regressions(self):
+        directory = self.enterContext(tempfile.TemporaryDirectory())
+        output = os.path.join(directory, 'results.json')
+        baseline = os.path.join(directory, 'baseline.json')
+        with open(baseline, 'w') as f:
+            json.dump({'results': {'list': {'p95_ms': 0.001},
+                                   'retrieve': {'p95_ms': 10 ** 6}}}, f)
+
+        with self.assertRaisesMessage(CommandError, 'list'):
+            call_command(
+                'benchmark_api', todos=20, users=1, runs=2, warmup=0,
+                scenarios=['list', 'retrieve'], output=output,
+                baseline=baseline, stderr=StringIO())
+
+        with open(output) as f:
+            results = json.load(f)['results']
+        self.assertEqual(set(results), {'list', 'retrieve'})
+        self.assertEqual(results['list']['runs'], 2)
+        self.assertIn('queries_per_request', results['retrieve'])
+        # The seeded dataset is rolled back.
+        self.assertFalse(Todo.objects.exists())
+
+
+def model_serializer_response(self, queryset):
+    """The list path before ``TodoReadSerializer``, for parity checks."""
+    page = self.paginate_queryset(queryset)
+    serializer = self.get_serializer(page, many=True)
+    return self.get_paginated_response(serializer.data)
+
+
+class TodoReadSerializerTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='reader', email='reader@example.com')
+        self.client.force_authenticate(user=self.user)
+        tags = [Tag.objects.create(name=f'read-{index}', color='#00FF00')
+                for index in range(3)]
+        now = timezone.now()
+        for index in range(25):
+            todo = Todo.objects.create(
+                title=f'Read {index}',
+                description=None if index % 3 else f'Description {index}',
+                priority=index % 4 + 1,
+                status=['pending', 'in_progress', 'completed'][index % 3],
+                due_date=None if index % 5 == 0 else
+                now + timedelta(days=index - 12, hours=index),
+                user=self.user)
+            todo.tags.set(tags[:index % 4])
+
+    def assertSameOutput(self, url, params=None):
+        frozen = timezone.now()
+        with mock.patch('django.utils.timezone.now', return_value=frozen):
+            cache.clear()
+            fast = self.client.get(url, params)
+            cache.clear()
+            with mock.patch.object(TodoViewSet, 'read_response',
+                                   model_serializer_response):
+                slow = self.client.get(url, params)
+        self.assertEqual(fast.status_code, status.HTTP_200_OK)
+        self.assertEqual(fast.content, slow.content)
+        return fast
+
+    def test_output_is_identical(self):
+        for url, params in [
+                (reverse('todo-list'), None),
+                (reverse('todo-list'), {'page_size': 100}),
+                (reverse('todo-list'), {'ordering': '-due_date'}),
+                (reverse('todo-list'), {'search': 'read', 'status': 'pending'}),
+                (reverse('todo-completed'), None),
+                (reverse('todo-overdue'), None)]:
+            with self.subTest(url=url, params=params):
+                response = self.assertSameOutput(url, params)
+                self.assertTrue(response.data['results'])
+
+    def test_next_page_is_identical(self):
+        response = self.client.get(reverse('todo-list'))
+        self.assertSameOutput(response.data['next'])
+
+
+class ExportTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='exporter', email='exporter@example.com')
+        self.other = User.objects.create_user(
+            username='other-exporter', email='other-exporter@example.com')
+        self.client.force_authenticate(user=self.user)
+        work = Tag.objects.create(name='work', color='#FF0000')
+        home = Tag.objects.create(name='home', color='#00FF00')
+        for index in range(7):
+            todo = Todo.objects.create(
+                title=f'Export {index}', priority=index % 4 + 1,
+                status='completed' if index % 2 else 'pending',
+                user=self.user)
+            todo.tags.set([work, home][:index % 3])
+        Todo.objects.create(title='Not mine', user=self.other)
+
+    def read(self, response):
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode()
+
+    def test_ndjson_matches_the_api(self):
+        response = self.client.get(reverse('todo-export'),
+                                   {'ordering': 'priority'})
+        self.assertEqual(response['Content-Type'],
+                         'application/x-ndjson; charset=utf-8')
+        self.assertIn('todos.ndjson', response['Content-Disposition'])
+        records = [json.loads(line)
+                   for line in self.read(response).splitlines()]
+
+        listed = self.client.get(
+            reverse('todo-list'), {'ordering': 'priority'}).data['results']
+        self.assertEqual([record['id'] for record in records],
+                         [todo['id'] for todo in listed])
+        for record, todo in zip(records, listed):
+            self.assertEqual(record['title'], todo['title'])
+            self.assertEqual(record['created_at'], todo['created_at'])
+            self.assertEqual(record['tags'],
+                             [tag['name'] for tag in todo['tags']])
+
+    def test_csv_respects_filters(self):
+        response = self.client.get(reverse('todo-export'),
+                                   {'format': 'csv', 'status': 'completed'})
+        self.assertEqual(response['Content-Type'],
+                         'text/csv; charset=utf-8')
+        header, *rows = self.read(response).splitlines()
+        self.assertEqual(header.split(',')[-1], 'tags')
+        self.assertEqual(len(rows), 3)
+        self.assertIn('work|home', self.read(self.client.get(
+            reverse('todo-export'), {'format': 'csv'})))
+
+    def test_tags_are_fetched_per_chunk(self):
+        with self.settings(TODO_EXPORT_CHUNK_SIZE=3):
+            response = self.client.get(reverse('todo-export'))
+            with CaptureQueriesContext(connection) as queries:
+                lines = self.read(response).splitlines()
+        self.assertEqual(len(lines), 7)
+        # One tag query for each of the three chunks of rows.
+        self.assertEqual(sum('todos_todo_tags' in query['sql']
+                             for query in queries.captured_queries), 3)
+
+    def test_command_writes_one_file_per_user(self):
+        directory = self.enterContext(tempfile.TemporaryDirectory())
+        call_command('export_todos', directory, format='csv', workers=1,
+                     chunk_size=2, stdout=StringIO())
+        self.assertEqual(sorted(os.listdir(directory)),
+                         sorted([f'{self.user.pk}.csv', f'{self.other.pk}.csv']))
+        with open(os.path.join(directory, f'{self.user.pk}.csv')) as f:
+            self.assertEqual(len(f.read().splitlines()), 8)
+
+
+class ImportTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='importer', email='importer@example.com')
+        self.client.force_authenticate(user=self.user)
+        self.tag = Tag.objects.create(name='work', color='#FF0000')
+
+    def upload(self, name, lines, **data):
+        content = ''.join(line + '\n' for line in lines).encode()
+        return self.client.post(reverse('todo-import'), {
+            'file': SimpleUploadedFile(name, content), **data,
+        }, format='multipart')
+
+    def ndjson(self, count, **extra):
+        return [json.dumps({'title': f'Imported {index}',
+                            'tags': ['work', f'new-{index % 2}'], **extra})
+                for index in range(count)]
+
+    def test_ndjson_upload(self):
+        created_at = '2020-01-02T03:04:05Z'
+        lines = self.ndjson(5, created_at=created_at, status='completed') + [
+            '{not json',
+            json.dumps({'title': '', 'priority': 9}),
+            json.dumps({'title': 'Dict tags', 'tags': [{'name': 'work'}]}),
+        ]
+        response = self.upload('todos.ndjson', lines)
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['status'], 'completed')
+        self.assertEqual(response.data['imported'], 6)
+        self.assertEqual(response.data['failed'], 2)
+        self.assertEqual([error['line'] for error in response.data['errors']],
+                         [6, 7])
+        self.assertEqual(set(response.data['errors'][1]['errors']),
+                         {'title', 'priority'})
+
+        todos = Todo.objects.filter(user=self.user)
+        self.assertEqual(todos.count(), 6)
+        self.assertEqual(todos.filter(tags=self.tag).count(), 6)
+        self.assertEqual(Tag.objects.count(), 3)
+        imported = todos.get(title='Imported 0')
+        self.assertEqual(imported.created_at.isoformat(),
+                         '2020-01-02T03:04:05+00:00')
+        self.assertIsNotNone(imported.completed_at)
+        # One summary instead of a notification per todo.
+        self.assertEqual(list(Notification.objects.values_list(
+            'subject', flat=True)), ['6 todos imported'])
+
+    def test_queries_do_not_grow_with_rows(self):
+        with self.settings(TODO_IMPORT_CHUNK_SIZE=100):
+            self.upload('warmup.ndjson', self.ndjson(2))
+            with CaptureQueriesContext(connection) as small:
+                self.upload('small.ndjson', self.ndjson(2))
+            with CaptureQueriesContext(connection) as large:
+                self.upload('large.ndjson', self.ndjson(60))
+        self.assertEqual(len(small), len(large))
+
+    def test_resume_after_failed_chunk(self):
+        lines = self.ndjson(7)
+        with self.settings(TODO_IMPORT_CHUNK_SIZE=3), \
+                mock.patch('todos.imports.link_tags',
+                           side_effect=[None, RuntimeError('boom')]), \
+                self.assertRaises(RuntimeError):
+            self.upload('todos.ndjson', lines)
+        job = TodoImport.objects.get()
+        self.assertEqual((job.status, job.position, job.imported),
+                         ('failed', 3, 3))
+        self.assertEqual(Todo.objects.count(), 3)
+
+        with self.settings(TODO_IMPORT_CHUNK_SIZE=3):
+            response = self.upload('todos.ndjson', lines, job=job.pk)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['imported'], 7)
+        self.assertEqual(
+            sorted(Todo.objects.values_list('title', flat=True)),
+            sorted(f'Imported {index}' for index in range(7)))
+
+        response = self.upload('todos.ndjson', lines, job=job.pk)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @override_settings(TODO_STATS_ROLLUP=True)
+    def test_rollup_counts_imported_todos(self):
+        self.client.get(reverse('todo-stats'))
+        self.upload('todos.ndjson', self.ndjson(4, status='completed') +
+                    self.ndjson(3, priority=4))
+        self.assertEqual(read_rollup(self.user.pk),
+                         compute_counters(self.user.pk))
+
+    def test_command_imports_an_export(self):
+        for index in range(4):
+            Todo.objects.create(
+                title=f'Round trip, "{index}"', description='a\nb',
+                priority=index % 4 + 1, user=self.user).tags.add(self.tag)
+        directory = self.enterContext(tempfile.TemporaryDirectory())
+        call_command('export_todos', directory, format='csv', workers=1,
+                     stdout=StringIO())
+        other = User.objects.create_user(username='target')
+
+        stdout = StringIO()
+        call_command('import_todos',
+                     os.path.join(directory, f'{self.user.pk}.csv'),
+                     user='target', chunk_size=3, stdout=stdout,
+                     stderr=StringIO())
+        self.assertIn('4 imported, 0 rejected', stdout.getvalue())
+        fields = ('title', 'description', 'priority', 'created_at',
+                  'tags__name')
+        self.assertEqual(
+            list(Todo.objects.filter(user=other).order_by(
+                'id').values_list(*fields)),
+            list(Todo.objects.filter(user=self.user).order_by(
+                'id').values_list(*fields)))
+
+
+@override_settings(ROOT_URLCONF='core.async_urls')
+class AsyncViewTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        readiness.reset()
+        self.addCleanup(readiness.reset)
+        self.user = User.objects.create_user(username='asyncuser')
+        self.headers = {
+            'authorization': f'Token {Token.objects.create(user=self.user)}'}
+        work = Tag.objects.create(name='async-work')
+        now = timezone.now()
+        self.todos = []
+        for index in range(8):
+            todo = Todo.objects.create(
+                title=f'Async {index}', description=f'Task {index}',
+                user=self.user, priority=index % 4 + 1,
+                status='completed' if index % 3 == 0 else 'pending',
+                due_date=now + timedelta(days=index - 4))
+            todo.tags.add(work)
+            self.todos.append(todo)
+        for name in ('a.txt', 'b.txt'):
+            TodoAttachment.objects.create(
+                todo=self.todos[2], file=f'todo_attachments/{name}')
+        self.other = Todo.objects.create(
+            title='Not yours', user=User.objects.create_user(username='b'))
+
+    async def get_all(self, requests, **headers):
+        responses = []
+        for url, params in requests:
+            await cache.aclear()
+            responses.append(await self.async_client.get(
+                url, params, headers={**self.headers, **headers}))
+        return responses
+
+    def test_read_routes_are_async(self):
+        for name, args in [('todo-list', []), ('todo-detail', [1]),
+                           ('todo-completed', []), ('todo-stats', []),
+                           ('health-ready', [])]:
+            view = resolve(reverse(name, args=args)).func
+            self.assertTrue(iscoroutinefunction(view), name)
+        with self.settings(ROOT_URLCONF='core.urls'):
+            view = resolve(reverse('todo-list')).func
+            self.assertFalse(iscoroutinefunction(view))
+
+    async def test_responses_match_sync_views(self):
+        requests = [
+            (reverse('todo-list'), {}),
+            (reverse('todo-list'), {'page_size': 3, 'ordering': '-priority'}),
+            (reverse('todo-list'), {'status': 'pending', 'search': 'Task'}),
+            (reverse('todo-list'), {'due_date_after': 'not a date'}),
+            (reverse('todo-completed'), {}),
+            (reverse('todo-overdue'), {'page_size': 2}),
+            (reverse('todo-detail', args=[self.todos[2].pk]), {}),
+            (reverse('todo-detail', args=[self.other.pk]), {}),
+            (reverse('todo-stats'), {}),
+        ]
+        first_page = await self.async_client.get(
+            reverse('todo-list'), {'page_size': 3}, headers=self.headers)
+        requests.append((first_page.json()['next'], {}))
+
+        async_responses = await self.get_all(requests)
+        with self.settings(ROOT_URLCONF='core.urls'):
+            sync_responses = await self.get_all(requests)
+
+        for (url, params), actual, expected in zip(
+                requests, async_responses, sync_responses):
+            with self.subTest(url=url, params=params):
+                self.assertEqual(actual.status_code, expected.status_code)
+                self.assertEqual(actual['Content-Type'],
+                                 expected['Content-Type'])
+                self.assertEqual(actual.content, expected.content)
+
+    def test_detail_prefetches_attachments(self):
+        url = reverse('todo-detail', args=[self.todos[2].pk])
+        # Token, todo, tags and attachments.
+        with self.assertNumQueries(4):
+            response = async_to_sync(self.async_client.get)(
+                url, headers=self.headers)
+        self.assertEqual(
+            [attachment['file'] for attachment in response.json()[
+                'attachments']],
+            ['http://testserver/todo_attachments/a.txt',
+             'http://testserver/todo_attachments/b.txt'])
+
+    async def test_authentication(self):
+        url = reverse('todo-list')
+        response = await self.async_client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(response['WWW-Authenticate'], 'Token')
+        response = await self.async_client.get(
+            url, headers={'authorization': 'Token wrong'})
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(response.json(), {'detail': 'Invalid token.'})
+
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['count'], len(self.todos))
+
+    async def test_writes_and_browsable_api_use_drf_views(self):
+        url = reverse('todo-list')
+        response = await self.async_client.post(
+            url, {'title': 'Created', 'priority': 2},
+            content_type='application/json', headers=self.headers)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        response = await self.async_client.patch(
+            reverse('todo-detail', args=[self.todos[0].pk]),
+            {'title': 'Renamed'}, content_type='application/json',
+            headers=self.headers)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['title'], 'Renamed')
+
+        with self.settings(STORAGES={
+                'default': {'BACKEND':
+                            'django.core.files.storage.FileSystemStorage'},
+                'staticfiles': {'BACKEND': 'django.contrib.staticfiles.'
+                                           'storage.StaticFilesStorage'}}):
+            response = await self.async_client.get(
+                url, headers={**self.headers, 'accept': 'text/html'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response['Content-Type'].startswith('text/html'))
+
+    async def test_list_is_cached(self):
+        url = reverse('todo-list')
+        first = await self.async_client.get(url, headers=self.headers)
+        await Todo.objects.filter(pk=self.todos[0].pk).aupdate(title='Stale')
+        second = await self.async_client.get(url, headers=self.headers)
+        self.assertEqual(first.content, second.content)
+
+    async def test_conditional_requests(self):
+        for url in (reverse('todo-list'),
+                    reverse('todo-detail', args=[self.todos[0].pk])):
+            with self.subTest(url=url):
+                response = await self.async_client.get(
+                    url, headers=self.headers)
+                with self.settings(ROOT_URLCONF='core.urls'):
+                    sync_response = await self.async_client.get(
+                        url, headers=self.headers)
+                self.assertEqual(response['ETag'], sync_response['ETag'])
+                response = await self.async_client.get(url, headers={
+                    **self.headers, 'if-none-match': response['ETag']})
+                self.assertEqual(response.status_code,
+                                 status.HTTP_304_NOT_MODIFIED)
+
+    async def test_health_check(self):
+        with mock.patch.dict(readiness.checks, {
+                'database': lambda: None, 'cache': lambda: None}):
+            response = await self.async_client.get(reverse('health-ready'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['status'], 'up')
+
+        readiness.reset()
+        with mock.patch.dict(readiness.checks, {
+                'database': lambda: time.sleep(0.5), 'cache': lambda: None}):
+            with self.settings(HEALTH_CHECK_TIMEOUT=0.1):
+                response = await self.async_client.get(
+                    reverse('health-check'))
+        self.assertEqual(response.status_code,
+                         status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(response.json()['components']['database'],
+                         {'status': 'down', 'error': 'timeout'})
+
+
+class TodoEventsTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        reset_brokers()
+        self.addCleanup(reset_brokers)
+        self.broker = get_broker()
+        self.user = User.objects.create_user(username='eventuser')
+        self.client.force_authenticate(user=self.user)
+
+    def events(self, last_id=0):
+        return self.broker.since(self.user.pk, last_id)[1]
+
+    def test_writes_publish_events_once_committed(self):
+        self.enterContext(self.settings(
+            MEDIA_ROOT=self.enterContext(tempfile.TemporaryDirectory())))
+        with self.captureOnCommitCallbacks(execute=True):
+            todo_id = self.client.post(
+                reverse('todo-list'), {'title': 'Watched'},
+                format='json').data['id']
+            self.client.patch(reverse('todo-update-status', args=[todo_id]),
+                              {'status': 'completed'}, format='json')
+            self.client.patch(reverse('todo-detail', args=[todo_id]),
+                              {'title': 'Renamed'}, format='json')
+            self.client.post(
+                reverse('todo-upload-attachment', args=[todo_id]),
+                {'file': SimpleUploadedFile('notes.txt', b'notes')},
+                format='multipart')
+            self.client.delete(reverse('todo-detail', args=[todo_id]))
+        events = self.events()
+        self.assertEqual(
+            [(event['id'], event['type']) for event in events],
+            [(1, 'created'), (2, 'status'), (3, 'updated'),
+             (4, 'attachment'), (5, 'deleted')])
+        self.assertEqual(events[1]['data']['todo'], todo_id)
+        self.assertEqual(events[1]['data']['status'], 'completed')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                Todo.objects.create(title='Rolled back', user=self.user)
+                transaction.set_rollback(True)
+        self.assertEqual(len(self.events()), 5)
+
+    def test_bulk_and_import_publish_events(self):
+        todo = Todo.objects.create(title='Existing', user=self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('todo-bulk'), {
+                'create': [{'title': 'One'}, {'title': 'Two'}],
+                'update': [{'id': todo.pk, 'status': 'completed'}],
+            }, format='json')
+            self.client.post(reverse('todo-import'), {
+                'file': SimpleUploadedFile(
+                    'todos.ndjson', b'{"title": "Imported"}\n')},
+                format='multipart')
+        self.assertEqual(
+            [event['type'] for event in self.events()],
+            ['created', 'created', 'status', 'imported'])
+
+    @override_settings(TODO_EVENTS_LOG_SIZE=3)
+    def test_log_is_bounded(self):
+        for index in range(5):
+            self.broker.publish(self.user.pk, 'updated', {'todo': index})
+        self.assertEqual(self.broker.since(self.user.pk, 1), (5, None))
+        self.assertEqual([event['id'] for event in self.events(2)],
+                         [3, 4, 5])
+        self.assertEqual(self.events(5), [])
+        self.assertIsNone(self.events(9))
+
+        response = self.client.get(reverse('todo-events'),
+                                   {'last_event_id': 1})
+        self.assertEqual(response.data,
+                         {'last_event_id': 5, 'reset': True, 'events': []})
+        response = self.client.get(
+            reverse('todo-events'), HTTP_ACCEPT='text/event-stream',
+            HTTP_LAST_EVENT_ID='1')
+        self.assertEqual(b''.join(response.streaming_content),
+                         b'retry: 3000\n\nid: 5\nevent: reset\ndata: {}\n\n')
+
+    def test_catch_up(self):
+        for index in range(3):
+            self.broker.publish(self.user.pk, 'updated', {'todo': index})
+        response = self.client.get(reverse('todo-events'),
+                                   {'last_event_id': 1})
+        self.assertEqual(response.data['last_event_id'], 3)
+        self.assertEqual([event['id'] for event in response.data['events']],
+                         [2, 3])
+
+        response = self.client.get(
+            reverse('todo-events'), HTTP_ACCEPT='text/event-stream',
+            HTTP_LAST_EVENT_ID='2')
+        self.assertEqual(response['Content-Type'],
+                         'text/event-stream; charset=utf-8')
+        self.assertEqual(
+            b''.join(response.streaming_content),
+            b'retry: 3000\n\nid: 3\nevent: updated\ndata: {"todo":2}\n\n')
+        response = self.client.get(reverse('todo-events'),
+                                   HTTP_ACCEPT='text/event-stream')
+        self.assertEqual(b''.join(response.streaming_content),
+                         b'retry: 3000\n\nid: 3\n\n')
+
+        response = self.client.get(reverse('todo-events'),
+                                   HTTP_LAST_EVENT_ID='soon')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = APIClient().get(reverse('todo-events'),
+                                   HTTP_ACCEPT='text/event-stream')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertTrue(response.content.startswith(b'event: error\n'))
+
+    @override_settings(ROOT_URLCONF='core.async_urls',
+                       TODO_EVENTS_KEEPALIVE=0.05)
+    async def test_stream_resumes_then_pushes_live_events(self):
+        for index in range(3):
+            self.broker.publish(self.user.pk, 'updated', {'todo': index})
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(
+            reverse('todo-events'),
+            headers={'accept': 'text/event-stream', 'last-event-id': '1'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Cache-Control'], 'no-cache')
+        stream = aiter(response.streaming_content)
+
+        async def read():
+            return await asyncio.wait_for(anext(stream), 5)
+
+        self.assertEqual(await read(), b'retry: 3000\n\n')
+        self.assertEqual(await read(),
+                         b'id: 2\nevent: updated\ndata: {"todo":1}\n\n')
+        self.assertEqual(await read(),
+                         b'id: 3\nevent: updated\ndata: {"todo":2}\n\n')
+        self.assertEqual(await read(), b': keepalive\n\n')
+        self.broker.publish(self.user.pk, 'deleted', {'todo': 0})
+        self.assertEqual(await read(),
+                         b'id: 4\nevent: deleted\ndata: {"todo":0}\n\n')
+
+        # A client disconnecting cancels the task waiting for the next event.
+        reader = asyncio.ensure_future(anext(stream))
+        await asyncio.sleep(0.01)
+        reader.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await reader
+        self.assertFalse(self.broker.subscribers[self.user.pk])
+
+
+@override_settings(TODO_SYNC_SETTLE_SECONDS=0)
+class TodoSyncTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='syncuser')
+        self.client.force_authenticate(user=self.user)
+        self.tag = Tag.objects.create(name='sync-tag')
+        self.todos = []
+        for index in range(3):
+            todo = Todo.objects.create(title=f'Sync {index}', user=self.user)
+            todo.tags.add(self.tag)
+            self.todos.append(todo)
+        Todo.objects.create(title='Not mine',
+                            user=User.objects.create_user(username='other'))
+
+    def sync(self, token=None):
+        response = self.client.get(
+            reverse('todo-sync'), {'since': token} if token else {})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data
+
+    def test_initial_sync_then_deltas(self):
+        first = self.sync()
+        self.assertTrue(first['reset'])
+        self.assertFalse(first['has_more'])
+        self.assertEqual([todo['id'] for todo in first['changed']],
+                         [todo.pk for todo in self.todos])
+        self.assertEqual(first['changed'][0]['tags'][0]['name'], 'sync-tag')
+
+        kept, deleted, untagged = self.todos
+        self.client.patch(reverse('todo-detail', args=[kept.pk]),
+                          {'title': 'Renamed'}, format='json')
+        self.client.delete(reverse('todo-detail', args=[deleted.pk]))
+        untagged.tags.remove(self.tag)
+
+        second = self.sync(first['token'])
+        self.assertFalse(second['reset'])
+        # Removing a tag stamps the todo, which is sent with its new tags.
+        self.assertEqual([todo['title'] for todo in second['changed']],
+                         ['Renamed', 'Sync 2'])
+        self.assertEqual(second['changed'][1]['tags'], [])
+        self.assertEqual(second['deleted'], [deleted.pk])
+        self.assertEqual(second['removed_tags'],
+                         [{'todo': untagged.pk, 'tag': self.tag.pk}])
+
+        third = self.sync(second['token'])
+        self.assertEqual(
+            (third['changed'], third['deleted'], third['removed_tags']),
+            ([], [], []))
+
+    def test_tag_changes(self):
+        token = self.sync()['token']
+        other = Tag.objects.create(name='sync-other')
+        self.todos[0].tags.add(other)
+        # Removed, then added back: only the todo.
+        self.todos[1].tags.remove(self.tag)
+        self.client.patch(reverse('todo-detail', args=[self.todos[1].pk]),
+                          {'tags': [{'name': 'sync-tag'}]}, format='json')
+        other_id = other.pk
+        other.delete()
+
+        data = self.sync(token)
+        # Both are stamped by their tag changes, the first last.
+        self.assertEqual([todo['id'] for todo in data['changed']],
+                         [self.todos[1].pk, self.todos[0].pk])
+        self.assertEqual(data['changed'][1]['tags'][0]['name'], 'sync-tag')
+        self.assertEqual(data['removed_tags'],
+                         [{'todo': self.todos[0].pk, 'tag': other_id}])
+
+    def test_bulk_retag(self):
+        token = self.sync()['token']
+        retagged, kept = self.todos[:2]
+        response = self.client.post(reverse('todo-bulk'), {'update': [
+            {'id': retagged.pk, 'tags': [{'name': 'sync-other'}]},
+            {'id': kept.pk, 'tags': [{'name': 'sync-tag'}]},
+        ]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        data = self.sync(token)
+        self.assertEqual([todo['id'] for todo in data['changed']],
+                         [retagged.pk, kept.pk])
+        self.assertEqual(data['changed'][0]['tags'][0]['name'], 'sync-other')
+        # The kept link was deleted and inserted again, but not removed.
+        self.assertEqual(data['removed_tags'],
+                         [{'todo': retagged.pk, 'tag': self.tag.pk}])
+
+    @override_settings(TODO_SYNC_PAGE_SIZE=2)
+    def test_pages(self):
+        for index in range(3):
+            Todo.objects.create(title=f'More {index}', user=self.user)
+        seen, pages, token = [], 0, None
+        while True:
+            with self.assertNumQueries(3):
+                data = self.sync(token)
+            seen += [todo['id'] for todo in data['changed']]
+            token = data['token']
+            pages += 1
+            if not data['has_more']:
+                break
+        self.assertEqual(pages, 3)
+        self.assertEqual(seen, sorted(seen))
+        self.assertEqual(len(seen), 6)
+
+    @override_settings(TODO_SYNC_SETTLE_SECONDS=60)
+    def test_recent_changes_are_sent_again(self):
+        token = self.sync()['token']
+        data = self.sync(token)
+        self.assertFalse(data['reset'])
+        self.assertEqual(len(data['changed']), 3)
+
+    @override_settings(TODO_SYNC_PAGE_SIZE=2, TODO_SYNC_SETTLE_SECONDS=60)
+    def test_full_pages_stop_at_the_settle_horizon(self):
+        # Full pages of unsettled rows do not move the token past it.
+        first = self.sync()
+        self.assertEqual(len(first['changed']), 2)
+        self.assertFalse(first['has_more'])
+        data = self.sync(first['token'])
+        self.assertEqual(len(data['changed']), 2)
+
+        # Nor do full pages of unsettled tombstones.
+        for todo in self.todos:
+            todo.delete()
+        data = self.sync(data['token'])
+        self.assertEqual(len(data['deleted']), 2)
+        self.assertFalse(data['has_more'])
+        data = self.sync(data['token'])
+        self.assertEqual(len(data['deleted']), 2)
+
+    def test_compaction_and_expired_tokens(self):
+        token = self.sync()['token']
+        ids = [todo.pk for todo in self.todos]
+        for todo in self.todos:
+            todo.delete()
+        TodoTombstone.objects.filter(todo_id=ids[0]).update(
+            deleted_at=timezone.now() - timedelta(days=31))
+        TodoTombstone.objects.create(user_id=10 ** 6, kind='todo', todo_id=1)
+
+        stdout = StringIO()
+        call_command('compact_tombstones', batch_size=1, stdout=stdout)
+        self.assertIn('Deleted 2 tombstone(s)', stdout.getvalue())
+        self.assertEqual(len(self.sync(token)['deleted']), 2)
+
+        with override_settings(TODO_SYNC_TOMBSTONE_DAYS=0):
+            data = self.sync(token)
+        self.assertTrue(data['reset'])
+        self.assertEqual(data['changed'], [])
+
+    def test_invalid_token(self):
+        for token in ('nonsense', 'e30=', 'eyJjIjpudWxsLCJ0IjpudWxsfQ=='):
+            response = self.client.get(reverse('todo-sync'), {'since': token})
+            self.assertEqual(response.status_code,
+                             status.HTTP_400_BAD_REQUEST, token)
+
+
+class ConditionalRequestTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='etaguser')
+        self.client.force_authenticate(user=self.user)
+        self.tag = Tag.objects.create(name='etag-tag')
+        self.todo = Todo.objects.create(title='Cached', user=self.user)
+        self.todo.tags.add(self.tag)
+        self.url = reverse('todo-detail', args=[self.todo.pk])
+
+    def test_retrieve(self):
+        response = self.client.get(self.url)
+        etag = response['ETag']
+        self.assertFalse(etag.startswith('W/'))
+        self.assertIn('Last-Modified', response)
+
+        # Only ``updated_at`` is read.
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url, headers={
+                'if-none-match': etag})
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(response.content, b'')
+        response = self.client.get(self.url, headers={
+            'if-modified-since': response['Last-Modified']})
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        # Tag changes stamp the todo too.
+        self.todo.tags.remove(self.tag)
+        response = self.client.get(self.url, headers={'if-none-match': etag})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['tags'], [])
+        self.assertNotEqual(response['ETag'], etag)
+
+        response = self.client.get(
+            reverse('todo-detail', args=[0]), headers={'if-none-match': etag})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_collections(self):
+        for url in (reverse('todo-list'), reverse('todo-completed'),
+                    reverse('todo-overdue'), reverse('tag-list')):
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                etag = response['ETag']
+                self.assertTrue(etag.startswith('W/'))
+                # The overdue list looks up the next due date to pass.
+                queries = 1 if url == reverse('todo-overdue') else 0
+                with self.assertNumQueries(queries):
+                    response = self.client.get(
+                        url, headers={'if-none-match': etag})
+                self.assertEqual(response.status_code,
+                                 status.HTTP_304_NOT_MODIFIED)
+
+        list_url = reverse('todo-list')
+        etag = self.client.get(list_url)['ETag']
+        self.assertNotEqual(
+            self.client.get(list_url, {'status': 'pending'})['ETag'], etag)
+        tags_etag = self.client.get(reverse('tag-list'))['ETag']
+        self.tag.name = 'etag-renamed'
+        self.tag.save()
+
+        response = self.client.get(list_url, headers={'if-none-match': etag})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['results'][0]['tags'][0]['name'],
+                         'etag-renamed')
+        response = self.client.get(
+            reverse('tag-list'), headers={'if-none-match': tags_etag})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data[0]['name'], 'etag-renamed')
+        response = self.client.get(list_url, headers={
+            'if-modified-since': response['Last-Modified']})
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_overdue_follows_the_clock(self):
+        url = reverse('todo-overdue')
+        self.todo.due_date = timezone.now() + timedelta(hours=1)
+        self.todo.save()
+        response = self.client.get(url)
+        self.assertEqual(response.data['results'], [])
+        self.assertNotIn('Last-Modified', response)
+
+        later = timezone.now() + timedelta(days=1)
+        with mock.patch('django.utils.timezone.now', return_value=later):
+            response = self.client.get(
+                url, headers={'if-none-match': response['ETag']})
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual([todo['id'] for todo in response.data['results']],
+                             [self.todo.pk])
+            response = self.client.get(
+                url, headers={'if-none-match': response['ETag']})
+            self.assertEqual(response.status_code,
+                             status.HTTP_304_NOT_MODIFIED)
+
+    def test_if_match(self):
+        etag = self.client.get(self.url)['ETag']
+        response = self.client.patch(
+            self.url, {'title': 'Mine'}, format='json',
+            headers={'if-match': etag})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        new_etag = response['ETag']
+        self.assertNotEqual(new_etag, etag)
+        self.assertEqual(self.client.get(self.url)['ETag'], new_etag)
+
+        # A client still holding the first version loses.
+        for method, url, data in [
+                ('patch', self.url, {'title': 'Theirs'}),
+                ('put', self.url, {'title': 'Theirs', 'priority': 1}),
+                ('patch', reverse('todo-update-status',
+                                  args=[self.todo.pk]),
+                 {'status': 'completed'})]:
+            with self.subTest(method=method, url=url):
+                response = getattr(self.client, method)(
+                    url, data, format='json', headers={'if-match': etag})
+                self.assertEqual(response.status_code,
+                                 status.HTTP_412_PRECONDITION_FAILED)
+                self.assertEqual(response.data['detail'].code,
+                                 'precondition_failed')
+        self.todo.refresh_from_db()
+        self.assertEqual((self.todo.title, self.todo.status),
+                         ('Mine', 'pending'))
+
+        response = self.client.patch(
+            reverse('todo-update-status', args=[self.todo.pk]),
+            {'status': 'completed'}, format='json',
+            headers={'if-match': new_etag})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['ETag'], self.client.get(self.url)['ETag'])
+
+
+class TagUsageTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        tag_id_cache.clear()
+        self.user = User.objects.create_user(username='taguser')
+        self.client.force_authenticate(user=self.user)
+        self.other = User.objects.create_user(username='othertagger')
+
+    def assertUsageMatchesLinks(self):
+        expected = Counter(Todo.tags.through.objects.values_list(
+            'todo__user_id', 'tag_id'))
+        self.assertEqual(
+            {(usage.user_id, usage.tag_id): usage.count
+             for usage in TagUsage.objects.all()},
+            dict(expected))
+
+    def create(self, title, *tags):
+        # Resolved tag ids are cached on commit.
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('todo-list'), {
+                'title': title, 'tags': [{'name': name} for name in tags]},
+                format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return Todo.objects.get(pk=response.data['id'])
+
+    def test_index_follows_links(self):
+        first = self.create('First', 'home', 'work')
+        second = self.create('Second', 'work')
+        self.assertUsageMatchesLinks()
+
+        home = Tag.objects.get(name='home')
+        home.todos.add(second, Todo.objects.create(
+            title='Theirs', user=self.other))
+        first.tags.remove(home)
+        self.client.patch(reverse('todo-detail', args=[second.pk]),
+                          {'tags': [{'name': 'errands'}]}, format='json')
+        self.assertUsageMatchesLinks()
+
+        self.client.post(reverse('todo-bulk'), {
+            'create': [{'title': 'Bulk', 'tags': [{'name': 'work'},
+                                                  {'name': 'work'}]}],
+            'update': [{'id': first.pk, 'tags': [{'name': 'errands'}]}],
+        }, format='json')
+        self.assertUsageMatchesLinks()
+        home.todos.clear()
+        first.delete()
+        self.assertUsageMatchesLinks()
+        self.assertFalse(TagUsage.objects.filter(count=0).exists())
+
+    def test_tag_list(self):
+        self.create('First', 'home', 'work')
+        self.create('Second', 'work')
+        Todo.objects.create(title='Theirs', user=self.other).tags.add(
+            Tag.objects.create(name='hidden'))
+
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('tag-list'))
+        self.assertEqual(
+            [(tag['name'], tag['usage_count']) for tag in response.data],
+            [('home', 1), ('work', 2)])
+        self.assertIn('last_used_at', response.data[0])
+
+        response = self.client.get(
+            reverse('tag-list'), {'page_size': 1, 'ordering': '-usage_count'})
+        self.assertEqual(response.data['count'], 2)
+        self.assertEqual(response.data['results'][0]['name'], 'work')
+        response = self.client.get(response.data['next'])
+        self.assertEqual(
+            [tag['name'] for tag in response.data['results']], ['home'])
+        self.assertIsNone(response.data['next'])
+
+    def test_tag_ids_are_cached(self):
+        self.create('First', 'home', 'work')
+        with CaptureQueriesContext(connection) as queries:
+            self.create('Second', 'work', 'home')
+        self.assertFalse([query for query in queries
+                          if '"todos_tag"."name" IN' in query['sql']])
+
+        # A rename drops the cached ids: the old name is a new tag again.
+        home = Tag.objects.get(name='home')
+        home.name = 'house'
+        home.save()
+        todo = self.create('Third', 'home')
+        self.assertNotEqual(todo.tags.get().pk, home.pk)
+
+    def test_rolled_back_tags_are_not_cached(self):
+        request = mock.Mock(user=self.user)
+        with self.assertRaises(RuntimeError):
+            with self.captureOnCommitCallbacks(execute=True):
+                with transaction.atomic():
+                    serializer = TodoSerializer(
+                        data={'title': 'Lost', 'tags': [{'name': 'ghost'}]},
+                        context={'request': request})
+                    serializer.is_valid(raise_exception=True)
+                    serializer.save(user=self.user)
+                    raise RuntimeError('Rolled back')
+        self.assertFalse(Tag.objects.filter(name='ghost').exists())
+
+        todo = self.create('Kept', 'ghost')
+        self.assertEqual(todo.tags.get().name, 'ghost')
+
+    def test_update_writes_only_tag_changes(self):
+        def patch(todo, names):
+            return self.client.patch(
+                reverse('todo-detail', args=[todo.pk]),
+                {'title': 'Renamed', 'tags': [{'name': name}
+                                              for name in names]},
+                format='json')
+
+        swap_queries = []
+        for count in (1, 10):
+            names = [f'tag-{count}-{index}' for index in range(count)]
+            todo = self.create(f'{count} tags', *names)
+            with self.subTest(count=count):
+                # Todo, tags prefetch, update in a savepoint, and the tags
+                # read again for the response.
+                with self.assertNumQueries(6):
+                    response = patch(todo, names)
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                self.assertEqual(
+                    sorted(tag['name'] for tag in response.data['tags']),
+                    sorted(names))
+
+                # One tag swapped for another costs the same whatever the
+                # number of kept tags.
+                with CaptureQueriesContext(connection) as queries:
+                    patch(todo, names[1:] + [f'swapped-{count}'])
+                swap_queries.append(len(queries))
+                self.assertEqual(
+                    sorted(todo.tags.values_list('name', flat=True)),
+                    sorted(names[1:] + [f'swapped-{count}']))
+        self.assertEqual(swap_queries[0], swap_queries[1])
+        self.assertUsageMatchesLinks()
+
+
+class AttachmentUploadTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.enterContext(self.settings(
+            MEDIA_ROOT=self.enterContext(tempfile.TemporaryDirectory()),
+            TODO_UPLOAD_CHUNK_SIZE=4, TODO_ATTACHMENT_MAX_SIZE=20))
+        self.user = User.objects.create_user(username='uploader')
+        self.client.force_authenticate(user=self.user)
+        self.todo = Todo.objects.create(title='Files', user=self.user)
+
+    def initiate(self, content, filename='notes.txt', checksum=None):
+        return self.client.post(
+            reverse('todo-uploads', args=[self.todo.pk]), {
+                'filename': filename, 'size': len(content),
+                'checksum': checksum or hashlib.sha256(content).hexdigest(),
+            }, format='json')
+
+    def put(self, upload_id, offset, chunk):
+        return self.client.generic(
+            'PUT', reverse('todo-upload', args=[self.todo.pk, upload_id]),
+            chunk, content_type='application/octet-stream',
+            headers={'Upload-Offset': str(offset)})
+
+    def finalize(self, upload_id):
+        return self.client.post(reverse(
+            'todo-upload-finalize', args=[self.todo.pk, upload_id]))
+
+    def upload(self, content, **kwargs):
+        upload_id = self.initiate(content, **kwargs).data['id']
+        for offset in range(0, len(content), 4):
+            self.put(upload_id, offset, content[offset:offset + 4])
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.finalize(upload_id)
+
+    def test_resumable_upload(self):
+        content = b'hello, chunked world'
+        response = self.initiate(content)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        upload_id = response.data['id']
+        self.assertEqual(response['Upload-Offset'], '0')
+
+        response = self.put(upload_id, 0, content[:4])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['offset'], 4)
+
+        # A retried or skipped chunk is refused with the offset to use.
+        for offset in (0, 8):
+            response = self.put(upload_id, offset, content[offset:offset + 4])
+            self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+            self.assertEqual(response['Upload-Offset'], '4')
+
+        # Resuming starts from the offset the upload reports.
+        response = self.client.get(
+            reverse('todo-upload', args=[self.todo.pk, upload_id]))
+        offset = int(response['Upload-Offset'])
+        while offset < len(content):
+            response = self.put(upload_id, offset, content[offset:offset + 4])
+            offset = response.data['offset']
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.finalize(upload_id)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['name'], 'notes.txt')
+        self.assertEqual(response.data['size'], len(content))
+        self.assertEqual(response.data['sha256'],
+                         hashlib.sha256(content).hexdigest())
+        attachment = self.todo.attachments.get()
+        with attachment.file.open() as file:
+            self.assertEqual(file.read(), content)
+        self.assertFalse(AttachmentUpload.objects.exists())
+        self.assertEqual(
+            os.listdir(os.path.join(settings.MEDIA_ROOT, 'todo_uploads',
+                                    upload_id)), [])
+
+    def test_size_limits(self):
+        response = self.initiate(b'x' * 21)
+        self.assertEqual(response.status_code,
+                         status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+
+        # Chunks over the chunk size or past the declared size.
+        upload_id = self.initiate(b'x' * 6).data['id']
+        response = self.put(upload_id, 0, b'x' * 5)
+        self.assertEqual(response.status_code,
+                         status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        self.put(upload_id, 0, b'x' * 4)
+        response = self.put(upload_id, 4, b'x' * 3)
+        self.assertEqual(response.status_code,
+                         status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+
+        # An incomplete upload cannot be finalized.
+        response = self.finalize(upload_id)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        # A body too large for any allowed file is refused unparsed.
+        with mock.patch.object(MultiPartParser, 'parse') as parse:
+            response = self.client.post(
+                reverse('todo-upload-attachment', args=[self.todo.pk]),
+                {'file': SimpleUploadedFile('big.bin', b'x' * 70000)},
+                format='multipart')
+        self.assertEqual(response.status_code,
+                         status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        parse.assert_not_called()
+        response = self.client.post(
+            reverse('todo-upload-attachment', args=[self.todo.pk]),
+            {'file': SimpleUploadedFile('small.bin', b'x' * 21)},
+            format='multipart')
+        self.assertEqual(response.status_code,
+                         status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+
+    def test_checksum_mismatch(self):
+        response = self.upload(b'some content', checksum='0' * 64)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('checksum', response.data)
+        self.assertFalse(AttachmentUpload.objects.exists())
+        self.assertFalse(self.todo.attachments.exists())
+
+    def test_identical_content_is_stored_once(self):
+        content = b'same bytes'
+        first = self.upload(content)
+        second = self.upload(content, filename='copy.txt')
+        legacy = self.client.post(
+            reverse('todo-upload-attachment', args=[self.todo.pk]),
+            {'file': SimpleUploadedFile('again.txt', content)},
+            format='multipart')
+        self.assertEqual(legacy.status_code, status.HTTP_201_CREATED)
+
+        attachments = self.todo.attachments.order_by('pk')
+        self.assertEqual([attachment.name for attachment in attachments],
+                         ['notes.txt', 'copy.txt', 'again.txt'])
+        names = {attachment.file.name for attachment in attachments}
+        self.assertEqual(len(names), 1)
+        self.assertTrue(first.data['file'].endswith(names.pop()))
+        self.assertEqual({second.data['sha256'], legacy.data['sha256']},
+                         {hashlib.sha256(content).hexdigest()})
+
+    def test_finalize_claims_the_upload(self):
+        content = b'claimed once'
+        upload_id = self.initiate(content).data['id']
+        for offset in range(0, len(content), 4):
+            self.put(upload_id, offset, content[offset:offset + 4])
+
+        # Another request is assembling it.
+        AttachmentUpload.objects.update(finalizing_at=timezone.now())
+        response = self.finalize(upload_id)
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+
+        # Until the claim is older than the lease; a failed store then
+        # releases it for a retry.
+        AttachmentUpload.objects.update(
+            finalizing_at=timezone.now() - timedelta(seconds=61))
+        with override_settings(TODO_UPLOAD_FINALIZE_LEASE=60), \
+                mock.patch('todos.uploads.default_storage.save',
+                           side_effect=OSError('Disk full')):
+            with self.assertRaises(OSError):
+                self.finalize(upload_id)
+        self.assertIsNone(AttachmentUpload.objects.get().finalizing_at)
+
+        # A request whose claim was taken over meanwhile stores nothing.
+        def taken_over(*args, **kwargs):
+            stored = store_content(*args, **kwargs)
+            AttachmentUpload.objects.update(finalizing_at=timezone.now())
+            return stored
+
+        with mock.patch('todos.uploads.store_content', taken_over):
+            response = self.finalize(upload_id)
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertFalse(self.todo.attachments.exists())
+
+        AttachmentUpload.objects.update(finalizing_at=None)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.finalize(upload_id)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertFalse(AttachmentUpload.objects.exists())
+
+    def test_purge_expired_uploads(self):
+        upload_id = self.initiate(b'abandoned').data['id']
+        self.put(upload_id, 0, b'aban')
+        AttachmentUpload.objects.update(
+            updated_at=timezone.now() - timedelta(hours=25))
+        out = StringIO()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('purge_uploads', stdout=out)
+        self.assertIn('Deleted 1 upload(s)', out.getvalue())
+        self.assertEqual(
+            os.listdir(os.path.join(settings.MEDIA_ROOT, 'todo_uploads',
+                                    upload_id)), [])
+
+
+class FakeRedis:
+    """
+    Test double of a Redis client running ``RedisRateLimiter``'s script as
+    ``gcra()`` on a dict, or failing while ``down``.
+    """
+
+    def __init__(self):
+        self.data = {}
+        self.down = False
+        self.calls = 0
+
+    def register_script(self, script):
+        def run(keys, args):
+            self.calls += 1
+            if self.down:
+                raise redis.ConnectionError('Connection refused.')
+            now = time.time_ns() // 1000
+            tat, wait = gcra(self.data.get(keys[0]), now, *args)
+            if not wait:
+                self.data[keys[0]] = tat
+            return wait
+        return run
+
+
+class ThrottleTest(APITestCase):
+    def setUp(self):
+        reset_rate_limiters()
+        self.addCleanup(reset_rate_limiters)
+        self.user = User.objects.create_user(username='throttled')
+        self.client.force_authenticate(user=self.user)
+
+    def hits(self, limiter, count, key='user-1', rate=(3, 60)):
+        return [limiter.hit(key, *rate) for _ in range(count)]
+
+    def test_gcra(self):
+        # 3/minute: a burst of 3, then one every 20 seconds.
+        limiter = LocalRateLimiter()
+        waits = self.hits(limiter, 5)
+        self.assertEqual(waits[:3], [0, 0, 0])
+        for wait in waits[3:]:
+            self.assertAlmostEqual(wait, 20, delta=1)
+        self.assertEqual(self.hits(limiter, 1, key='user-2'), [0])
+        # One number per client, whatever the rate.
+        self.hits(limiter, 1000, key='user-3', rate=(1000, 60))
+        self.assertEqual(len(limiter.tats), 3)
+
+    def test_retry_after(self):
+        class ThreePerMinute(BurstRateThrottle):
+            rate = '3/minute'
+
+        self.enterContext(mock.patch.object(
+            TodoViewSet, 'throttle_classes', [ThreePerMinute]))
+        codes = [self.client.get(reverse('todo-list')).status_code
+                 for _ in range(4)]
+        self.assertEqual(codes, [200, 200, 200, 429])
+        response = self.client.get(reverse('todo-list'))
+        self.assertIn(int(response['Retry-After']), (20, 21))
+
+    def test_checks_are_atomic(self):
+        limiter = LocalRateLimiter()
+        waits = []
+
+        def hit():
+            waits.extend(self.hits(limiter, 20, rate=(50, 60)))
+
+        threads = [threading.Thread(target=hit) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(waits.count(0), 50)
+
+    def test_redis_with_local_fallback(self):
+        fake = FakeRedis()
+        limiter = RedisRateLimiter(client=fake)
+        self.assertEqual(self.hits(limiter, 3), [0, 0, 0])
+        self.assertTrue(self.hits(limiter, 1)[0])
+        self.assertEqual(list(fake.data), ['todos:throttle:user-1'])
+
+        fake.down = True
+        with self.assertLogs('todos.throttles', 'WARNING'):
+            self.assertEqual(self.hits(limiter, 2), [0, 0])
+        # Redis is left alone until the fallback period is over.
+        self.assertEqual(fake.calls, 5)
+        fake.down = False
+        with mock.patch('time.monotonic',
+                        return_value=limiter.retry_at + 1):
+            self.hits(limiter, 2, key='user-4')
+        self.assertEqual(fake.calls, 7)
+        self.assertIn('todos:throttle:user-4', fake.data)
+
+    def test_benchmark(self):
+        out = StringIO()
+        call_command('benchmark_throttle', runs=20, warmup=0,
+                     rate='10/minute', clients=1, stdout=out,
+                     stderr=StringIO())
+        results = json.loads(out.getvalue())
+        self.assertEqual(set(results), {'cache', 'local'})
+        for summary in results.values():
+            self.assertEqual(summary['allowed'], 10)
+            self.assertGreater(summary['checks_per_s'], 0)
+
+
+class CacheMemoryReportTest(TestCase):
+    class Redis:
+        sizes = {
+            b':1:todos:user:1:version': 56,
+            b':1:todos:user:2:version': 56,
+            b':1:todos:user:1:v1700000000:list:9f86d081': 2048,
+            b'todos:throttle:throttle_user_1': 64,
+            b':1:todos:user:2:v1700000001:list:e3b0c442': None,
+        }
+
+        def scan_iter(self, match, count):
+            return iter(self.sizes)
+
+        def pipeline(self, transaction):
+            keys = []
+            return mock.Mock(memory_usage=keys.append, execute=lambda: [
+                self.sizes[key] for key in keys])
+
+    def test_memory_is_grouped_by_prefix(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        baseline = os.path.join(directory, 'before.json')
+        command = 'todos.management.commands.cache_memory_report'
+        client = self.Redis()
+        with mock.patch(f'{command}.get_redis_connection',
+                        return_value=client):
+            call_command('cache_memory_report', count=2, output=baseline)
+            client.sizes = {**client.sizes, b':1:todos:user:1:version': 48}
+            stdout, stderr = StringIO(), StringIO()
+            call_command('cache_memory_report', baseline=baseline,
+                         stdout=stdout, stderr=stderr)
+        report = json.loads(stdout.getvalue())
+        self.assertEqual(report['keys'], 5)
+        self.assertEqual(report['bytes'], 2216)
+        self.assertEqual(report['prefixes'], {
+            'todos:user:*:*:list:*': {'keys': 2, 'bytes': 2048},
+            'todos:throttle:*': {'keys': 1, 'bytes': 64},
+            'todos:user:*:version': {'keys': 2, 'bytes': 104},
+        })
+        self.assertIn('todos:user:*:version', stderr.getvalue())
+        self.assertIn('112 ->          104', stderr.getvalue())
+
+
+class FastJSONRendererTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='renderer')
+        self.client.force_authenticate(user=self.user)
+
+    def test_output_matches_json_renderer(self):
+        offset = timezone.get_fixed_timezone(60)
+        values = [
+            {'at': timezone.now(), 'local': datetime(2024, 1, 2, 3, 4, 5,
+                                                     tzinfo=offset),
+             'day': date(2024, 1, 2), 'price': Decimal('1.10'),
+             'status': _('Pending'), 'id': uuid.uuid4(), 1: None},
+            ['naïve     \U0001f600', 2 ** 70, 1.5, -0.0],
+            [1e16, 1e-05, 1.5e300, {'rank': -2.5e-07}],
+            ['1e5:[0.00001', '6e0f9a'],
+            None,
+        ]
+        for value in values:
+            self.assertEqual(FastJSONRenderer().render(value),
+                             JSONRenderer().render(value))
+        self.assertEqual(
+            FastJSONRenderer().render(values[0], 'application/json; indent=2'),
+            JSONRenderer().render(values[0], 'application/json; indent=2'))
+
+    @override_settings(COMPRESSION_MIN_LENGTH=200)
+    def test_cached_lists_are_sent_compressed(self):
+        for i in range(5):
+            Todo.objects.create(title=f'Compressed {i}', user=self.user)
+        url = reverse('todo-list')
+        plain = self.client.get(url)
+        self.assertNotIn('Content-Encoding', plain)
+        first = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip')
+        with self.assertNumQueries(0):
+            second = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip, br')
+        key = build_list_cache_key(second.renderer_context['request'],
+                                   self.user.pk, get_user_version(self.user.pk))
+        for response in (first, second):
+            self.assertEqual(response['Content-Encoding'], 'gzip')
+            self.assertIn('Accept-Encoding', response['Vary'])
+            self.assertEqual(response.content, cache.get(key))
+            self.assertEqual(gzip.decompress(response.content), plain.content)
+        self.assertEqual(second.data['count'], 5)
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip;q=0')
+        self.assertNotIn('Content-Encoding', response)
+        self.assertEqual(response.content, plain.content)
+
+    def test_benchmark(self):
+        out = StringIO()
+        call_command('benchmark_render', sizes=[2, 5], runs=2, stdout=out,
+                     stderr=StringIO())
+        results = json.loads(out.getvalue())
+        self.assertEqual(set(results['render']), {
+            'JSONRenderer-2', 'FastJSONRenderer-2',
+            'JSONRenderer-5', 'FastJSONRenderer-5'})
+        self.assertLess(results['bytes']['5']['gzip'],
+                        results['bytes']['5']['identity'])
+        self.assertFalse(Todo.objects.exists())
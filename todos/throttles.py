@@ -1,4 +1,212 @@
-from rest_framework.throttling import ScopedRateThrottle, UserRateThrottle
+"""
+Rate throttles backed by a generic cell rate algorithm (GCRA).
+
+DRF's ``SimpleRateThrottle`` keeps a list of request timestamps per client
+in the cache, reads it, trims it in Python and writes it back: two round
+trips, a list growing with the rate, and concurrent requests on other
+workers overwriting each other's timestamps. Here a client's state is a
+single number, the theoretical arrival time (TAT) of its next request, and
+a check is one call to the rate limiter (``TODO_THROTTLE_BACKEND``):
+
+- ``RedisRateLimiter`` runs the check as a Lua script on the Redis server
+  of the ``TODO_THROTTLE_CACHE`` cache, atomically and on Redis' clock, so
+  every worker shares the same limits. While Redis is unreachable checks
+  fall back to a ``LocalRateLimiter`` for ``TODO_THROTTLE_FALLBACK_SECONDS``
+  before Redis is tried again; limits then apply per process.
+- ``LocalRateLimiter`` keeps the TATs in process memory.
+
+A rate of ``N/period`` lets N requests through back to back, then one every
+``period / N``; ``wait()`` is the time until the next one is allowed, sent
+as ``Retry-After``.
+"""
+import logging
+import math
+import threading
+import time
+
+import redis
+from django.conf import settings
+from django.utils.module_loading import import_string
+from rest_framework import throttling
+
+try:
+    from django_redis import get_redis_connection
+except ImportError:  # pragma: no cover
+    get_redis_connection = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BACKEND = 'todos.throttles.LocalRateLimiter'
+DEFAULT_CACHE = 'default'
+DEFAULT_FALLBACK_SECONDS = 5
+DEFAULT_LOCAL_MAX_KEYS = 10000
+MICROSECONDS = 1000000
+
+
+def get_throttle_cache():
+    return getattr(settings, 'TODO_THROTTLE_CACHE', DEFAULT_CACHE)
+
+
+def get_fallback_seconds():
+    return getattr(settings, 'TODO_THROTTLE_FALLBACK_SECONDS',
+                   DEFAULT_FALLBACK_SECONDS)
+
+
+def get_local_max_keys():
+    return getattr(settings, 'TODO_THROTTLE_LOCAL_MAX_KEYS',
+                   DEFAULT_LOCAL_MAX_KEYS)
+
+
+def emission_interval(num_requests, duration):
+    """Microseconds between requests at the sustained rate."""
+    return math.ceil(duration * MICROSECONDS / num_requests)
+
+
+def gcra(tat, now, interval, period):
+    """
+    Return ``(new_tat, wait)`` for a request at ``now`` given the stored
+    ``tat`` (``None`` for a new client), in microseconds. The request is
+    allowed when ``wait`` is 0; otherwise the TAT is left unchanged.
+    """
+    new_tat = max(tat or now, now) + interval
+    wait = new_tat - now - period
+    if wait > 0:
+        return tat, wait
+    return new_tat, 0
+
+
+class LocalRateLimiter:
+    """
+    Rate limiter for a single process (development, tests, and the fallback
+    of ``RedisRateLimiter``). Past ``TODO_THROTTLE_LOCAL_MAX_KEYS`` clients,
+    those whose TAT has passed, which are back to a full burst anyway, are
+    forgotten.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.tats = {}
+
+    def hit(self, key, num_requests, duration):
+        """Record a request; returns the seconds to wait, 0 if allowed."""
+        now = time.time_ns() // 1000
+        with self.lock:
+            tat, wait = gcra(self.tats.get(key), now,
+                             emission_interval(num_requests, duration),
+                             duration * MICROSECONDS)
+            if not wait:
+                if key not in self.tats and \
+                        len(self.tats) >= get_local_max_keys():
+                    self.prune(now)
+                self.tats[key] = tat
+        return wait / MICROSECONDS
+
+    def prune(self, now):
+        self.tats = {key: tat for key, tat in self.tats.items() if tat > now}
+
+
+class RedisRateLimiter:
+    """
+    Rate limiter shared by every process through Redis. The script is
+    ``gcra()`` on the server: one ``EVALSHA`` per check, one key per client,
+    expiring once its TAT has passed.
+    """
+    SCRIPT = """
+        local time = redis.call('TIME')
+        local now = tonumber(time[1]) * 1000000 + tonumber(time[2])
+        local interval = tonumber(ARGV[1])
+        local period = tonumber(ARGV[2])
+        local tat = tonumber(redis.call('GET', KEYS[1]) or now)
+        if tat < now then
+            tat = now
+        end
+        local new_tat = tat + interval
+        local wait = new_tat - now - period
+        if wait > 0 then
+            return wait
+        end
+        redis.call('SET', KEYS[1], string.format('%.0f', new_tat),
+                   'PX', math.ceil((new_tat - now) / 1000))
+        return 0
+    """
+    KEY_PREFIX = 'todos:throttle:'
+
+    def __init__(self, client=None):
+        if client is None:
+            client = get_redis_connection(get_throttle_cache())
+        self.script = client.register_script(self.SCRIPT)
+        self.fallback = LocalRateLimiter()
+        self.retry_at = 0
+
+    def hit(self, key, num_requests, duration):
+        if time.monotonic() >= self.retry_at:
+            try:
+                wait = self.script(
+                    keys=[self.KEY_PREFIX + key],
+                    args=[emission_interval(num_requests, duration),
+                          duration * MICROSECONDS])
+            except redis.RedisError as exc:
+                logger.warning(
+                    'Throttling in-process, Redis is unavailable: %s', exc)
+                self.retry_at = time.monotonic() + get_fallback_seconds()
+            else:
+                self.retry_at = 0
+                return int(wait) / MICROSECONDS
+        return self.fallback.hit(key, num_requests, duration)
+
+
+class UnlimitedRateLimiter:
+    """Allows every request; for benchmarks measuring the views alone."""
+
+    def hit(self, key, num_requests, duration):
+        return 0
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter():
+    path = getattr(settings, 'TODO_THROTTLE_BACKEND', DEFAULT_BACKEND)
+    with _limiters_lock:
+        if path not in _limiters:
+            _limiters[path] = import_string(path)()
+        return _limiters[path]
+
+
+def reset_rate_limiters():
+    """Forget the loaded rate limiters, and with them the local state."""
+    with _limiters_lock:
+        _limiters.clear()
+
+
+class GCRAThrottleMixin:
+    """
+    Replace ``SimpleRateThrottle``'s timestamp history with a check of the
+    rate limiter; rates, scopes and cache keys are unchanged.
+    """
+    _wait = None
+
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+        key = self.get_cache_key(request, view)
+        if key is None:
+            return True
+        self._wait = get_rate_limiter().hit(
+            key, self.num_requests, self.duration)
+        return not self._wait
+
+    def wait(self):
+        return self._wait or None
+
+
+class AnonRateThrottle(GCRAThrottleMixin, throttling.AnonRateThrottle):
+    pass
+
+
+class UserRateThrottle(GCRAThrottleMixin, throttling.UserRateThrottle):
+    pass
 
 
 class BurstRateThrottle(UserRateThrottle):
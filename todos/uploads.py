@@ -0,0 +1,266 @@
+"""
+Attachment storage and resumable uploads.
+
+An upload is initiated with the file's name, size and SHA-256, then sent in
+consecutive chunks (``PUT`` with an ``Upload-Offset`` header), each written
+straight from the request to the storage backend as a file of its own. A
+client that lost its connection asks for the upload's ``offset`` and carries
+on from there. Finalizing reads the chunks back in order, verifies the
+checksum and stores the assembled file, unless an attachment with the same
+content already exists, whose file is then shared. Size limits are checked
+against the declared size and ``Content-Length`` before anything is read.
+
+Hashing and storing a file take long; they run outside any transaction, so
+that SQLite's write lock is only held to insert the attachment.
+"""
+import hashlib
+import io
+import os
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.text import get_valid_filename
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions, serializers, status
+
+from .models import AttachmentUpload, TodoAttachment
+
+DEFAULT_MAX_SIZE = 50 * 1024 * 1024
+DEFAULT_CHUNK_SIZE = 8 * 1024 * 1024
+DEFAULT_EXPIRY_HOURS = 24
+DEFAULT_FINALIZE_LEASE = 600
+BLOCK_SIZE = 64 * 1024
+# Room for the boundaries and part headers around a multipart file.
+MULTIPART_OVERHEAD = 64 * 1024
+ATTACHMENT_PATH = 'todo_attachments/{prefix}/{digest}{extension}'
+CHUNK_PATH = 'todo_uploads/{upload_id}/{offset}'
+
+
+def get_attachment_max_size():
+    return getattr(settings, 'TODO_ATTACHMENT_MAX_SIZE', DEFAULT_MAX_SIZE)
+
+
+def get_upload_chunk_size():
+    return getattr(settings, 'TODO_UPLOAD_CHUNK_SIZE', DEFAULT_CHUNK_SIZE)
+
+
+def get_upload_expiry_hours():
+    return getattr(settings, 'TODO_UPLOAD_EXPIRY_HOURS',
+                   DEFAULT_EXPIRY_HOURS)
+
+
+def get_finalize_lease():
+    return getattr(settings, 'TODO_UPLOAD_FINALIZE_LEASE',
+                   DEFAULT_FINALIZE_LEASE)
+
+
+class PayloadTooLarge(exceptions.APIException):
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_detail = _('The file is too large.')
+    default_code = 'too_large'
+
+
+class OffsetConflict(exceptions.APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_code = 'offset_conflict'
+
+    def __init__(self, offset):
+        self.offset = offset
+        super().__init__(f'The upload continues at offset {offset}.')
+
+
+class FinalizeConflict(exceptions.APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = _('The upload is already being finalized.')
+    default_code = 'finalizing'
+
+
+class ChunkReader(io.RawIOBase):
+    """Read-only file object over an iterable of byte strings."""
+
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.pending = b''
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self.pending:
+            self.pending = next(self.chunks, None)
+            if self.pending is None:
+                self.pending = b''
+                return 0
+        size = min(len(buffer), len(self.pending))
+        buffer[:size] = self.pending[:size]
+        self.pending = self.pending[size:]
+        return size
+
+
+def read_body(stream, length):
+    """Yield at most ``length`` bytes of a request body, in blocks."""
+    remaining = length
+    while remaining:
+        data = stream.read(min(BLOCK_SIZE, remaining))
+        if not data:
+            return
+        remaining -= len(data)
+        yield data
+
+
+def read_chunks(upload):
+    for name, _ in upload.chunks:
+        with default_storage.open(name) as chunk:
+            yield from chunk.chunks(BLOCK_SIZE)
+
+
+def attachment_path(digest, filename):
+    extension = os.path.splitext(get_valid_filename(filename))[1][:16]
+    return ATTACHMENT_PATH.format(
+        prefix=digest[:2], digest=digest, extension=extension.lower())
+
+
+def store_content(filename, open_content, checksum=None):
+    """
+    Store a file's content and return its ``(name, size, sha256)``.
+    ``open_content()`` returns an iterable of the file's bytes; it is read
+    once for the SHA-256, compared with ``checksum`` if given, and a second
+    time to store the file unless an attachment with the same content
+    already has it.
+    """
+    digest = hashlib.sha256()
+    size = 0
+    for data in open_content():
+        digest.update(data)
+        size += len(data)
+    digest = digest.hexdigest()
+    if checksum is not None and digest != checksum:
+        raise serializers.ValidationError(
+            {'checksum': ['The received file does not match the checksum.']})
+
+    name = TodoAttachment.objects.filter(sha256=digest).values_list(
+        'file', flat=True).first()
+    if not name or not default_storage.exists(name):
+        name = default_storage.save(
+            attachment_path(digest, filename),
+            File(ChunkReader(open_content()), name=filename),
+            max_length=TodoAttachment._meta.get_field('file').max_length)
+    return name, size, digest
+
+
+def save_attachment(todo, filename, open_content, checksum=None):
+    """Store a file (see ``store_content``) as an attachment of ``todo``."""
+    name, size, digest = store_content(filename, open_content, checksum)
+    return TodoAttachment.objects.create(
+        todo=todo, file=name, name=filename, size=size, sha256=digest)
+
+
+def check_size(size):
+    if size > get_attachment_max_size():
+        raise PayloadTooLarge(
+            f'Attachments are limited to {get_attachment_max_size()} bytes.')
+
+
+def check_content_length(request):
+    """
+    Refuse a multipart body too large to hold an allowed file before it is
+    parsed; the file's own size is checked once it is.
+    """
+    try:
+        length = int(request.META.get('CONTENT_LENGTH') or 0)
+    except ValueError:
+        return
+    check_size(length - MULTIPART_OVERHEAD)
+
+
+def receive_chunk(upload, offset, length, stream):
+    """
+    Store ``length`` bytes of ``stream`` at ``offset`` of ``upload``, which
+    must be where the upload stands, and advance it.
+    """
+    if offset != upload.offset:
+        raise OffsetConflict(upload.offset)
+    if length > get_upload_chunk_size():
+        raise PayloadTooLarge(
+            f'Chunks are limited to {get_upload_chunk_size()} bytes.')
+    if offset + length > upload.size:
+        raise PayloadTooLarge('The chunk goes past the declared size.')
+
+    name = default_storage.save(
+        CHUNK_PATH.format(upload_id=upload.pk, offset=offset),
+        File(ChunkReader(read_body(stream, length))))
+    if default_storage.size(name) != length:
+        default_storage.delete(name)
+        raise serializers.ValidationError(
+            'The chunk is shorter than its Content-Length.')
+    chunks = upload.chunks + [[name, length]]
+    advanced = AttachmentUpload.objects.filter(
+        pk=upload.pk, offset=offset).update(
+        offset=offset + length, chunks=chunks, updated_at=timezone.now())
+    if not advanced:
+        # Another request stored the same range first.
+        default_storage.delete(name)
+        upload.refresh_from_db()
+        raise OffsetConflict(upload.offset)
+    upload.offset += length
+    upload.chunks = chunks
+    return upload
+
+
+def finalize_upload(upload):
+    """
+    Assemble a complete upload into an attachment and delete it. The upload
+    is claimed by marking it as finalizing, so a concurrent finalize gets
+    409 instead of assembling it again. Claims older than
+    ``TODO_UPLOAD_FINALIZE_LEASE`` seconds are considered abandoned and can
+    be taken over; the request that lost its claim then gets 409.
+    """
+    if upload.offset != upload.size:
+        raise serializers.ValidationError(
+            f'The upload has {upload.offset} of {upload.size} bytes.')
+    now = timezone.now()
+    claimable = (
+        Q(finalizing_at__isnull=True) |
+        Q(finalizing_at__lt=now - timedelta(seconds=get_finalize_lease()))
+    )
+    claimed = AttachmentUpload.objects.filter(claimable, pk=upload.pk).update(
+        finalizing_at=now, updated_at=now)
+    if not claimed:
+        raise FinalizeConflict()
+    ours = AttachmentUpload.objects.filter(pk=upload.pk, finalizing_at=now)
+    try:
+        name, size, digest = store_content(
+            upload.filename, lambda: read_chunks(upload),
+            checksum=upload.checksum)
+    except serializers.ValidationError:
+        # The chunks are corrupt; the client has to start over.
+        upload.delete()
+        raise
+    except Exception:
+        # Storage failed; the client may finalize again.
+        ours.update(finalizing_at=None)
+        raise
+    with transaction.atomic():
+        if not ours.delete()[0]:
+            # The claim outlived its lease and was taken over.
+            raise FinalizeConflict()
+        attachment = TodoAttachment.objects.create(
+            todo=upload.todo, file=name, name=upload.filename, size=size,
+            sha256=digest)
+    return attachment
+
+
+def delete_chunks(upload):
+    for name, _ in upload.chunks:
+        default_storage.delete(name)
+
+
+def purge_uploads():
+    """Delete uploads idle for ``TODO_UPLOAD_EXPIRY_HOURS``; returns how many."""
+    before = timezone.now() - timedelta(hours=get_upload_expiry_hours())
+    return AttachmentUpload.objects.filter(updated_at__lt=before).delete()[0]
@@ -1,55 +1,106 @@
-import redis
 from django.conf import settings
-from django.db import connection
+from django.db import transaction
+from django.db.models import F, Prefetch
+from django.http import StreamingHttpResponse
 from django.utils import timezone
-from django.utils.decorators import method_decorator
-from django.views.decorators.cache import cache_page
-from django.views.decorators.vary import vary_on_cookie
 from django_filters.rest_framework import DjangoFilterBackend
 from drf_spectacular.types import OpenApiTypes
 from drf_spectacular.utils import (OpenApiExample, OpenApiParameter,
                                    extend_schema)
 from rest_framework import mixins, status, viewsets
 from rest_framework.decorators import action
-from rest_framework.filters import OrderingFilter, SearchFilter
-from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import OrderingFilter
+from rest_framework.generics import get_object_or_404
+from rest_framework.parsers import FormParser, MultiPartParser
+from rest_framework.permissions import (SAFE_METHODS, AllowAny,
+                                        IsAuthenticated)
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
 from rest_framework.views import APIView
 
-from .filters import TodoFilter
-from .models import Tag, Todo
-from .serializers import (TagSerializer, TodoAttachmentSerializer,
-                          TodoDetailSerializer, TodoSerializer,
-                          TodoStatusUpdateSerializer)
+from .cache import PrerenderedResponse, get_cached_list, set_cached_list
+from .conditional import (check_preconditions, collection_response,
+                          is_conditional, set_validators, todo_validators)
+from .events import (backlog_messages, event_stream_response, get_broker,
+                     parse_last_event_id)
+from .export import FORMATS, export_lines, get_export_chunk_size
+from .filters import TodoFilter, TodoSearchFilter
+from .health import readiness
+from .imports import import_todos, open_text
+from .models import AttachmentUpload, Tag, Todo, TodoAttachment
+from .pagination import OptionalKeysetPagination, TodoKeysetPagination
+from .renderers import CSVRenderer, EventStreamRenderer, NDJSONRenderer
+from .serializers import (AttachmentUploadSerializer, TagSerializer,
+                          TagUsageSerializer, TodoAttachmentSerializer,
+                          TodoBulkSerializer, TodoDetailSerializer,
+                          TodoImportSerializer, TodoImportUploadSerializer,
+                          TodoListSerializer, TodoReadSerializer,
+                          TodoSerializer, TodoStatusUpdateSerializer,
+                          with_attachment_count)
+from .stats import get_todo_stats, next_overdue_at
+from .sync import sync_changes
 from .throttles import BurstRateThrottle, SustainedRateThrottle
+from .uploads import (OffsetConflict, check_content_length, check_size,
+                      finalize_upload, receive_chunk, save_attachment)
+
+
+class LivenessView(APIView):
+    """Process is up and serving requests; touches no backing service."""
+    permission_classes = [AllowAny]
+    authentication_classes = []
+    throttle_classes = []
+
+    def get(self, request):
+        return Response({'status': 'up'})
 
 
 class HealthCheckView(APIView):
+    """
+    Readiness: database and cache reachability with per-component latency.
+    Responds 503 when a component is down. Results are shared between
+    requests for ``HEALTH_CHECK_CACHE_SECONDS``.
+    """
     permission_classes = [AllowAny]
+    authentication_classes = []
+    throttle_classes = []
 
     def get(self, request):
-        # Test database connection
-        try:
-            connection.ensure_connection()
-            db_status = 'up'
-        except Exception:
-            db_status = 'down'
+        result = readiness.get()
+        return Response(
+            result,
+            status=status.HTTP_200_OK if result['status'] == 'up'
+            else status.HTTP_503_SERVICE_UNAVAILABLE)
 
-        # Test cache connection
-        try:
-            cache = redis.Redis.from_url(
-                settings.CACHES['default']['LOCATION'])
-            cache.ping()
-            cache_status = 'up'
-        except Exception:
-            cache_status = 'down'
 
+class TodoEventsView(APIView):
+    """
+    Change feed of the user's todos (see ``todos.events``), from the event
+    after ``Last-Event-ID`` or the ``last_event_id`` parameter.
+
+    As ``text/event-stream`` the missed events are sent and the response
+    ends; ``EventSource`` reconnects after the advertised retry delay, so
+    clients poll cheaply. With ``TODO_ASYNC_VIEWS`` under ASGI the stream
+    stays open and live events are pushed. As JSON the missed events are
+    listed, with ``reset`` set when the log no longer reaches back that far
+    and the client has to reload its todos.
+    """
+    permission_classes = [IsAuthenticated]
+    renderer_classes = (list(api_settings.DEFAULT_RENDERER_CLASSES) +
+                        [EventStreamRenderer])
+    if settings.DJANGO_SETTINGS_MODULE == 'core.settings.production':
+        throttle_classes = [BurstRateThrottle, SustainedRateThrottle]
+
+    def get(self, request):
+        last_id = parse_last_event_id(request)
+        latest, events = get_broker().since(request.user.pk, last_id)
+        if request.accepted_renderer.format == EventStreamRenderer.format:
+            return event_stream_response(
+                backlog_messages(latest, events, last_id))
         return Response({
-            'status': 'up',
-            'components': {
-                'database': db_status,
-                'cache': cache_status
-            }
+            'last_event_id': latest,
+            'reset': events is None,
+            'events': events or [],
         })
 
 
@@ -57,74 +108,307 @@ class TagViewSet(viewsets.ModelViewSet):
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     permission_classes = [IsAuthenticated]
-    pagination_class = None
+    pagination_class = OptionalKeysetPagination
+    ordering_fields = ['name', 'created_at', 'usage_count', 'last_used_at']
 
     def get_queryset(self):
-        return self.queryset.filter(todos__user=self.request.user).distinct()
+        # The user's rows of the usage index, one per tag, joined to the
+        # tags by primary key.
+        return self.queryset.filter(usages__user=self.request.user).annotate(
+            usage_count=F('usages__count'),
+            last_used_at=F('usages__last_used_at'),
+        ).order_by('pk')
+
+    def get_serializer_class(self):
+        if self.action in ('list', 'retrieve'):
+            return TagUsageSerializer
+        return super().get_serializer_class()
+
+    def list(self, request, *args, **kwargs):
+        list_tags = super().list
+        return collection_response(
+            request, lambda version: list_tags(request, *args, **kwargs))
 
 
 class TodoViewSet(viewsets.ModelViewSet):
     queryset = Todo.objects.all()
     serializer_class = TodoSerializer
     permission_classes = [IsAuthenticated]
-    filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
+    filter_backends = [DjangoFilterBackend, TodoSearchFilter, OrderingFilter]
+    pagination_class = TodoKeysetPagination
     filterset_class = TodoFilter
     search_fields = ['title', 'description']
     ordering_fields = ['priority', 'due_date', 'created_at', 'updated_at']
     if settings.DJANGO_SETTINGS_MODULE == 'core.settings.production':
         throttle_classes = [BurstRateThrottle, SustainedRateThrottle]
 
+    # Rendered by ``TodoReadSerializer`` from ``.values()`` rows.
+    list_actions = ('list', 'completed', 'overdue')
+
     def get_queryset(self):
-        return self.queryset.filter(user=self.request.user).select_related('user').prefetch_related('tags')
+        """
+        The user's todos, loaded for the action's serializer: list actions
+        read just the serialized columns and the attachment count (see
+        ``read_rows``), retrieve prefetches the attachments, and the rest
+        load todos with their owner and tags.
+        """
+        queryset = self.queryset.filter(user=self.request.user)
+        if self.action in self.list_actions:
+            return with_attachment_count(queryset)
+        queryset = queryset.select_related('user').prefetch_related(
+            Prefetch('tags', queryset=Tag.objects.order_by('pk')))
+        if self.action == 'retrieve':
+            queryset = queryset.prefetch_related(Prefetch(
+                'attachments', queryset=TodoAttachment.objects.order_by('pk')))
+        return queryset
 
-    @method_decorator(cache_page(60 * 15))
-    @method_decorator(vary_on_cookie)
     def list(self, request, *args, **kwargs):
-        return super().list(request, *args, **kwargs)
+        return collection_response(request, self.list_response)
+
+    def list_response(self, version):
+        cache_key, content = get_cached_list(self.request, version)
+        if content is not None:
+            return PrerenderedResponse(content)
+        response = self.read_response(
+            self.filter_queryset(self.get_queryset()))
+        return PrerenderedResponse(
+            set_cached_list(cache_key, response.data), response.data)
+
+    def retrieve(self, request, *args, **kwargs):
+        if is_conditional(request):
+            response = self.not_modified()
+            if response is not None:
+                return response
+        return self.todo_response(super().retrieve(request, *args, **kwargs))
+
+    def update(self, request, *args, **kwargs):
+        return self.todo_response(super().update(request, *args, **kwargs))
+
+    def get_object(self):
+        todo = super().get_object()
+        if self.request.method not in SAFE_METHODS:
+            # Optimistic concurrency through If-Match/If-Unmodified-Since.
+            check_preconditions(self.request, *todo_validators(
+                self.request, todo.pk, todo.updated_at))
+        self.todo = todo
+        return todo
+
+    def not_modified(self):
+        """
+        The 304 response for a client whose copy of the todo is current,
+        checked against its ``updated_at`` alone.
+        """
+        queryset = self.filter_queryset(
+            Todo.objects.filter(user=self.request.user))
+        try:
+            row = queryset.filter(pk=self.kwargs['pk']).values_list(
+                'pk', 'updated_at').first()
+        except (TypeError, ValueError):
+            return None
+        if row is None:
+            return None
+        return check_preconditions(
+            self.request, *todo_validators(self.request, *row))
+
+    def todo_response(self, response):
+        """Add the validators of the todo read or written by the request."""
+        return set_validators(response, *todo_validators(
+            self.request, self.todo.pk, self.todo.updated_at))
 
+    def read_response(self, queryset):
+        """
+        List response rendered by ``TodoReadSerializer`` from ``.values()``
+        rows; annotations such as ``search_rank`` are kept for ordering and
+        pagination cursors.
+        """
+        rows = self.read_rows(queryset)
+        page = self.paginate_queryset(rows)
+        serializer = TodoReadSerializer(
+            rows if page is None else page, user=self.request.user)
+        if page is not None:
+            return self.get_paginated_response(serializer.data)
+        return Response(serializer.data)
+
+    def read_rows(self, queryset):
+        return queryset.values(
+            *TodoReadSerializer.VALUE_FIELDS, *queryset.query.annotations)
+
+    def completed_queryset(self):
+        return self.get_queryset().filter(status='completed')
+
+    def overdue_queryset(self):
+        # Listing every priority lets the planner walk the overdue prefix of
+        # each priority group in index order instead of sorting the matches,
+        # and the inlined statuses match the partial open-todo index.
+        return self.get_queryset().filter(
+            due_date__lt=timezone.now(),
+            status__inline_in=Todo.OPEN_STATUSES,
+            priority__inline_in=[value for value, _ in Todo.PRIORITY_CHOICES],
+        )
+
+    @transaction.atomic
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
 
+    @transaction.atomic
+    def perform_update(self, serializer):
+        serializer.save()
+
+    @action(detail=False, methods=['post'], serializer_class=TodoBulkSerializer)
+    def bulk(self, request):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        return Response(serializer.data)
+
     @action(detail=True, methods=['patch'], serializer_class=TodoStatusUpdateSerializer)
     def update_status(self, request, pk=None):
         todo = self.get_object()
         serializer = self.get_serializer(todo, data=request.data, partial=True)
         serializer.is_valid(raise_exception=True)
-        serializer.save()
-        return Response(serializer.data)
+        with transaction.atomic():
+            serializer.save()
+        return self.todo_response(Response(serializer.data))
 
     @action(detail=False, methods=['get'])
     def completed(self, request):
-        completed_todos = self.get_queryset().filter(status='completed')
-        page = self.paginate_queryset(completed_todos)
-        if page is not None:
-            serializer = self.get_serializer(page, many=True)
-            return self.get_paginated_response(serializer.data)
-        serializer = self.get_serializer(completed_todos, many=True)
-        return Response(serializer.data)
+        return collection_response(request, lambda version: (
+            self.read_response(self.completed_queryset())))
 
     @action(detail=False, methods=['get'])
     def overdue(self, request):
-        overdue_todos = self.get_queryset().filter(
-            due_date__lt=timezone.now(),
-            status__in=['pending', 'in_progress']
-        )
-        page = self.paginate_queryset(overdue_todos)
-        if page is not None:
-            serializer = self.get_serializer(page, many=True)
-            return self.get_paginated_response(serializer.data)
-        serializer = self.get_serializer(overdue_todos, many=True)
-        return Response(serializer.data)
+        return collection_response(request, lambda version: (
+            self.read_response(self.overdue_queryset())),
+            lambda: next_overdue_at(request.user.pk))
+
+    @action(detail=False, methods=['get'],
+            renderer_classes=[NDJSONRenderer, CSVRenderer])
+    def export(self, request):
+        """
+        Stream every todo matching the filters, search and ordering as
+        ``?format=ndjson`` (default) or ``?format=csv``.
+        """
+        format = request.accepted_renderer.format
+        content_type, _ = FORMATS[format]
+        response = StreamingHttpResponse(
+            export_lines(self.filter_queryset(self.get_queryset()), format,
+                         chunk_size=get_export_chunk_size()),
+            content_type=f'{content_type}; charset=utf-8')
+        response['Content-Disposition'] = \
+            f'attachment; filename="todos.{format}"'
+        return response
+
+    @action(detail=False, methods=['post'], url_path='import',
+            url_name='import', parser_classes=[MultiPartParser, FormParser],
+            serializer_class=TodoImportUploadSerializer)
+    def import_file(self, request):
+        """
+        Import an uploaded NDJSON or CSV file in chunked transactions; pass
+        ``job`` with the same file to resume an interrupted import.
+        """
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        resumed = 'job' in serializer.validated_data
+        job = import_todos(
+            serializer.save(), open_text(serializer.validated_data['file']))
+        return Response(
+            TodoImportSerializer(job).data,
+            status=status.HTTP_200_OK if resumed else status.HTTP_201_CREATED)
+
+    @action(detail=False, methods=['get'], pagination_class=None,
+            filter_backends=[])
+    def stats(self, request):
+        return Response(get_todo_stats(request.user.pk))
+
+    @action(detail=False, methods=['get'], pagination_class=None,
+            filter_backends=[])
+    def sync(self, request):
+        """
+        Changes since ``?since=<token>`` (everything without it): changed
+        todos, deleted todo ids and removed tag links, and the token of the
+        next sync. Apply ``deleted`` and ``removed_tags``, then ``changed``;
+        repeat while ``has_more``; on ``reset`` replace the local todos.
+        """
+        return Response(
+            sync_changes(request.user, request.query_params.get('since')))
 
     def get_serializer_class(self):
         if self.action == 'retrieve':
             return TodoDetailSerializer
+        if self.action in self.list_actions:
+            return TodoListSerializer
         return super().get_serializer_class()
 
     @action(detail=True, methods=['post'], serializer_class=TodoAttachmentSerializer)
     def upload_attachment(self, request, pk=None):
         todo = self.get_object()
+        check_content_length(request)
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
+        file = serializer.validated_data['file']
+        check_size(file.size)
+        attachment = save_attachment(todo, file.name, file.chunks)
+        return Response(self.get_serializer(attachment).data,
+                        status=status.HTTP_201_CREATED)
+
+    @action(detail=True, methods=['post'], url_path='uploads',
+            url_name='uploads', serializer_class=AttachmentUploadSerializer)
+    def create_upload(self, request, pk=None):
+        """
+        Start a resumable upload of a file of ``size`` bytes whose SHA-256 is
+        ``checksum``; send it with ``PUT`` to the upload, then finalize it.
+        """
+        todo = self.get_object()
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        check_size(serializer.validated_data['size'])
         serializer.save(todo=todo)
-        return Response(serializer.data, status=status.HTTP_201_CREATED)
+        return self.upload_response(
+            serializer.instance, status=status.HTTP_201_CREATED)
+
+    @action(detail=True, methods=['get', 'put'],
+            url_path=r'uploads/(?P<upload_id>[0-9a-f-]{36})',
+            url_name='upload', serializer_class=AttachmentUploadSerializer)
+    def upload(self, request, pk=None, upload_id=None):
+        """
+        ``GET``: the upload, with the offset to continue from. ``PUT``: the
+        next chunk, starting at the ``Upload-Offset`` header; a wrong offset
+        is answered with 409 and the right one.
+        """
+        upload = self.get_upload(upload_id)
+        if request.method == 'GET':
+            return self.upload_response(upload)
+        try:
+            offset = int(request.headers['Upload-Offset'])
+            length = int(request.META['CONTENT_LENGTH'])
+        except (KeyError, ValueError):
+            raise ValidationError(
+                'Upload-Offset and Content-Length headers are required.')
+        try:
+            receive_chunk(upload, offset, length, request.stream)
+        except OffsetConflict as exc:
+            response = self.handle_exception(exc)
+            response['Upload-Offset'] = exc.offset
+            return response
+        return self.upload_response(upload)
+
+    @action(detail=True, methods=['post'],
+            url_path=r'uploads/(?P<upload_id>[0-9a-f-]{36})/finalize',
+            url_name='upload-finalize',
+            serializer_class=TodoAttachmentSerializer)
+    def finalize(self, request, pk=None, upload_id=None):
+        """Verify a complete upload and attach the file to the todo."""
+        attachment = finalize_upload(self.get_upload(upload_id))
+        return Response(self.get_serializer(attachment).data,
+                        status=status.HTTP_201_CREATED)
+
+    def get_upload(self, upload_id):
+        return get_object_or_404(
+            AttachmentUpload.objects.select_related('todo'),
+            pk=upload_id, todo=self.get_object())
+
+    def upload_response(self, upload, **kwargs):
+        response = Response(
+            AttachmentUploadSerializer(upload).data, **kwargs)
+        response['Upload-Offset'] = upload.offset
+        return response